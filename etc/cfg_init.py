@@ -6,11 +6,11 @@ from dimp import ID
 from dimsdk import Station
 from dimsdk.ans import keywords as ans_keywords
 
-from libs.utils import Log
-from libs.common import Storage, Database, KeyStore
+from libs.utils import Log, File, FileWriter
+from libs.common import Storage, FileBackend, SQLiteBackend, Database, KeyStore
 from libs.common import SharedFacebook, AddressNameServer
 
-from etc.config import base_dir
+from etc.config import base_dir, db_backend, db_write_behind, db_fsync
 from etc.config import gsp_conf
 from etc.config import ans_reserved_records
 from etc.config import station_id, assistant_id, archivist_id
@@ -25,6 +25,18 @@ Log.info('======== Initializing Configurations ========')
 """
 Log.info(">>> Local storage directory: %s" % base_dir)
 Storage.root = base_dir
+File.fsync_policy = db_fsync
+if db_write_behind > 0:
+    # write files in background
+    g_file_writer = FileWriter(window=db_write_behind)
+    g_file_writer.start()
+else:
+    g_file_writer = None
+if db_backend == 'sqlite':
+    Log.info(">>> Storage backend: %s" % db_backend)
+    Storage.backend = SQLiteBackend(root=base_dir)
+elif g_file_writer is not None:
+    Storage.backend = FileBackend(writer=g_file_writer)
 g_database = Database()
 
 
@@ -35,6 +47,7 @@ g_database = Database()
     Memory cache for reused passwords (symmetric key)
 """
 g_keystore = KeyStore()
+g_keystore.writer = g_file_writer
 
 
 """
@@ -2,7 +2,7 @@
 
 import os
 
-from libs.utils import Log
+from libs.utils import Log, Tracer
 from libs.common import Storage
 
 etc = os.path.abspath(os.path.dirname(__file__))
@@ -15,6 +15,18 @@ etc = os.path.abspath(os.path.dirname(__file__))
 # Log.LEVEL = Log.DEBUG
 Log.LEVEL = Log.DEVELOP
 # Log.LEVEL = Log.RELEASE
+# Log.set_level(level=Log.DEBUG, tag='libs.server')  # level for module or class
+# from libs.utils import LogWriter
+# Log.writer = LogWriter(path='/var/dim/logs/station.log')  # rotating files instead of stdout
+
+
+"""
+    Message Tracing
+    ~~~~~~~~~~~~~~~
+
+    Sampling messages for latency of each stage in the station (see metrics)
+"""
+Tracer().rate = 0.0  # 0.01 to trace 1% messages, 0 to disable
 
 
 """
@@ -27,10 +39,13 @@ gsp_conf = os.path.join(etc, 'gsp.js')
 
 bind_host = '0.0.0.0'
 bind_port = 9394
+bind_async = False  # True to serve all connections in one event loop, instead of one thread for each
 
 local_host = '127.0.0.1'
 local_port = 9394
 
+metrics_port = 0  # port on local host for scraping metrics ('GET /metrics'), 0 to only dump into "{base_dir}/metrics.txt"
+
 station_id = None  # use the 'ID' value of first record of 'stations' in 'gsp.js' as default
 # station_id = 'gsp-s001@x5Zh9ixt8ECr59XLye1y5WWfaX4fcoaaSC'
 # station_id = 'gsp-s002@wpjUWg1oYDnkHh74tHQFPxii6q9j3ymnyW'
@@ -39,6 +54,26 @@ station_id = None  # use the 'ID' value of first record of 'stations' in 'gsp.js
 # station_id = 'gsp-yjd@wjPLYSyaZ7fe4aNL8DJAvHBNnFcgK76eYq'
 
 
+"""
+    Message Dispatcher
+    ~~~~~~~~~~~~~~~~~~
+
+    Workers for delivering personal messages,
+    messages for the same receiver will always be delivered by the same worker.
+"""
+dispatcher_shards = 4
+
+
+"""
+    Crypto Executor
+    ~~~~~~~~~~~~~~~
+
+    Workers for verifying/signing/decrypting messages out of the session threads
+"""
+crypto_workers = 0         # 0 to run on the session's own thread (default)
+crypto_processes = False   # True to run in worker processes (one core each), False in native threads
+
+
 """
     System Bots
     ~~~~~~~~~~~
@@ -59,6 +94,10 @@ archivist_id = None  # use the first record of 'archivists' in 'gsp.js' as defau
 base_dir = '/data/.dim'
 # base_dir = '/var/dim'
 
+db_backend = 'file'  # 'sqlite' to store all records in "{base_dir}/storage.db"
+db_write_behind = 0  # seconds for coalescing writes to the same file, 0 to write immediately
+db_fsync = 'none'    # 'file' to fsync files before renaming, 'directory' to fsync parent directories too
+
 
 """
     Apple Push Notification service
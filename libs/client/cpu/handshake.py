@@ -38,6 +38,8 @@ from dimp import Command
 from dimsdk import HandshakeCommand
 from dimsdk import CommandProcessor
 
+from ...common import CommonPacker
+
 
 class HandshakeCommandProcessor(CommandProcessor):
 
@@ -49,6 +51,9 @@ class HandshakeCommandProcessor(CommandProcessor):
             return HandshakeCommand.restart(session=cmd.session)
         elif 'DIM!' == message:
             # handshake accepted by station
+            packer = self.messenger.packer
+            if isinstance(packer, CommonPacker):
+                packer.accept_format(name=cmd.get('format'))
             server = self.messenger.server
             server.handshake_success()
 
@@ -43,15 +43,15 @@ from dimsdk import MessengerDelegate, CompletionHandler
 from ...utils import Logging
 from ...network import GateStatus, StarShip
 from ...network import MTPDocker
-from ...common import CommonMessenger, CommonFacebook
+from ...common import CommonMessenger, CommonFacebook, CommonPacker
 from ...common import BaseSession
 
 
 class Session(BaseSession):
 
-    def __init__(self, messenger: CommonMessenger, host: str, port: int):
+    def __init__(self, messenger: CommonMessenger, host: str, port: int, docker_class: type = MTPDocker):
         super().__init__(messenger=messenger, address=(host, port))
-        self.gate.docker = MTPDocker(gate=self.gate)
+        self.gate.docker = docker_class(gate=self.gate)
 
     def setup(self):
         self.active = True
@@ -79,14 +79,17 @@ class Server(Station, MessengerDelegate, Logging):
         ~~~~~~~~~~~~~~
     """
 
-    def __init__(self, identifier: ID, host: str, port: int = 9394):
+    def __init__(self, identifier: ID, host: str, port: int = 9394, docker_class: type = MTPDocker):
         super().__init__(identifier=identifier, host=host, port=port)
         self.__session: Optional[Session] = None
         self.__messenger: Optional[weakref.ReferenceType] = None
+        # protocol for talking to the station
+        self.__docker_class = docker_class
 
     def connect(self) -> Session:
         if self.__session is None:
-            session = Session(messenger=self.messenger, host=self.host, port=self.port)
+            session = Session(messenger=self.messenger, host=self.host, port=self.port,
+                              docker_class=self.__docker_class)
             session.start()
             self.__session = session
         return self.__session
@@ -118,6 +121,10 @@ class Server(Station, MessengerDelegate, Logging):
         env = Envelope.create(sender=user.identifier, receiver=self.identifier)
         assert isinstance(env, Envelope), 'envelope error: %s' % env
         cmd = HandshakeCommand.start(session=session)
+        # offer message formats
+        packer = self.messenger.packer
+        if isinstance(packer, CommonPacker):
+            cmd['formats'] = packer.mtp_formats
         # allow connect server without meta.js
         if self.facebook.public_key_for_encryption(identifier=self.identifier) is None:
             cmd.group = EVERYONE
@@ -35,13 +35,14 @@ from dimsdk import ReceiptCommand
 
 from .protocol import SearchCommand, ReportCommand
 from .cpu import *
-from .database import Storage, Database, MessageBundle
+from .database import Storage, FileBackend, SQLiteBackend, Database, MessageBundle
 
 from .notification import NotificationNames
 from .session import BaseSession, is_broadcast_message
 
 from .ans import AddressNameServer
 
+from .crypto import CryptoExecutor
 from .keystore import KeyStore
 from .facebook import CommonFacebook, SharedFacebook
 from .messenger import CommonMessenger
@@ -123,7 +124,7 @@ __all__ = [
     #
     #   Database module
     #
-    'Storage',
+    'Storage', 'FileBackend', 'SQLiteBackend',
     'Database',
     'MessageBundle',
 
@@ -134,6 +135,7 @@ __all__ = [
     'BaseSession',
     'AddressNameServer',
 
+    'CryptoExecutor',
     'KeyStore', 'CommonFacebook', 'SharedFacebook',
     'CommonMessenger', 'CommonPacker', 'CommonProcessor',
 
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Crypto Executor
+    ~~~~~~~~~~~~~~~
+
+    Offload public-key works (verify/sign/decrypt) from the session threads
+
+        1. not started: run on the caller's thread, as before;
+        2. threads:     run in a native thread pool;
+        3. processes:   run in worker processes, bypassing the GIL.
+
+    The keys are sent to worker processes as dictionaries and parsed only once
+    in each worker (cached by key data).
+"""
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Any, List, Tuple
+
+from dimp import VerifyKey, SignKey, DecryptKey
+from dimp import PublicKey, PrivateKey
+
+from ..utils import Logging, Singleton, MetricsRegistry
+
+
+g_metrics = MetricsRegistry()
+
+g_verify_histogram = g_metrics.histogram(name='dim_crypto_seconds', labels={'op': 'verify'},
+                                         desc='Time spent on public-key works (including waiting for workers)')
+g_sign_histogram = g_metrics.histogram(name='dim_crypto_seconds', labels={'op': 'sign'})
+g_decrypt_histogram = g_metrics.histogram(name='dim_crypto_seconds', labels={'op': 'decrypt'})
+
+
+#
+#   Jobs running in workers
+#
+
+MAX_WORKER_KEYS = 4096  # max keys cached in one worker
+
+g_worker_keys = {}  # (kind, key data) -> key object
+
+
+def _load_key(info: Any, kind: str) -> Any:
+    """ Parse key from dictionary (sent to worker process), or use the key object directly """
+    if not isinstance(info, dict):
+        return info
+    cache_key = (kind, info.get('data'))
+    key = g_worker_keys.get(cache_key)
+    if key is None:
+        if kind == 'public':
+            key = PublicKey.parse(key=info)
+        else:
+            key = PrivateKey.parse(key=info)
+        if len(g_worker_keys) >= MAX_WORKER_KEYS:
+            g_worker_keys.clear()
+        g_worker_keys[cache_key] = key
+    return key
+
+
+def _verify(keys: list, data: bytes, signature: bytes) -> int:
+    """ Return index of the key which verified the signature, -1 on failed """
+    for index, info in enumerate(keys):
+        key = _load_key(info=info, kind='public')
+        if key is not None and key.verify(data=data, signature=signature):
+            return index
+    return -1
+
+
+def _sign(key: Any, data: bytes) -> bytes:
+    key = _load_key(info=key, kind='private')
+    return key.sign(data=data)
+
+
+def _decrypt(keys: list, data: bytes) -> Optional[bytes]:
+    for info in keys:
+        key = _load_key(info=info, kind='private')
+        try:
+            # try decrypting it with each private key
+            plaintext = key.decrypt(data=data)
+            if plaintext is not None:
+                return plaintext
+        except ValueError:
+            # this key not match, try next one
+            continue
+
+
+def _ping() -> bool:
+    return True
+
+
+def _init_worker():
+    """ Load crypto plugins in a new worker process (not forked from the station) """
+    import dimsdk.plugins  # noqa: F401 (register key factories)
+
+
+@Singleton
+class CryptoExecutor(Logging):
+
+    def __init__(self):
+        super().__init__()
+        self.__executor: Optional[Executor] = None
+        self.__processes = False
+        self.__lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.__executor is not None
+
+    def start(self, workers: int, processes: bool = False):
+        """
+        Start worker pool
+
+        :param workers:   count of workers
+        :param processes: True for worker processes, False for native threads
+        """
+        with self.__lock:
+            if self.__executor is not None:
+                return
+            if processes:
+                if threading.active_count() == 1:
+                    # fork all workers now, while no other thread holding any lock,
+                    # so they inherit the loaded crypto plugins
+                    executor = ProcessPoolExecutor(max_workers=workers,
+                                                   mp_context=multiprocessing.get_context('fork'))
+                else:
+                    # forking a process with running threads may deadlock the children
+                    # on inherited locks, start workers from a clean process instead
+                    self.warning('threads running, starting crypto workers with forkserver')
+                    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                   mp_context=multiprocessing.get_context(method))
+                for future in [executor.submit(_ping) for _ in range(workers)]:
+                    future.result()
+            else:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='CryptoWorker')
+            self.__processes = processes
+            self.__executor = executor
+        self.info('crypto executor started: %d %s' % (workers, 'processes' if processes else 'threads'))
+
+    def stop(self):
+        with self.__lock:
+            executor = self.__executor
+            self.__executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __pack(self, key: Any) -> Any:
+        # key objects cannot be shared with other processes, send the dictionaries
+        return key.dictionary if self.__processes else key
+
+    #
+    #   Verify
+    #
+    def verify(self, keys: List[VerifyKey], data: bytes, signature: bytes) -> Optional[VerifyKey]:
+        """
+        Verify signature with keys
+
+        :return: the key which verified the signature, None on failed
+        """
+        return self.verify_batch(jobs=[(keys, data, signature)])[0]
+
+    def verify_batch(self, jobs: List[Tuple[List[VerifyKey], bytes, bytes]]) -> List[Optional[VerifyKey]]:
+        """
+        Verify signatures in parallel
+
+        :param jobs: list of (keys, data, signature)
+        :return: the key which verified each signature, None on failed
+        """
+        start = time.time()
+        executor = self.__executor
+        if executor is None:
+            indexes = [_verify(keys=keys, data=data, signature=signature) for keys, data, signature in jobs]
+        else:
+            futures = [executor.submit(_verify, [self.__pack(key=key) for key in keys], data, signature)
+                       for keys, data, signature in jobs]
+            indexes = []
+            for future in futures:
+                try:
+                    indexes.append(future.result())
+                except Exception as error:
+                    self.error('failed to verify signature: %s' % error)
+                    indexes.append(-1)
+        results = []
+        for (keys, _, _), index in zip(jobs, indexes):
+            results.append(keys[index] if index >= 0 else None)
+        g_verify_histogram.observe(time.time() - start)
+        return results
+
+    #
+    #   Sign
+    #
+    def sign(self, key: SignKey, data: bytes) -> bytes:
+        start = time.time()
+        executor = self.__executor
+        if executor is None:
+            signature = _sign(key=key, data=data)
+        else:
+            signature = executor.submit(_sign, self.__pack(key=key), data).result()
+        g_sign_histogram.observe(time.time() - start)
+        return signature
+
+    #
+    #   Decrypt
+    #
+    def decrypt(self, keys: List[DecryptKey], data: bytes) -> Optional[bytes]:
+        start = time.time()
+        executor = self.__executor
+        if executor is None:
+            plaintext = _decrypt(keys=keys, data=data)
+        else:
+            plaintext = executor.submit(_decrypt, [self.__pack(key=key) for key in keys], data).result()
+        g_decrypt_histogram.observe(time.time() - start)
+        return plaintext
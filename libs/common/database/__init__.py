@@ -39,6 +39,7 @@ from dimsdk import LoginCommand
 
 from ...utils import Singleton
 
+from .backend import StorageBackend, FileBackend, SQLiteBackend
 from .storage import Storage
 from .private_table import PrivateKeyTable
 from .meta_table import MetaTable
@@ -52,6 +53,7 @@ from .login_table import LoginTable
 
 
 __all__ = [
+    'StorageBackend', 'FileBackend', 'SQLiteBackend',
     'Storage',
     # 'MetaTable', 'DocumentTable', 'PrivateKeyTable',
     # 'DeviceTable',
@@ -244,7 +246,7 @@ class Database:
         Reliable message for Receivers
         ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        file path: '.dim/public/{ADDRESS}/messages/*.msg'
+        file path: '.dim/messages.db'
     """
     def message_bundle(self, identifier: ID) -> MessageBundle:
         return self.__message_table.message_bundle(identifier=identifier)
@@ -49,7 +49,7 @@ class AddressNameTable(Storage):
 
     def __load_records(self) -> Dict[str, ID]:
         path = self.__path()
-        self.info('Loading ANS records from: %s' % path)
+        self.info('Loading ANS records from: %s', path)
         dictionary = {}
         text = self.read_text(path=path)
         if text is not None:
@@ -57,7 +57,7 @@ class AddressNameTable(Storage):
             for record in lines:
                 pair = record.split('\t')
                 if len(pair) != 2:
-                    self.error('invalid record: %s' % record)
+                    self.error('invalid record: %s', record)
                     continue
                 k = pair[0]
                 v = pair[1]
@@ -80,7 +80,7 @@ class AddressNameTable(Storage):
             if v is not None:
                 text = text + k + '\t' + v + '\n'
         path = self.__path()
-        self.info('Saving ANS records(%d) into: %s' % (len(keys), path))
+        self.info('Saving ANS records(%d) into: %s', len(keys), path)
         return self.write_text(text=text, path=path)
 
     def save_record(self, name: str, identifier: ID) -> bool:
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2021 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Storage Backends
+    ~~~~~~~~~~~~~~~~
+
+    1. FileBackend   - one file for each record: '.dim/{SECTION}/{ADDRESS}/{NAME}'
+    2. SQLiteBackend - all records in one database file: '.dim/storage.db'
+"""
+
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, List, Tuple
+
+from ...utils import File, TextFile, FileWriter
+
+
+class StorageBackend(ABC):
+    """ Text records located by file paths """
+
+    @abstractmethod
+    def exists(self, path: str) -> bool:
+        raise NotImplemented
+
+    @abstractmethod
+    def read_text(self, path: str) -> Optional[str]:
+        raise NotImplemented
+
+    @abstractmethod
+    def write_text(self, text: str, path: str) -> bool:
+        raise NotImplemented
+
+    @abstractmethod
+    def append_text(self, text: str, path: str) -> bool:
+        raise NotImplemented
+
+    @abstractmethod
+    def remove(self, path: str) -> bool:
+        raise NotImplemented
+
+    @abstractmethod
+    def scan(self, directory: str, name: str) -> List[str]:
+        """
+        Get paths of records named 'name' in all sub-directories
+
+        :param directory: parent directory, e.g.: '.dim/public'
+        :param name:      record name, e.g.: 'profile.js'
+        :return: paths like '.dim/public/{ADDRESS}/profile.js'
+        """
+        raise NotImplemented
+
+    def flush(self):
+        """ Commit pending writes """
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class FileBackend(StorageBackend):
+    """
+        Records in files
+
+        if a writer is given, writes will be coalesced and flushed in background
+    """
+
+    def __init__(self, writer: Optional[FileWriter] = None):
+        super().__init__()
+        self.__writer = writer
+
+    @property
+    def writer(self) -> Optional[FileWriter]:
+        return self.__writer
+
+    def flush(self):
+        writer = self.__writer
+        if writer is not None:
+            writer.flush()
+
+    def exists(self, path: str) -> bool:
+        writer = self.__writer
+        if writer is not None and writer.read(path=path) is not None:
+            return True
+        return os.path.exists(path)
+
+    def read_text(self, path: str) -> Optional[str]:
+        writer = self.__writer
+        if writer is not None:
+            text = writer.read(path=path)
+            if text is not None:
+                return text
+        return TextFile(path=path).read()
+
+    def write_text(self, text: str, path: str) -> bool:
+        writer = self.__writer
+        if writer is not None:
+            return writer.write(data=text, path=path)
+        return TextFile(path=path).write(text=text)
+
+    def append_text(self, text: str, path: str) -> bool:
+        writer = self.__writer
+        if writer is not None:
+            # write the pending data before appending
+            writer.flush(path=path)
+        return TextFile(path=path).append(text=text)
+
+    def remove(self, path: str) -> bool:
+        writer = self.__writer
+        cancelled = writer is not None and writer.cancel(path=path)
+        return File(path=path).remove() or cancelled
+
+    def scan(self, directory: str, name: str) -> List[str]:
+        # write pending files before listing
+        self.flush()
+        paths = []
+        if os.path.isdir(directory):
+            for item in os.listdir(directory):
+                path = os.path.join(directory, item, name)
+                if os.path.isfile(path):
+                    paths.append(path)
+        return paths
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    path     TEXT PRIMARY KEY,
+    section  TEXT NOT NULL,
+    address  TEXT NOT NULL,
+    name     TEXT NOT NULL,
+    data     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_address ON records (address);
+CREATE INDEX IF NOT EXISTS records_section_name ON records (section, name);
+'''
+
+SQL_EXISTS = 'SELECT 1 FROM records WHERE path = ?'
+SQL_SELECT = 'SELECT data FROM records WHERE path = ?'
+SQL_INSERT = 'INSERT OR REPLACE INTO records (path, section, address, name, data) VALUES (?, ?, ?, ?, ?)'
+SQL_APPEND = 'INSERT INTO records (path, section, address, name, data) VALUES (?, ?, ?, ?, ?)' \
+             ' ON CONFLICT (path) DO UPDATE SET data = data || excluded.data'
+SQL_DELETE = 'DELETE FROM records WHERE path = ?'
+SQL_SCAN = 'SELECT path FROM records WHERE section = ? AND name = ?'
+SQL_ALL = 'SELECT path, data FROM records ORDER BY path'
+
+
+class SQLiteBackend(StorageBackend):
+    """
+        Records in one SQLite database (WAL mode)
+
+            1. keyed by the path relative to the data directory,
+               paths out of the data directory are still stored as files;
+            2. indexed by address, and by (section, name) for scanning;
+            3. writes are committed in batches, by count or by time.
+    """
+
+    BATCH_SIZE = 64         # commit after these writes
+    BATCH_INTERVAL = 0.5    # commit in half a second after the first pending write
+
+    def __init__(self, root: str, path: Optional[str] = None):
+        super().__init__()
+        if path is None:
+            path = os.path.join(root, 'storage.db')
+        self.__root = root
+        self.__path = path
+        self.__files = FileBackend()
+        self.__db: Optional[sqlite3.Connection] = None
+        self.__pending = 0
+        self.__timer: Optional[threading.Timer] = None
+        self.__lock = threading.RLock()
+
+    @property
+    def root(self) -> str:
+        return self.__root
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__db is None:
+            File.make_dirs(directory=os.path.dirname(self.__path))
+            # the sqlite3 module caches prepared statements for the SQL strings above
+            db = sqlite3.connect(self.__path, check_same_thread=False, isolation_level=None, cached_statements=32)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self.__db = db
+        return self.__db
+
+    def __key(self, path: str) -> Optional[Tuple[str, str, str, str]]:
+        """ Split path into (path, section, address, name) relative to root """
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(self.__root))
+        if rel.startswith(os.pardir) or os.path.isabs(rel):
+            # out of the data directory
+            return None
+        parts = rel.split(os.sep)
+        if len(parts) == 1:
+            return rel, '', '', rel
+        return '/'.join(parts), parts[0], '/'.join(parts[1:-1]), parts[-1]
+
+    def __write(self, sql: str, params: tuple):
+        with self.__lock:
+            db = self.__connect()
+            if self.__pending == 0:
+                db.execute('BEGIN')
+            db.execute(sql, params)
+            self.__pending += 1
+            if self.__pending >= self.BATCH_SIZE:
+                self.__commit()
+            elif self.__timer is None:
+                timer = threading.Timer(self.BATCH_INTERVAL, self.flush)
+                timer.daemon = True
+                timer.start()
+                self.__timer = timer
+
+    def __commit(self):
+        timer = self.__timer
+        if timer is not None:
+            self.__timer = None
+            timer.cancel()
+        if self.__pending > 0:
+            self.__pending = 0
+            self.__db.execute('COMMIT')
+
+    def flush(self):
+        with self.__lock:
+            self.__commit()
+
+    def close(self):
+        with self.__lock:
+            self.__commit()
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+
+    def exists(self, path: str) -> bool:
+        key = self.__key(path=path)
+        if key is None:
+            return self.__files.exists(path=path)
+        with self.__lock:
+            return self.__connect().execute(SQL_EXISTS, (key[0],)).fetchone() is not None
+
+    def read_text(self, path: str) -> Optional[str]:
+        key = self.__key(path=path)
+        if key is None:
+            return self.__files.read_text(path=path)
+        with self.__lock:
+            row = self.__connect().execute(SQL_SELECT, (key[0],)).fetchone()
+        if row is not None:
+            return row[0]
+
+    def write_text(self, text: str, path: str) -> bool:
+        key = self.__key(path=path)
+        if key is None:
+            return self.__files.write_text(text=text, path=path)
+        self.__write(SQL_INSERT, key + (text,))
+        return True
+
+    def append_text(self, text: str, path: str) -> bool:
+        key = self.__key(path=path)
+        if key is None:
+            return self.__files.append_text(text=text, path=path)
+        self.__write(SQL_APPEND, key + (text,))
+        return True
+
+    def remove(self, path: str) -> bool:
+        key = self.__key(path=path)
+        if key is None:
+            return self.__files.remove(path=path)
+        with self.__lock:
+            if not self.exists(path=path):
+                return False
+            self.__write(SQL_DELETE, (key[0],))
+            return True
+
+    def scan(self, directory: str, name: str) -> List[str]:
+        key = self.__key(path=os.path.join(directory, name))
+        if key is None:
+            return self.__files.scan(directory=directory, name=name)
+        with self.__lock:
+            rows = self.__connect().execute(SQL_SCAN, (key[1], name)).fetchall()
+        return [os.path.join(self.__root, *row[0].split('/')) for row in rows]
+
+    def records(self) -> List[Tuple[str, str]]:
+        """ Get all records as (path, text) for exporting """
+        with self.__lock:
+            rows = self.__connect().execute(SQL_ALL).fetchall()
+        return [(os.path.join(self.__root, *row[0].split('/')), row[1]) for row in rows]
@@ -24,10 +24,12 @@
 # ==============================================================================
 
 import os
-from typing import Optional, List, Dict
+from typing import Optional, List
 
 from dimp import ID, Document
 
+from ...utils import CacheManager
+
 from .storage import Storage
 
 
@@ -36,8 +38,7 @@ class DocumentTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__caches: Dict[ID, Document] = {}
-        self.__empty = {'desc': 'just to avoid loading non-exists file again'}
+        self.__caches = CacheManager().pool(name='document')  # ID -> Document
 
     """
         Profile for Entities (User/Group)
@@ -52,28 +53,28 @@ class DocumentTable(Storage):
     def save_document(self, document: Document) -> bool:
         if not document.valid:
             # raise ValueError('document not valid: %s' % profile)
-            self.error('document not valid: %s' % document)
+            self.error('document not valid: %s', document)
             return False
         identifier = document.identifier
         # 0. check old record
         old = self.document(identifier=identifier)
         if old is not None and old.time > document.time > 0:
-            self.warning('document expired, drop it: %s' % document)
+            self.warning('document expired, drop it: %s', document)
             return False
         # 1. store into memory cache
-        self.__caches[identifier] = document
+        self.__caches.update(key=identifier, value=document)
         # 2. save into local storage
         path = self.__path(identifier=identifier)
-        self.info('Saving document into: %s' % path)
+        self.info('Saving document into: %s', path)
         return self.write_json(container=document.dictionary, path=path)
 
     def document(self, identifier: ID, doc_type: Optional[str] = '*') -> Optional[Document]:
         # 1. try from memory cache
-        info = self.__caches.get(identifier)
-        if info is None:
+        info, holder = self.__caches.fetch(key=identifier)
+        if holder is None:
             # 2. try from local storage
             path = self.__path(identifier=identifier)
-            self.info('Loading document from: %s' % path)
+            self.info('Loading document from: %s', path)
             dictionary = self.read_json(path=path)
             if dictionary is not None:
                 data = dictionary.get('data')
@@ -82,26 +83,22 @@ class DocumentTable(Storage):
                     data = dictionary.get('profile')
                 signature = dictionary.get('signature')
                 info = Document.create(doc_type=doc_type, identifier=identifier, data=data, signature=signature)
-            if info is None:
-                # 2.1. place an empty meta for cache
-                info = self.__empty
-            # 3. store into memory cache
-            self.__caches[identifier] = info
-        if info is not self.__empty:
+            # 3. store into memory cache (place an empty document to avoid loading again)
+            self.__caches.update(key=identifier, value=info)
+        if info is not None:
             return info
-        self.info('document not found: %s' % identifier)
+        self.info('document not found: %s', identifier)
 
     def scan_documents(self) -> List[Document]:
         """ Scan all documents from data directory """
         documents = []
         directory = os.path.join(self.root, 'public')
-        array = os.listdir(directory)
-        for item in array:
-            path = os.path.join(directory, item, 'profile.js')
-            self.info('Loading document from: %s' % path)
+        array = self.scan(directory=directory, name='profile.js')
+        for path in array:
+            self.info('Loading document from: %s', path)
             dictionary = self.read_json(path=path)
             if dictionary is None:
-                self.error('document not exists: %s' % item)
+                self.error('document not exists: %s', path)
                 continue
             identifier = ID.parse(identifier=dictionary.get('ID'))
             doc_type = dictionary.get('type')
@@ -114,9 +111,9 @@ class DocumentTable(Storage):
             signature = dictionary.get('signature')
             doc = Document.create(doc_type=doc_type, identifier=identifier, data=data, signature=signature)
             if doc is not None:
-                self.__caches[identifier] = doc
+                self.__caches.update(key=identifier, value=doc)
                 documents.append(doc)
-        self.debug('Scanned %d documents(s) from %s' % (len(documents), directory))
+        self.debug('Scanned %d documents(s) from %s', len(documents), directory)
         return documents
 
 
@@ -125,7 +122,7 @@ class DeviceTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__caches: Dict[ID, dict] = {}
+        self.__caches = CacheManager().pool(name='device')  # ID -> dict
 
     """
         Device Tokens for APNS
@@ -138,25 +135,26 @@ class DeviceTable(Storage):
 
     def save_device(self, device: dict, identifier: ID) -> bool:
         # 1. store info memory cache
-        self.__caches[identifier] = device
+        self.__caches.update(key=identifier, value=device)
         # 2. save into local storage
         path = self.__path(identifier=identifier)
-        self.info('Saving device info into: %s' % path)
+        self.info('Saving device info into: %s', path)
         return self.write_json(container=device, path=path)
 
     def device(self, identifier: ID) -> Optional[dict]:
         # 1. try from memory cache
-        info = self.__caches.get(identifier)
-        if info is None:
+        info, holder = self.__caches.fetch(key=identifier)
+        if holder is None:
             # 2. try from local storage
             path = self.__path(identifier=identifier)
-            self.info('Loading device from: %s' % path)
+            self.info('Loading device from: %s', path)
             info = self.read_json(path=path)
             if info is None:
-                self.info('device not found: %s' % identifier)
-                info = {}
+                self.info('device not found: %s', identifier)
             # 3. store into memory cache
-            self.__caches[identifier] = info
+            self.__caches.update(key=identifier, value=info)
+        if info is None:
+            return {}
         return info
 
     def save_device_token(self, token: str, identifier: ID) -> bool:
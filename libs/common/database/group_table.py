@@ -24,10 +24,12 @@
 # ==============================================================================
 
 import os
-from typing import List, Dict
+from typing import List
 
 from dimp import ID
 
+from ...utils import CacheManager
+
 from .storage import Storage
 
 
@@ -36,7 +38,7 @@ class GroupTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__members: Dict[ID, List[ID]] = {}
+        self.__members = CacheManager().pool(name='members')  # ID -> List[ID]
 
     """
         Group members
@@ -49,27 +51,27 @@ class GroupTable(Storage):
 
     def members(self, group: ID) -> List[ID]:
         # 1. try from memory cache
-        array = self.__members.get(group)
-        if array is None:
+        array, holder = self.__members.fetch(key=group)
+        if holder is None:
             # 2. try from local storage
             path = self.__members_path(identifier=group)
-            self.info('Loading members from: %s' % path)
+            self.info('Loading members from: %s', path)
             text = self.read_text(path=path)
-            if text is None:
-                array = []
-            else:
+            if text is not None:
                 array = ID.convert(members=text.splitlines())
             # 3. store into memory cache
-            self.__members[group] = array
+            self.__members.update(key=group, value=array)
+        if array is None:
+            return []
         return array
 
     def save_members(self, members: List[ID], group: ID) -> bool:
         assert len(members) > 0, 'group members should not be empty: %s' % group
         # 1. store into memory cache
-        self.__members[group] = members
+        self.__members.update(key=group, value=members)
         # 2. store into local storage
         path = self.__members_path(identifier=group)
-        self.info('Saving members into: %s' % path)
+        self.info('Saving members into: %s', path)
         members = ID.revert(members=members)
         text = '\n'.join(members)
         return self.write_text(text=text, path=path)
@@ -25,11 +25,13 @@
 
 import os
 import time
-from typing import Optional, Dict
+from typing import Optional
 
 from dimp import NetworkType, ID, ReliableMessage
 from dimsdk import LoginCommand
 
+from ...utils import CacheManager
+
 from .storage import Storage
 
 
@@ -38,9 +40,7 @@ class LoginTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__commands: Dict[ID, LoginCommand] = {}
-        self.__messages: Dict[ID, ReliableMessage] = {}
-        self.__empty = {'desc': 'just to avoid loading non-exists file again'}
+        self.__caches = CacheManager().pool(name='login')  # ID -> (LoginCommand, ReliableMessage)
 
     """
         Login info for Users
@@ -54,10 +54,10 @@ class LoginTable(Storage):
     def save_login(self, cmd: LoginCommand, msg: ReliableMessage) -> bool:
         sender = msg.sender
         if cmd.identifier != sender:
-            self.error('sender error: %s, %s' % (sender, cmd))
+            self.error('sender error: %s, %s', sender, cmd)
             return False
         elif sender.type == NetworkType.STATION:
-            self.error('a station should not "login" to another station: %s' % cmd)
+            self.error('a station should not "login" to another station: %s', cmd)
             return False
         # check last login time
         old = self.login_command(identifier=sender)
@@ -69,14 +69,13 @@ class LoginTable(Storage):
             if new_time is None:
                 new_time = 0
             if new_time <= old_time and old_time > 0:
-                self.error('expired command, drop it: %s' % cmd)
+                self.error('expired command, drop it: %s', cmd)
                 return False
         # store into memory cache
-        self.__commands[sender] = cmd
-        self.__messages[sender] = msg
+        self.__caches.update(key=sender, value=(cmd, msg))
         # store into local storage
         path = self.__path(identifier=sender)
-        self.info('Saving login into: %s' % path)
+        self.info('Saving login into: %s', path)
         dictionary = {'cmd': cmd.dictionary, 'msg': msg.dictionary}
         return self.write_json(container=dictionary, path=path)
 
@@ -90,38 +89,34 @@ class LoginTable(Storage):
 
     def login_info(self, identifier: ID) -> (Optional[LoginCommand], Optional[ReliableMessage]):
         # 1. try from memory cache
-        cmd = self.__commands.get(identifier)
-        msg = self.__messages.get(identifier)
-        if cmd is None or msg is None:
+        info, holder = self.__caches.fetch(key=identifier)
+        if holder is None:
             # 2. try from local storage
-            cmd, msg = self.__load_login(identifier=identifier)
-            if cmd is None:
-                cmd = self.__empty
-            if msg is None:
-                msg = self.__empty
+            info = self.__load_login(identifier=identifier)
+            if info[0] is None and info[1] is None:
+                # 2.1. place an empty info to avoid loading again
+                info = None
             # 3. store into memory cache
-            self.__commands[identifier] = cmd
-            self.__messages[identifier] = msg
-        if cmd is self.__empty:
-            cmd = None
-        else:
+            self.__caches.update(key=identifier, value=info)
+        if info is None:
+            return None, None
+        cmd, msg = info
+        if cmd is not None:
             login_time = cmd.time
             if login_time is None:
                 login_time = 0
             days = (time.time() - login_time) / 3600 / 24
             if days > 7:
-                self.error('login too long ago: %d days, %s' % (days, cmd.identifier))
+                self.error('login too long ago: %d days, %s', days, cmd.identifier)
                 return None, None
-        if msg is self.__empty:
-            msg = None
         return cmd, msg
 
     def __load_login(self, identifier: ID) -> (Optional[LoginCommand], Optional[ReliableMessage]):
         if identifier.type == NetworkType.STATION:
-            self.error('a station would not "login" to another station: %s' % identifier)
+            self.error('a station would not "login" to another station: %s', identifier)
             return None, None
         path = self.__path(identifier=identifier)
-        self.info('Loading login from: %s' % path)
+        self.info('Loading login from: %s', path)
         dictionary = self.read_json(path=path)
         if dictionary is None:
             return None, None
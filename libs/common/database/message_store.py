@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2021 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Message Store
+    ~~~~~~~~~~~~~
+
+    SQLite database (WAL mode) for messages waiting to be delivered
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Optional, List, Tuple
+
+from ...utils import File
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    receiver  TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    time      REAL NOT NULL,
+    data      TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_receiver_signature ON messages (receiver, signature);
+CREATE INDEX IF NOT EXISTS messages_time ON messages (time);
+'''
+
+
+class MessageStore:
+    """
+        Offline messages, indexed by (receiver, signature)
+
+            1. duplicate checking by the unique index;
+            2. fetching with cursor (row ID) for each receiver;
+            3. removing expired messages in one statement.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.__path = path
+        self.__db: Optional[sqlite3.Connection] = None
+        self.__lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__db is None:
+            File.make_dirs(directory=os.path.dirname(self.__path))
+            db = sqlite3.connect(self.__path, check_same_thread=False, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self.__db = db
+        return self.__db
+
+    def close(self):
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+
+    def insert(self, receiver: str, signature: str, msg_time: float, data: str) -> bool:
+        """ Insert a message, return False when duplicated """
+        with self.__lock:
+            cursor = self.__connect().execute('INSERT OR IGNORE INTO messages (receiver, signature, time, data)'
+                                              ' VALUES (?, ?, ?, ?)', (receiver, signature, msg_time, data))
+            return cursor.rowcount > 0
+
+    def insert_many(self, rows: List[Tuple[str, str, float, str]]) -> int:
+        """ Insert messages (receiver, signature, time, data) in one transaction """
+        with self.__lock:
+            db = self.__connect()
+            before = db.total_changes
+            db.execute('BEGIN')
+            try:
+                db.executemany('INSERT OR IGNORE INTO messages (receiver, signature, time, data)'
+                               ' VALUES (?, ?, ?, ?)', rows)
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+            return db.total_changes - before
+
+    def exists(self, receiver: str, signature: str) -> bool:
+        with self.__lock:
+            cursor = self.__connect().execute('SELECT 1 FROM messages WHERE receiver = ? AND signature = ?',
+                                              (receiver, signature))
+            return cursor.fetchone() is not None
+
+    def fetch(self, receiver: str, start: int = 0, expires: float = 0, limit: int = 1024) -> List[Tuple[int, str]]:
+        """
+        Get messages for receiver after the cursor
+
+        :param receiver: receiver address
+        :param start:    cursor (row ID) of the last message fetched
+        :param expires:  ignore messages before this time
+        :param limit:    max messages to fetch
+        :return: list of (row ID, message data)
+        """
+        with self.__lock:
+            cursor = self.__connect().execute('SELECT id, data FROM messages'
+                                              ' WHERE receiver = ? AND id > ? AND time >= ?'
+                                              ' ORDER BY id LIMIT ?', (receiver, start, expires, limit))
+            return cursor.fetchall()
+
+    def count(self, receiver: str) -> int:
+        with self.__lock:
+            cursor = self.__connect().execute('SELECT COUNT(*) FROM messages WHERE receiver = ?', (receiver,))
+            return cursor.fetchone()[0]
+
+    def remove(self, receiver: str, signature: str) -> bool:
+        """ Remove the message acknowledged """
+        with self.__lock:
+            cursor = self.__connect().execute('DELETE FROM messages WHERE receiver = ? AND signature = ?',
+                                              (receiver, signature))
+            return cursor.rowcount > 0
+
+    def remove_expired(self, expires: float) -> int:
+        """ Remove all messages before the time """
+        with self.__lock:
+            cursor = self.__connect().execute('DELETE FROM messages WHERE time < ?', (expires,))
+            return cursor.rowcount
@@ -27,13 +27,19 @@ import os
 import threading
 import time
 import weakref
-from typing import List, Optional
+from collections import OrderedDict
+from typing import List, Dict, Optional
 
 from dimp import json_encode, json_decode, utf8_encode, utf8_decode
 from dimp import ID, NetworkType
 from dimp import ReliableMessage
 
+from ...utils import NotificationCenter, MetricsRegistry, Tracer
+
+from ..notification import NotificationNames
+
 from .storage import Storage
+from .message_store import MessageStore
 
 
 def is_broadcast_message(msg: ReliableMessage):
@@ -43,77 +49,95 @@ def is_broadcast_message(msg: ReliableMessage):
     return group is not None and group.is_broadcast
 
 
+g_metrics = MetricsRegistry()
+g_tracer = Tracer()
+g_messages_saved = g_metrics.counter(name='dim_messages_stored_total', labels={'result': 'saved'},
+                                     desc='Messages stored for offline receivers')
+g_messages_duplicated = g_metrics.counter(name='dim_messages_stored_total', labels={'result': 'duplicated'})
+g_messages_ignored = g_metrics.counter(name='dim_messages_stored_total', labels={'result': 'ignored'})
+g_messages_loaded = g_metrics.counter(name='dim_messages_loaded_total', desc='Stored messages loaded for receivers')
+g_save_histogram = g_metrics.histogram(name='dim_message_save_seconds', desc='Time spent on storing one message')
+
+
 class MessageBundle:
 
     def __init__(self, db, identifier: ID):
         super().__init__()
         self.__db = weakref.ref(db)
         self.__identifier = identifier
-        self.__messages: List[ReliableMessage] = []
+        self.__messages: Dict[str, ReliableMessage] = OrderedDict()  # signature -> message
+        self.__cursor = 0  # row ID of the last message loaded from the store
+        self.__dirty = True  # new messages saved into the store after last loaded
         self.__lock = threading.Lock()
 
-    def __del__(self):
-        self.__flush()
-
-    def __flush(self):
-        db = self.__db()
-        assert isinstance(db, MessageTable), 'db error: %s' % db
-        while True:
-            msg = self.pop()
-            if msg is None:
-                break
-            db.save_message(msg=msg)
+    @property
+    def dirty(self) -> bool:
+        return self.__dirty
 
     def pop(self) -> Optional[ReliableMessage]:
+        """ Take a message out, and remove it from the store """
         with self.__lock:
             if len(self.__messages) > 0:
-                return self.__messages.pop(0)
+                _, msg = self.__messages.popitem(last=False)
+                db = self.__db()
+                assert isinstance(db, MessageTable), 'db error: %s' % db
+                db.remove_message(msg=msg)
+                return msg
 
     def add(self, msg: ReliableMessage) -> bool:
-        with self.__lock:
-            # check duplicated
-            signature = msg.get('signature')
-            for item in self.__messages:
-                if item.get('signature') == signature:
-                    return False
-            # append
-            self.__messages.append(msg)
+        """ Save a message into the store, return False when duplicated """
+        db = self.__db()
+        assert isinstance(db, MessageTable), 'db error: %s' % db
+        if db.save_message(msg=msg):
+            self.__dirty = True
             return True
+        return False
 
     def erase(self, msg: ReliableMessage) -> bool:
+        """ Acknowledge a message delivered """
         with self.__lock:
-            signature = msg.get('signature')
-            for item in self.__messages:
-                if item.get('signature') == signature:
-                    self.__messages.remove(item)
-                    return True
+            self.__messages.pop(msg.get('signature'), None)
+            db = self.__db()
+            assert isinstance(db, MessageTable), 'db error: %s' % db
+            return db.remove_message(msg=msg)
+
+    def all(self, force: bool = False) -> List[ReliableMessage]:
+        """
+        Get all messages for the receiver
 
-    def all(self) -> List[ReliableMessage]:
+        :param force: True to rescan the whole store, not only the messages after the cursor
+        :return: messages
+        """
         with self.__lock:
+            if not (self.__dirty or force):
+                # nothing new in the store
+                return list(self.__messages.values())
+            self.__dirty = False
             db = self.__db()
             assert isinstance(db, MessageTable), 'db error: %s' % db
-            messages = db.fetch_all_messages(receiver=self.__identifier)
+            start = 0 if force else self.__cursor
+            cursor, messages = db.fetch_messages(receiver=self.__identifier, start=start)
+            self.__cursor = max(cursor, self.__cursor)
             for msg in messages:
                 # check duplicated
-                exists = False
                 signature = msg.get('signature')
-                for item in self.__messages:
-                    if item.get('signature') == signature:
-                        exists = True
-                        break
-                if not exists:
+                if signature not in self.__messages:
                     # append
-                    self.__messages.append(msg)
-            return self.__messages.copy()
+                    self.__messages[signature] = msg
+            return list(self.__messages.values())
 
 
 class MessageTable(Storage):
 
     MESSAGE_EXPIRES = 3600 * 24 * 7  # only relay cached messages within 7 days
+    COMPACT_INTERVAL = 3600          # remove expired messages every hour
+    FETCH_LIMIT = 1024               # messages loaded from the store in one page
 
     def __init__(self):
         super().__init__()
         self.__bundles = weakref.WeakValueDictionary()  # ID -> MessageBundle
+        self.__store: Optional[MessageStore] = None
+        self.__compact_time = 0
         self.__lock = threading.Lock()
 
     def message_bundle(self, identifier: ID) -> MessageBundle:
@@ -125,8 +149,16 @@ class MessageTable(Storage):
             return bundle
 
     def store_message(self, msg: ReliableMessage) -> bool:
-        bundle = self.message_bundle(identifier=msg.receiver)
-        return bundle.add(msg=msg)
+        receiver = msg.receiver
+        bundle = self.message_bundle(identifier=receiver)
+        if bundle.add(msg=msg):
+            g_tracer.end(msg=msg, stage='cached')
+            # wake up the sessions of this receiver
+            NotificationCenter().post(name=NotificationNames.MESSAGE_CACHED, sender=self, info={
+                'ID': receiver,
+            })
+            return True
+        return False
 
     def erase_message(self, msg: ReliableMessage) -> bool:
         bundle = self.message_bundle(identifier=msg.receiver)
@@ -136,99 +168,88 @@ class MessageTable(Storage):
         Reliable message for Receivers
         ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        file path: '.dim/dkd/{ADDRESS}/messages/*.msg'
-        file path: '.dim/public/{ADDRESS}/messages/*.msg'
+        file path: '.dim/messages.db'
     """
-    def __message_directory(self, identifier: ID) -> str:
-        return os.path.join(self.root, 'public', str(identifier.address), 'messages')
-
-    def __message_path(self, msg: ReliableMessage) -> str:
-        # message filename
-        timestamp = msg.time
-        filename = time.strftime("%Y%m%d", time.localtime(timestamp))
-        filename = filename + '.msg'
-        # message directory
-        directory = self.__message_directory(msg.receiver)
-        # message file path
-        return os.path.join(directory, filename)
-
-    def __load_messages(self, path: str, remove: bool) -> List[ReliableMessage]:
-        messages = []
-        text = self.read_text(path=path)
-        if text is None:
-            lines = []
-        else:
-            if remove:
-                self.remove(path=path)
-            lines = text.splitlines()
-        self.debug('read %d line(s) from %s' % (len(lines), path))
-        expires = time.time() - self.MESSAGE_EXPIRES
-        for line in lines:
-            msg = line.strip()
-            if len(msg) == 0:
-                self.warning('skip empty line')
-                continue
-            try:
-                msg = json_decode(data=utf8_encode(string=msg))
-                msg = ReliableMessage.parse(msg=msg)
-            except Exception as error:
-                self.error('message package error %s, %s' % (error, line))
-                continue
-            if isinstance(msg, ReliableMessage):
-                if msg.time < expires:
-                    delta = time.time() - msg.time
-                    days = delta / 3600 / 24
-                    self.warning('drop expired msg: %d days ago, %s -> %s' % (days, msg.sender, msg.receiver))
-                else:
-                    messages.append(msg)
-        return messages
-
-    def __message_exists(self, msg: ReliableMessage, path: str) -> bool:
-        if not self.exists(path=path):
-            return False
-        # check whether message duplicated
-        messages = self.__load_messages(path=path, remove=False)
-        for item in messages:
-            if item.get('signature') == msg.get('signature'):
-                # only same messages will have same signature
-                return True
+    @property
+    def store(self) -> MessageStore:
+        with self.__lock:
+            if self.__store is None:
+                # create when first used, after 'Storage.root' configured
+                self.__store = MessageStore(path=os.path.join(self.root, 'messages.db'))
+            return self.__store
+
+    def __compact(self):
+        now = time.time()
+        if now < self.__compact_time:
+            return
+        self.__compact_time = now + self.COMPACT_INTERVAL
+        count = self.store.remove_expired(expires=now - self.MESSAGE_EXPIRES)
+        if count > 0:
+            self.warning('removed %d expired message(s)', count)
 
     def save_message(self, msg: ReliableMessage) -> bool:
         sender = msg.sender
         receiver = msg.receiver
         if is_broadcast_message(msg=msg):
-            self.info('ignore broadcast msg: %s -> %s' % (sender, receiver))
+            self.info('ignore broadcast msg: %s -> %s', sender, receiver)
+            g_messages_ignored.inc()
             return False
         if sender.type == NetworkType.STATION or receiver.type == NetworkType.STATION:
-            self.info('ignore station msg: %s -> %s' % (sender, receiver))
-            return False
-        path = self.__message_path(msg=msg)
-        if self.__message_exists(msg=msg, path=path):
-            self.error('msg duplicated: %s -> %s\n traces: %s\n signature: %s'
-                       % (sender, receiver, msg.get('traces'), msg.get('signature')))
+            self.info('ignore station msg: %s -> %s', sender, receiver)
+            g_messages_ignored.inc()
             return False
-        self.debug('appending msg into: %s' % path)
+        start = time.time()
+        self.__compact()
         # message data
         data = utf8_decode(data=json_encode(msg.dictionary))
-        data = data + '\n'
-        return self.append_text(text=data, path=path)
+        msg_time = msg.time
+        if msg_time is None:
+            msg_time = time.time()
+        ok = self.store.insert(receiver=str(receiver.address), signature=msg.get('signature'),
+                               msg_time=msg_time, data=data)
+        g_save_histogram.observe(time.time() - start)
+        if not ok:
+            g_messages_duplicated.inc()
+            self.error('msg duplicated: %s -> %s\n traces: %s\n signature: %s',
+                       sender, receiver, msg.get('traces'), msg.get('signature'))
+            return False
+        self.debug('msg saved: %s -> %s', sender, receiver)
+        g_messages_saved.inc()
+        return True
+
+    def remove_message(self, msg: ReliableMessage) -> bool:
+        return self.store.remove(receiver=str(msg.receiver.address), signature=msg.get('signature'))
+
+    def fetch_messages(self, receiver: ID, start: int = 0) -> (int, List[ReliableMessage]):
+        """
+        Load messages for receiver after the cursor
+
+        :param receiver: receiver ID
+        :param start:    row ID of the last message loaded
+        :return: (new cursor, messages)
+        """
+        messages = []
+        expires = time.time() - self.MESSAGE_EXPIRES
+        while True:
+            rows = self.store.fetch(receiver=str(receiver.address), start=start, expires=expires,
+                                    limit=self.FETCH_LIMIT)
+            for row_id, data in rows:
+                start = row_id
+                try:
+                    msg = json_decode(data=utf8_encode(string=data))
+                    msg = ReliableMessage.parse(msg=msg)
+                except Exception as error:
+                    self.error('message package error %s, %s', error, data)
+                    continue
+                if isinstance(msg, ReliableMessage):
+                    messages.append(msg)
+            if len(rows) < self.FETCH_LIMIT:
+                # last page
+                break
+        self.debug('got %d message(s) for %s', len(messages), receiver)
+        g_messages_loaded.inc(len(messages))
+        return start, messages
 
     def fetch_all_messages(self, receiver: ID) -> List[ReliableMessage]:
-        all_messages = []
-        # message directory
-        directory = self.__message_directory(receiver)
-        # get all files in messages directory and sort by filename
-        if self.exists(path=directory):
-            files = sorted(os.listdir(directory))
-        else:
-            files = []
-        for filename in files:
-            if not filename.endswith('.msg'):
-                continue
-            # load messages from file path
-            path = os.path.join(directory, filename)
-            messages = self.__load_messages(path=path, remove=True)
-            self.debug('got %d message(s) for %s in file: %s' % (len(messages), receiver, filename))
-            for msg in messages:
-                all_messages.append(msg)
-        return all_messages
+        _, messages = self.fetch_messages(receiver=receiver)
+        return messages
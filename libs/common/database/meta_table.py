@@ -24,10 +24,12 @@
 # ==============================================================================
 
 import os
-from typing import Optional, Dict
+from typing import Optional
 
 from dimp import ID, Meta
 
+from ...utils import CacheManager
+
 from .storage import Storage
 
 
@@ -36,8 +38,7 @@ class MetaTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__caches: Dict[ID, Meta] = {}
-        self.__empty = {'desc': 'just to avoid loading non-exists file again'}
+        self.__caches = CacheManager().pool(name='meta')  # ID -> Meta
 
     """
         Meta file for Entities (User/Group)
@@ -52,7 +53,7 @@ class MetaTable(Storage):
     def save_meta(self, meta: Meta, identifier: ID) -> bool:
         if not meta.match_identifier(identifier=identifier):
             # raise ValueError('meta not match: %s, %s' % (identifier, meta))
-            self.error('meta not match: %s, %s' % (identifier, meta))
+            self.error('meta not match: %s, %s', identifier, meta)
             return False
         # 0. check duplicate record
         old = self.meta(identifier=identifier)
@@ -60,26 +61,23 @@ class MetaTable(Storage):
             # meta won't change, no need to update
             return True
         # 1. store into memory cache
-        self.__caches[identifier] = meta
+        self.__caches.update(key=identifier, value=meta)
         # 2. save into local storage
         path = self.__path(identifier=identifier)
-        self.info('Saving meta into: %s' % path)
+        self.info('Saving meta into: %s', path)
         return self.write_json(container=meta.dictionary, path=path)
 
     def meta(self, identifier: ID) -> Optional[Meta]:
         # 1. try from memory cache
-        info = self.__caches.get(identifier)
-        if info is None:
+        info, holder = self.__caches.fetch(key=identifier)
+        if holder is None:
             # 2. try from local storage
             path = self.__path(identifier=identifier)
-            self.info('Loading meta from: %s' % path)
+            self.info('Loading meta from: %s', path)
             dictionary = self.read_json(path=path)
             info = Meta.parse(meta=dictionary)
-            if info is None:
-                # 2.1. place an empty meta for cache
-                info = self.__empty
-            # 3. store into memory cache
-            self.__caches[identifier] = info
-        if info is not self.__empty:
+            # 3. store into memory cache (place an empty meta to avoid loading again)
+            self.__caches.update(key=identifier, value=info)
+        if info is not None:
             return info
-        self.error('meta not found: %s' % identifier)
+        self.error('meta not found: %s', identifier)
@@ -24,10 +24,12 @@
 # ==============================================================================
 
 import os
-from typing import Optional, Dict, List
+from typing import Optional, List
 
 from dimp import ID, PrivateKey, SignKey, DecryptKey
 
+from ...utils import CacheManager
+
 from .storage import Storage
 
 
@@ -39,9 +41,9 @@ class PrivateKeyTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__meta_private_keys: Dict[ID, PrivateKey] = {}
-        self.__visa_private_keys: Dict[ID, List[PrivateKey]] = {}
-        self.__empty = {'desc': 'just to avoid loading non-exists file again'}
+        man = CacheManager()
+        self.__meta_private_keys = man.pool(name='meta_private_key')   # ID -> PrivateKey
+        self.__visa_private_keys = man.pool(name='visa_private_keys')  # ID -> List[PrivateKey]
 
     def save_private_key(self, key: PrivateKey, identifier: ID, key_type: str = 'M'):
         if key_type == 'M':
@@ -82,30 +84,27 @@ class PrivateKeyTable(Storage):
 
     def __identity_key(self, identifier: ID) -> Optional[PrivateKey]:
         # 1. try from memory cache
-        key = self.__meta_private_keys.get(identifier)
-        if key is None:
+        key, holder = self.__meta_private_keys.fetch(key=identifier)
+        if holder is None:
             # 2. try from local storage
             path = self.__identity_key_path(identifier=identifier)
-            self.info('Loading identity key from: %s' % path)
+            self.info('Loading identity key from: %s', path)
             dictionary = self.read_json(path=path)
             key = PrivateKey.parse(key=dictionary)
-            if key is None:
-                # 2.1. place an empty key for cache
-                key = self.__empty
-            # 3. store into memory cache
-            self.__meta_private_keys[identifier] = key
-        if key is not self.__empty:
+            # 3. store into memory cache (place an empty key to avoid loading again)
+            self.__meta_private_keys.update(key=identifier, value=key)
+        if key is not None:
             return key
-        self.error('private key not found: %s' % identifier)
+        self.error('private key not found: %s', identifier)
 
     def __message_keys(self, identifier: ID) -> List[PrivateKey]:
         # 1. try from memory cache
-        keys = self.__visa_private_keys.get(identifier)
-        if keys is None:
+        keys, holder = self.__visa_private_keys.fetch(key=identifier)
+        if holder is None:
             keys = []
             # 2. try from local storage
             path = self.__message_keys_path(identifier=identifier)
-            self.info('Loading message keys from: %s' % path)
+            self.info('Loading message keys from: %s', path)
             array = self.read_json(path=path)
             if array is not None:
                 for item in array:
@@ -113,13 +112,13 @@ class PrivateKeyTable(Storage):
                     if k is not None:
                         keys.append(k)
             # 3. store into memory cache
-            self.__visa_private_keys[identifier] = keys
+            self.__visa_private_keys.update(key=identifier, value=keys)
         return keys
 
     def __cache_identity_key(self, identifier: ID, key: PrivateKey) -> bool:
         old = self.__identity_key(identifier=identifier)
         if old is None:
-            self.__meta_private_keys[identifier] = key
+            self.__meta_private_keys.update(key=identifier, value=key)
             return True
 
     def __cache_message_key(self, key: PrivateKey, identifier: ID) -> bool:
@@ -132,7 +131,7 @@ class PrivateKeyTable(Storage):
         elif len(array) > 2:
             array.pop()       # keep only last three records
         array.insert(0, key)
-        self.__visa_private_keys[identifier] = array
+        self.__visa_private_keys.update(key=identifier, value=array)
         return True
 
     def __save_identify_key(self, key: PrivateKey, identifier: ID) -> bool:
@@ -140,7 +139,7 @@ class PrivateKeyTable(Storage):
         if self.__cache_identity_key(key=key, identifier=identifier):
             # 2. save into local storage
             path = self.__identity_key_path(identifier=identifier)
-            self.info('Saving identity key into: %s' % path)
+            self.info('Saving identity key into: %s', path)
             return self.write_json(container=key.dictionary, path=path)
 
     def __save_message_key(self, key: PrivateKey, identifier: ID) -> bool:
@@ -150,7 +149,7 @@ class PrivateKeyTable(Storage):
             plain = [item.dictionary for item in array]
             # 2. save into local storage
             path = self.__message_keys_path(identifier=identifier)
-            self.info('Saving message keys into: %s' % path)
+            self.info('Saving message keys into: %s', path)
             return self.write_json(container=plain, path=path)
 
 
@@ -23,11 +23,14 @@
 # SOFTWARE.
 # ==============================================================================
 
+import json
 import time
-from typing import Optional, Union
+from typing import Optional, Union, List
 
-from ...utils import File, TextFile, JSONFile
-from ...utils import Log
+from ...utils import Log, MetricsRegistry
+from ...utils.log import DEBUG_FLAG, INFO_FLAG, WARNING_FLAG, ERROR_FLAG
+
+from .backend import StorageBackend, FileBackend
 
 
 def current_time() -> str:
@@ -35,67 +38,114 @@ def current_time() -> str:
     return time.strftime('%Y-%m-%d %H:%M:%S', time_array)
 
 
+g_metrics = MetricsRegistry()
+g_reads = g_metrics.counter(name='dim_storage_reads_total', desc='Records loaded from storage (cache missed)')
+g_writes = g_metrics.counter(name='dim_storage_writes_total', desc='Records saved into storage')
+g_errors = g_metrics.counter(name='dim_storage_errors_total', desc='Storage operations failed')
+g_read_histogram = g_metrics.histogram(name='dim_storage_read_seconds', desc='Time spent on loading one record')
+
+
 class Storage:
 
     root = '/tmp/.dim'
 
+    # records in files by default, set a SQLiteBackend to store them in one database
+    backend: StorageBackend = FileBackend()
+
     @classmethod
     def exists(cls, path: str) -> bool:
-        return File(path=path).exists(path=path)
+        return cls.backend.exists(path=path)
 
     @classmethod
     def read_text(cls, path: str) -> Optional[str]:
+        g_reads.inc()
+        start = time.time()
         try:
-            return TextFile(path=path).read()
+            return cls.backend.read_text(path=path)
         except Exception as error:
-            Log.error('Storage >\t%s' % error)
+            Log.error('Storage >\t%s', error)
+            g_errors.inc()
+        finally:
+            g_read_histogram.observe(time.time() - start)
 
     @classmethod
     def read_json(cls, path: str) -> Union[dict, list, None]:
+        g_reads.inc()
+        start = time.time()
         try:
-            return JSONFile(path=path).read()
+            text = cls.backend.read_text(path=path)
+            if text is not None:
+                return json.loads(text)
         except Exception as error:
-            Log.error('Storage >\t%s' % error)
+            Log.error('Storage >\t%s', error)
+            g_errors.inc()
+        finally:
+            g_read_histogram.observe(time.time() - start)
 
     @classmethod
     def write_text(cls, text: str, path: str) -> bool:
+        g_writes.inc()
         try:
-            return TextFile(path=path).write(text=text)
+            return cls.backend.write_text(text=text, path=path)
         except Exception as error:
-            Log.error('Storage >\t%s' % error)
+            Log.error('Storage >\t%s', error)
+            g_errors.inc()
 
     @classmethod
     def write_json(cls, container: Union[dict, list], path: str) -> bool:
+        g_writes.inc()
         try:
-            return JSONFile(path=path).write(container=container)
+            return cls.backend.write_text(text=json.dumps(container), path=path)
         except Exception as error:
-            Log.error('Storage >\t%s' % error)
+            Log.error('Storage >\t%s', error)
+            g_errors.inc()
 
     @classmethod
     def append_text(cls, text: str, path: str) -> bool:
+        g_writes.inc()
         try:
-            return TextFile(path=path).append(text=text)
+            return cls.backend.append_text(text=text, path=path)
         except Exception as error:
-            Log.error('Storage >\t%s' % error)
+            Log.error('Storage >\t%s', error)
+            g_errors.inc()
 
     @classmethod
     def remove(cls, path: str) -> bool:
         try:
-            return File(path=path).remove()
+            return cls.backend.remove(path=path)
         except Exception as error:
-            Log.error('Storage >\t%s' % error)
+            Log.error('Storage >\t%s', error)
+            g_errors.inc()
+
+    @classmethod
+    def scan(cls, directory: str, name: str) -> List[str]:
+        """ Get paths of records named 'name' in sub-directories of 'directory' """
+        try:
+            return cls.backend.scan(directory=directory, name=name)
+        except Exception as error:
+            Log.error('Storage >\t%s', error)
+            g_errors.inc()
+            return []
 
     #
     #  Log
     #
-    def debug(self, msg: str):
-        Log.debug('Storage::%s >\t%s' % (self.__class__.__name__, msg))
-
-    def info(self, msg: str):
-        Log.info('Storage::%s >\t%s' % (self.__class__.__name__, msg))
-
-    def warning(self, msg: str):
-        Log.warning('Storage::%s >\t%s' % (self.__class__.__name__, msg))
-
-    def error(self, msg: str):
-        Log.error('Storage::%s >\t%s' % (self.__class__.__name__, msg))
+    def debug(self, msg: str, *args, every: int = 1):
+        clazz = self.__class__
+        if Log.level(tag=clazz) & DEBUG_FLAG != 0:
+            Log.output('DEBUG - Storage::%s >\t' % clazz.__name__, msg, args, every=every)
+
+    def info(self, msg: str, *args, every: int = 1):
+        clazz = self.__class__
+        if Log.level(tag=clazz) & INFO_FLAG != 0:
+            Log.output('Storage::%s >\t' % clazz.__name__, msg, args, every=every)
+
+    def warning(self, msg: str, *args, every: int = 1):
+        clazz = self.__class__
+        if Log.level(tag=clazz) & WARNING_FLAG != 0:
+            Log.output('Storage::%s >\t' % clazz.__name__, msg, args, every=every)
+
+    def error(self, msg: str, *args, every: int = 1):
+        clazz = self.__class__
+        if Log.level(tag=clazz) & ERROR_FLAG != 0:
+            Log.output('ERROR - Storage::%s >\t' % clazz.__name__, msg, args, every=every)
@@ -28,6 +28,8 @@ from typing import List, Optional
 
 from dimp import ID, Command
 
+from ...utils import CacheManager
+
 from .storage import Storage
 
 
@@ -35,13 +37,13 @@ class UserTable(Storage):
 
     def __init__(self):
         super().__init__()
+        man = CacheManager()
         # caches
-        self.__contacts = {}           # ID -> List[ID]
+        self.__contacts = man.pool(name='contacts')                   # ID -> List[ID]
         # stored commands
-        self.__contacts_commands = {}  # ID -> Command
-        self.__block_commands = {}     # ID -> Command
-        self.__mute_commands = {}      # ID -> Command
-        self.__empty = {'desc': 'just to avoid loading non-exists file again'}
+        self.__contacts_commands = man.pool(name='contacts_command')  # ID -> Command
+        self.__block_commands = man.pool(name='block_command')        # ID -> Command
+        self.__mute_commands = man.pool(name='mute_command')          # ID -> Command
 
     """
         User contacts
@@ -54,27 +56,27 @@ class UserTable(Storage):
 
     def contacts(self, user: ID) -> List[ID]:
         # try from memory cache
-        array = self.__contacts.get(user)
-        if array is None:
+        array, holder = self.__contacts.fetch(key=user)
+        if holder is None:
             # try from local storage
             path = self.__contacts_path(identifier=user)
-            self.info('Loading contacts from: %s' % path)
+            self.info('Loading contacts from: %s', path)
             text = self.read_text(path=path)
-            if text is None:
-                array = []
-            else:
+            if text is not None:
                 array = ID.convert(members=text.splitlines())
             # store into memory cache
-            self.__contacts[user] = array
+            self.__contacts.update(key=user, value=array)
+        if array is None:
+            return []
         return array
 
     def save_contacts(self, contacts: List[ID], user: ID) -> bool:
         assert contacts is not None, 'contacts cannot be empty'
         # store into memory cache
-        self.__contacts[user] = contacts
+        self.__contacts.update(key=user, value=contacts)
         # store into local storage
         path = self.__contacts_path(identifier=user)
-        self.info('Saving contacts into: %s' % path)
+        self.info('Saving contacts into: %s', path)
         contacts = ID.revert(members=contacts)
         text = '\n'.join(contacts)
         return self.write_text(text=text, path=path)
@@ -90,27 +92,24 @@ class UserTable(Storage):
 
     def contacts_command(self, identifier: ID) -> Optional[Command]:
         # try from memory cache
-        cmd = self.__contacts_commands.get(identifier)
-        if cmd is None:
+        cmd, holder = self.__contacts_commands.fetch(key=identifier)
+        if holder is None:
             # try from local storage
             path = self.__contacts_command_path(identifier=identifier)
-            self.info('Loading stored contacts command from: %s' % path)
+            self.info('Loading stored contacts command from: %s', path)
             dictionary = self.read_json(path=path)
-            if dictionary is None:
-                cmd = self.__empty
-            else:
+            if dictionary is not None:
                 cmd = Command(dictionary)
-            self.__contacts_commands[identifier] = cmd
-        if cmd is not self.__empty:
-            return cmd
+            self.__contacts_commands.update(key=identifier, value=cmd)
+        return cmd
 
     def save_contacts_command(self, cmd: Command, sender: ID) -> bool:
         assert cmd is not None, 'contacts command cannot be empty'
         # store into memory cache
-        self.__contacts_commands[sender] = cmd
+        self.__contacts_commands.update(key=sender, value=cmd)
         # store into local storage
         path = self.__contacts_command_path(identifier=sender)
-        self.info('Saving contacts command into: %s' % path)
+        self.info('Saving contacts command into: %s', path)
         return self.write_json(container=cmd.dictionary, path=path)
 
     """
@@ -124,27 +123,24 @@ class UserTable(Storage):
 
     def block_command(self, identifier: ID) -> Command:
         # try from memory cache
-        cmd = self.__block_commands.get(identifier)
-        if cmd is None:
+        cmd, holder = self.__block_commands.fetch(key=identifier)
+        if holder is None:
             # try from local storage
             path = self.__block_command_path(identifier=identifier)
-            self.info('Loading stored block command from: %s' % path)
+            self.info('Loading stored block command from: %s', path)
             dictionary = self.read_json(path=path)
-            if dictionary is None:
-                cmd = self.__empty
-            else:
+            if dictionary is not None:
                 cmd = Command(dictionary)
-            self.__block_commands[identifier] = cmd
-        if cmd is not self.__empty:
-            return cmd
+            self.__block_commands.update(key=identifier, value=cmd)
+        return cmd
 
     def save_block_command(self, cmd: Command, sender: ID) -> bool:
         assert cmd is not None, 'block command cannot be empty'
         # store into memory cache
-        self.__block_commands[sender] = cmd
+        self.__block_commands.update(key=sender, value=cmd)
         # store into local storage
         path = self.__block_command_path(identifier=sender)
-        self.info('Saving block command into: %s' % path)
+        self.info('Saving block command into: %s', path)
         return self.write_json(container=cmd.dictionary, path=path)
 
     """
@@ -158,25 +154,22 @@ class UserTable(Storage):
 
     def mute_command(self, identifier: ID) -> Command:
         # try from memory cache
-        cmd = self.__mute_commands.get(identifier)
-        if cmd is None:
+        cmd, holder = self.__mute_commands.fetch(key=identifier)
+        if holder is None:
             # try from local storage
             path = self.__mute_command_path(identifier=identifier)
-            self.info('Loading stored mute command from: %s' % path)
+            self.info('Loading stored mute command from: %s', path)
             dictionary = self.read_json(path=path)
-            if dictionary is None:
-                cmd = self.__empty
-            else:
+            if dictionary is not None:
                 cmd = Command(dictionary)
-            self.__mute_commands[identifier] = cmd
-        if cmd is not self.__empty:
-            return cmd
+            self.__mute_commands.update(key=identifier, value=cmd)
+        return cmd
 
     def save_mute_command(self, cmd: Command, sender: ID) -> bool:
         assert cmd is not None, 'mute command cannot be empty'
         # store into memory cache
-        self.__mute_commands[sender] = cmd
+        self.__mute_commands.update(key=sender, value=cmd)
         # store into local storage
         path = self.__mute_command_path(identifier=sender)
-        self.info('Saving mute command into: %s' % path)
+        self.info('Saving mute command into: %s', path)
         return self.write_json(container=cmd.dictionary, path=path)
@@ -35,12 +35,13 @@
     Memory cache for reused passwords (symmetric key)
 """
 
+import json
 import os
 from typing import Optional
 
 from dimp import User
 
-from ..utils import JSONFile
+from ..utils import JSONFile, FileWriter
 from ..utils import Singleton
 
 from .keycache import KeyCache
@@ -53,6 +54,7 @@ class KeyStore(KeyCache):
         super().__init__()
         self.__user: Optional[User] = None
         self.__base_dir: str = '/tmp/.dim/'
+        self.__writer: Optional[FileWriter] = None
 
     @property
     def user(self) -> Optional[User]:
@@ -86,6 +88,15 @@ class KeyStore(KeyCache):
     def directory(self, value: str):
         self.__base_dir = value
 
+    @property
+    def writer(self) -> Optional[FileWriter]:
+        return self.__writer
+
+    @writer.setter
+    def writer(self, value: FileWriter):
+        """ Write key table in background """
+        self.__writer = value
+
     # '/tmp/.dim/protected/{ADDRESS}/keystore.js'
     def __path(self) -> Optional[str]:
         if self.__user is None:
@@ -98,6 +109,9 @@ class KeyStore(KeyCache):
         path = self.__path()
         if path is None:
             return False
+        writer = self.__writer
+        if writer is not None:
+            return writer.write(data=json.dumps(key_map), path=path)
         return JSONFile(path).write(key_map)
 
     def load_keys(self) -> Optional[dict]:
@@ -105,4 +119,9 @@ class KeyStore(KeyCache):
         path = self.__path()
         if path is None:
             return None
+        writer = self.__writer
+        if writer is not None:
+            text = writer.read(path=path)
+            if text is not None:
+                return json.loads(text)
         return JSONFile(path).read()
@@ -45,6 +45,10 @@ from ..utils import Singleton
 
 from .keystore import KeyStore
 from .facebook import CommonFacebook
+from .crypto import CryptoExecutor
+
+
+g_crypto = CryptoExecutor()
 
 
 class CommonMessenger(Messenger, Logging):
@@ -109,6 +113,29 @@ class CommonMessenger(Messenger, Logging):
         except UnicodeDecodeError as error:
             self.error('failed to deserialize content: %s, %s' % (error, data))
 
+    #
+    #   Public-key works (run in the crypto executor when started)
+    #
+    def verify_signatures(self, messages: List[ReliableMessage]) -> int:
+        """
+        Check signatures of received messages in one batch before processing them,
+        override to verify them concurrently
+
+        :param messages: network messages
+        :return: count of signatures verified
+        """
+        return 0
+
+    def decrypt_key(self, data: bytes, sender: ID, receiver: ID, msg: SecureMessage) -> Optional[bytes]:
+        keys = self.facebook.private_keys_for_decryption(identifier=msg.receiver)
+        assert keys is not None and len(keys) > 0, 'failed to get decrypt keys: %s' % msg.receiver
+        return g_crypto.decrypt(keys=keys, data=data)
+
+    def sign_data(self, data: bytes, sender: ID, msg: SecureMessage) -> bytes:
+        key = self.facebook.private_key_for_signature(identifier=sender)
+        assert key is not None, 'failed to get sign key for user: %s' % sender
+        return g_crypto.sign(key=key, data=data)
+
     #
     #   Reuse message key
     #
@@ -46,3 +46,4 @@ class NotificationNames:
 
     DELIVER_MESSAGE = 'deliver_message'  # delivering message
     MESSAGE_SENT = 'message_sent'        # message sent out
+    MESSAGE_CACHED = 'message_cached'    # message stored for offline receiver
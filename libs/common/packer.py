@@ -27,39 +27,97 @@
     Common extensions for MessagePacker
     ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 """
-from typing import Optional
+from typing import Optional, List
 
 from dimp import base64_encode, sha256
+from dimp import SymmetricKey
 from dimp import InstantMessage, SecureMessage, ReliableMessage
 from dimsdk import MessagePacker
 
+from ..utils import Tracer
 from ..utils.mtp import MTPUtils
 
 from .messenger import CommonMessenger
 
 
+g_tracer = Tracer()
+
+
+def key_digest(key: SymmetricKey) -> Optional[str]:
+    """
+    Digest for the receiver to check the reused key: base64(sha256(key.data[-6:]))[-8:]
+
+    The key cache returns the same key object for the same direction,
+    so the digest is memoized on it (until the key data changed).
+    """
+    info = key.get('data')
+    memo = getattr(key, '_digest_memo', None)
+    if memo is not None and memo[0] is info:
+        return memo[1]
+    digest = None
+    # get key data
+    data = key.data
+    if data is not None and len(data) >= 6:
+        # get digest
+        pos = len(data) - 6
+        base64 = base64_encode(sha256(data[pos:]))
+        pos = len(base64) - 8
+        digest = base64[pos:]
+    key._digest_memo = (info, digest)
+    return digest
+
+
 class CommonPacker(MessagePacker):
 
     MTP_JSON = 0x01
     MTP_DMTP = 0x02
 
+    # format names for negotiating in handshake, in order of preference
+    MTP_FORMATS = {
+        'dmtp': MTP_DMTP,
+        'json': MTP_JSON,
+    }
+
     def __init__(self, messenger: CommonMessenger):
         super().__init__(messenger=messenger)
         # Message Transfer Protocol
         self.mtp_format = self.MTP_JSON
 
+    @property
+    def mtp_formats(self) -> List[str]:
+        """ Format names offered to the remote peer """
+        return list(self.MTP_FORMATS.keys())
+
+    def negotiate_format(self, formats: Optional[List[str]]) -> Optional[str]:
+        """
+        Choose the preferred format accepted by the remote peer
+
+        :param formats: format names offered by the remote peer
+        :return: format name chosen, None on not offered
+        """
+        if not isinstance(formats, list):
+            return None
+        for name, mtp in self.MTP_FORMATS.items():
+            if name in formats:
+                self.mtp_format = mtp
+                return name
+
+    def accept_format(self, name: Optional[str]):
+        """ Use the format chosen by the remote peer """
+        self.mtp_format = self.MTP_FORMATS.get(name, self.MTP_JSON)
+
     def __attach_key_digest(self, msg: ReliableMessage):
         # check message delegate
         if msg.delegate is None:
             msg.delegate = self.transceiver
-        if msg.encrypted_key is not None:
+        if msg.get('key') is not None:
             # 'key' exists
             return
         keys = msg.encrypted_keys
         if keys is None:
             keys = {}
-        elif 'digest' in keys:
-            # key digest already exists
+        elif 'digest' in keys or str(msg.receiver) in keys:
+            # key digest (or key for receiver) already exists
             return
         # get key with direction
         sender = msg.sender
@@ -69,37 +127,40 @@ class CommonPacker(MessagePacker):
             key = self.messenger.cipher_key(sender=sender, receiver=receiver)
         else:
             key = self.messenger.cipher_key(sender=sender, receiver=group)
-        # get key data
-        data = key.data
-        if data is None or len(data) < 6:
+        if key is None:
+            return
+        digest = key_digest(key=key)
+        if digest is None:
             return
-        # get digest
-        pos = len(data) - 6
-        digest = sha256(data[pos:])
-        base64 = base64_encode(digest)
         # set digest
-        pos = len(base64) - 8
-        keys['digest'] = base64[pos:]
-        msg['keys'] = keys
+        if len(keys) == 0:
+            # new 'keys'
+            msg['keys'] = {'digest': digest}
+        else:
+            # the dictionary is shared with the message
+            keys['digest'] = digest
 
     def serialize_message(self, msg: ReliableMessage) -> bytes:
         self.__attach_key_digest(msg=msg)
-        if self.mtp_format == self.MTP_JSON:
-            # JsON
-            return super().serialize_message(msg=msg)
-        else:
+        if self.mtp_format == self.MTP_DMTP and MTPUtils.is_compatible(msg=msg):
             # D-MTP
             return MTPUtils.serialize_message(msg=msg)
+        else:
+            # JsON (also for messages with fields not supported by D-MTP)
+            return super().serialize_message(msg=msg)
 
     def deserialize_message(self, data: bytes) -> Optional[ReliableMessage]:
         if data is None or len(data) < 2:
             return None
         if data.startswith(b'{'):
             # JsON
-            return super().deserialize_message(data=data)
+            msg = super().deserialize_message(data=data)
         else:
             # D-MTP
-            return MTPUtils.deserialize_message(data=data)
+            msg = MTPUtils.deserialize_message(data=data)
+        if msg is not None:
+            g_tracer.begin(msg=msg)
+        return msg
 
     def encrypt_message(self, msg: InstantMessage) -> SecureMessage:
         s_msg = super().encrypt_message(msg=msg)
@@ -40,14 +40,16 @@ import threading
 import time
 import traceback
 import weakref
-from typing import Optional, List
+from collections import OrderedDict, deque
+from typing import Optional, Callable, List, Dict, Deque
 
 from dimp import ReliableMessage
 from dimsdk import Callback as MessengerCallback
 
 from ..utils import NotificationCenter, Logging
+from ..utils import MetricsRegistry, Tracer
 
-from ..network import GateStatus, GateDelegate, StarGate, StarTrek
+from ..network import GateStatus, GateDelegate, StarGate, StarTrek, StarShip
 from ..network import Ship, ShipDelegate
 
 from .notification import NotificationNames
@@ -57,6 +59,16 @@ from .messenger import CommonMessenger
 
 g_database = Database()
 
+g_metrics = MetricsRegistry()
+g_tracer = Tracer()
+g_messages_sent = g_metrics.counter(name='dim_messages_pushed_total', labels={'result': 'sent'},
+                                    desc='Messages pushed to sessions')
+g_messages_failed = g_metrics.counter(name='dim_messages_pushed_total', labels={'result': 'failed'})
+g_packages_received = g_metrics.counter(name='dim_packages_received_total', desc='Packages received by sessions')
+g_bytes_received = g_metrics.counter(name='dim_received_bytes_total', desc='Payload bytes received by sessions')
+g_process_histogram = g_metrics.histogram(name='dim_package_process_seconds',
+                                          desc='Time spent on processing one received package')
+
 
 def is_broadcast_message(msg: ReliableMessage):
     if msg.receiver.is_broadcast:
@@ -69,10 +81,12 @@ class MessageWrapper(ShipDelegate, MessengerCallback):
 
     EXPIRES = 600  # 10 minutes
 
-    def __init__(self, msg: ReliableMessage):
+    def __init__(self, msg: ReliableMessage, queue=None):
         super().__init__()
         self.__time = 0
         self.__msg = msg
+        self.__signature = msg.get('signature')
+        self.__queue = None if queue is None else weakref.ref(queue)
 
     @property
     def priority(self) -> int:
@@ -86,11 +100,16 @@ class MessageWrapper(ShipDelegate, MessengerCallback):
     def msg(self) -> Optional[ReliableMessage]:
         return self.__msg
 
+    @property
+    def signature(self) -> Optional[str]:
+        return self.__signature
+
     def mark(self):
         self.__time = 1
 
     def fail(self):
         self.__time = -1
+        self.__finish()
 
     @property
     def virgin(self) -> bool:
@@ -104,6 +123,12 @@ class MessageWrapper(ShipDelegate, MessengerCallback):
             delta = int(time.time()) - self.__time
             return delta > self.EXPIRES
 
+    def __finish(self):
+        # tell the queue this message is sent or failed
+        queue = None if self.__queue is None else self.__queue()
+        if queue is not None:
+            queue.finished(wrapper=self)
+
     #
     #   ShipDelegate
     #
@@ -112,12 +137,16 @@ class MessageWrapper(ShipDelegate, MessengerCallback):
             # success, remove message
             msg = self.__msg
             if isinstance(msg, ReliableMessage):
+                g_tracer.end(msg=msg, stage='sent')
                 NotificationCenter().post(name=NotificationNames.MESSAGE_SENT, sender=self, info=msg.dictionary)
                 g_database.erase_message(msg=msg)
             self.__msg = None
+            g_messages_sent.inc()
         else:
             # failed
             self.__time = -1
+            g_messages_failed.inc()
+        self.__finish()
 
     #
     #   Callback
@@ -130,14 +159,25 @@ class MessageWrapper(ShipDelegate, MessengerCallback):
         else:
             # failed
             self.__time = -1
+            self.__finish()
 
 
 class MessageQueue:
+    """
+        Messages waiting to be pushed, indexed by signature
+
+            virgins    - new messages waiting to be sent
+            departures - messages sent, waiting for response
+            finished   - messages sent or failed, waiting to be ejected
+    """
 
     def __init__(self):
         super().__init__()
-        self.__wrappers: List[MessageWrapper] = []
-        self.__lock = threading.Lock()
+        self.__wrappers: Dict[str, MessageWrapper] = {}              # signature -> wrapper
+        self.__virgins: Dict[str, MessageWrapper] = OrderedDict()     # signature -> wrapper
+        self.__departures: Dict[str, MessageWrapper] = OrderedDict()  # signature -> wrapper
+        self.__finished: Deque[MessageWrapper] = deque()
+        self.__lock = threading.RLock()
 
     @property
     def length(self) -> int:
@@ -148,35 +188,70 @@ class MessageQueue:
         with self.__lock:
             # check duplicated
             signature = msg.get('signature')
-            for wrapper in self.__wrappers:
-                item = wrapper.msg
-                if item is not None and item.get('signature') == signature:
+            wrapper = self.__wrappers.get(signature)
+            if wrapper is not None:
+                if wrapper.msg is not None:
                     return True
+                # the earlier one was sent, drop it before replacing
+                self.__remove(wrapper=wrapper)
             # append with wrapper
-            wrapper = MessageWrapper(msg=msg)
-            self.__wrappers.append(wrapper)
+            wrapper = MessageWrapper(msg=msg, queue=self)
+            self.__wrappers[signature] = wrapper
+            self.__virgins[signature] = wrapper
             return True
 
+    def __remove(self, wrapper: MessageWrapper) -> bool:
+        signature = wrapper.signature
+        if self.__wrappers.get(signature) is not wrapper:
+            # removed or replaced
+            return False
+        self.__wrappers.pop(signature)
+        if self.__virgins.get(signature) is wrapper:
+            self.__virgins.pop(signature)
+        if self.__departures.get(signature) is wrapper:
+            self.__departures.pop(signature)
+        return True
+
     def pop(self) -> Optional[MessageWrapper]:
         with self.__lock:
             if len(self.__wrappers) > 0:
-                return self.__wrappers.pop(0)
+                signature = next(iter(self.__wrappers))
+                wrapper = self.__wrappers[signature]
+                self.__remove(wrapper=wrapper)
+                return wrapper
 
     def next(self) -> Optional[MessageWrapper]:
         """ Get next new message """
         with self.__lock:
-            for wrapper in self.__wrappers:
-                if wrapper.virgin:
-                    wrapper.mark()  # mark sent
-                    return wrapper
+            if len(self.__virgins) > 0:
+                signature, wrapper = self.__virgins.popitem(last=False)
+                wrapper.mark()  # mark sent
+                self.__departures[signature] = wrapper
+                return wrapper
+
+    def finished(self, wrapper: MessageWrapper):
+        """ Callback from wrapper when message sent or failed """
+        with self.__lock:
+            if self.__wrappers.get(wrapper.signature) is wrapper:
+                self.__finished.append(wrapper)
 
     def eject(self) -> Optional[MessageWrapper]:
         """ Get any message sent or failed """
         with self.__lock:
-            for wrapper in self.__wrappers:
-                if wrapper.msg is None or wrapper.failed:
-                    self.__wrappers.remove(wrapper)
+            while len(self.__finished) > 0:
+                wrapper = self.__finished.popleft()
+                if self.__remove(wrapper=wrapper):
+                    return wrapper
+            # check the earliest departure for expired
+            while len(self.__departures) > 0:
+                signature, wrapper = next(iter(self.__departures.items()))
+                if not (wrapper.msg is None or wrapper.failed):
+                    break
+                if self.__remove(wrapper=wrapper):
                     return wrapper
+                # stale one (replaced), drop it
+                if self.__departures.get(signature) is wrapper:
+                    self.__departures.pop(signature)
 
 
 def create_gate(delegate: GateDelegate,
@@ -189,15 +264,26 @@ def create_gate(delegate: GateDelegate,
 
 class BaseSession(threading.Thread, GateDelegate, Logging):
 
+    BATCH_PACKAGES = 8  # process packages in batch when received so many in one payload, 0 to disable
+
     def __init__(self, messenger: CommonMessenger,
-                 address: Optional[tuple] = None, sock: Optional[socket.socket] = None):
+                 address: Optional[tuple] = None, sock: Optional[socket.socket] = None,
+                 gate: Optional[StarGate] = None):
         super().__init__()
         self.__queue = MessageQueue()
         self.__messenger = weakref.ref(messenger)
-        self.__gate = create_gate(delegate=self, address=address, sock=sock)
+        if gate is None:
+            gate = create_gate(delegate=self, address=address, sock=sock)
+        else:
+            gate.delegate = self
+        self.__gate = gate
         # session status
         self.__active = False
         self.__running = False
+        # callback for event loop when new task added
+        self.__waker: Optional[Callable] = None
+        # gauge of sessions for this protocol, set when first package received
+        self.__sessions_gauge = None
 
     def __del__(self):
         # store stranded messages
@@ -205,7 +291,7 @@ class BaseSession(threading.Thread, GateDelegate, Logging):
 
     def __flush(self):
         # store all messages
-        self.info('saving %d unsent message(s)' % self.__queue.length)
+        self.info('saving %d unsent message(s)', self.__queue.length)
         while True:
             wrapper = self.__queue.pop()
             if wrapper is None:
@@ -223,7 +309,7 @@ class BaseSession(threading.Thread, GateDelegate, Logging):
             msg = wrapper.msg
             if msg is not None:
                 # task failed
-                self.warning('clean expired msg: %s -> %s' % (msg.sender, msg.receiver))
+                self.warning('clean expired msg: %s -> %s', msg.sender, msg.receiver)
                 g_database.store_message(msg=msg)
 
     @property
@@ -234,6 +320,20 @@ class BaseSession(threading.Thread, GateDelegate, Logging):
     def gate(self) -> StarGate:
         return self.__gate
 
+    @property
+    def waker(self) -> Optional[Callable]:
+        return self.__waker
+
+    @waker.setter
+    def waker(self, callback: Optional[Callable]):
+        self.__waker = callback
+
+    def _wakeup(self):
+        """ Notify the event loop (if exists) to process this session """
+        callback = self.__waker
+        if callback is not None:
+            callback()
+
     @property
     def active(self) -> bool:
         return self.__active and self.__gate.running
@@ -260,6 +360,10 @@ class BaseSession(threading.Thread, GateDelegate, Logging):
         self.__running = False
         self.__gate.finish()
         self.__flush()
+        gauge = self.__sessions_gauge
+        if gauge is not None:
+            self.__sessions_gauge = None
+            gauge.dec()
 
     @property
     def running(self) -> bool:
@@ -302,14 +406,19 @@ class BaseSession(threading.Thread, GateDelegate, Logging):
 
     def send_payload(self, payload: bytes, priority: int = 0, delegate: Optional[ShipDelegate] = None) -> bool:
         if self.active:
-            return self.__gate.send_payload(payload=payload, priority=priority, delegate=delegate)
+            ok = self.__gate.send_payload(payload=payload, priority=priority, delegate=delegate)
+            self._wakeup()
+            return ok
         else:
-            self.error('session inactive, cannot send message (%d) now' % len(payload))
+            self.error('session inactive, cannot send message (%d) now', len(payload))
 
     def push_message(self, msg: ReliableMessage) -> bool:
         """ Push message when session active """
         if self.active:
-            return self.__queue.append(msg=msg)
+            ok = self.__queue.append(msg=msg)
+            g_tracer.mark(msg=msg, stage='push')
+            self._wakeup()
+            return ok
 
     #
     #   GateDelegate
@@ -319,25 +428,103 @@ class BaseSession(threading.Thread, GateDelegate, Logging):
         if new_status == GateStatus.Connected:
             self.messenger.connected()
 
-    def gate_received(self, gate, ship: Ship) -> Optional[bytes]:
-        payload = ship.payload
-        if payload.startswith(b'{'):
-            # JsON in lines
-            packages = payload.splitlines()
-        else:
-            packages = [payload]
-        data = b''
+    def __count_session(self, gate: StarGate):
+        docker = gate.docker
+        if docker is None:
+            return
+        protocol = docker.__class__.__name__
+        if protocol.endswith('Docker'):
+            protocol = protocol[:-6]
+        gauge = g_metrics.gauge(name='dim_sessions', labels={'protocol': protocol.lower()},
+                                desc='Sessions received packages, by protocol')
+        gauge.inc()
+        self.__sessions_gauge = gauge
+
+    def __process_packages(self, packages: List[bytes]) -> List[bytes]:
+        responses = []
         for pack in packages:
+            start = time.time()
+            g_tracer.arrive()
             try:
                 res = self.messenger.process_package(data=pack)
                 if res is not None and len(res) > 0:
-                    data += res + b'\n'
+                    responses.append(res)
             except Exception as error:
-                self.error('parse message failed: %s, %s' % (error, pack))
+                self.error('parse message failed: %s, %s', error, pack)
                 traceback.print_exc()
                 # from dimsdk import TextContent
                 # return TextContent.new(text='parse message failed: %s' % error)
+            g_process_histogram.observe(time.time() - start)
+        return responses
+
+    def __process_batch(self, packages: List[bytes]) -> List[bytes]:
+        """
+        Process packages received in one payload together
+
+            1. deserialize all packages;
+            2. verify signatures of all senders in one batch
+               (concurrently when the crypto executor started);
+            3. process the messages one by one in the order received,
+               so the messages from the same sender keep their order.
+        """
+        messenger = self.messenger
+        start = time.time()
+        messages = []
+        for pack in packages:
+            g_tracer.arrive()
+            try:
+                msg = messenger.deserialize_message(data=pack)
+                if msg is not None:
+                    messages.append(msg)
+            except Exception as error:
+                self.error('parse message failed: %s, %s', error, pack)
+                traceback.print_exc()
+        try:
+            messenger.verify_signatures(messages=messages)
+        except Exception as error:
+            # verify them one by one later
+            self.error('verify signatures failed: %s', error)
+            traceback.print_exc()
+        # time for deserializing & verifying is shared by all packages
+        shared = (time.time() - start) / len(packages)
+        responses = []
+        for msg in messages:
+            start = time.time()
+            try:
+                res = messenger.process_reliable_message(msg=msg)
+                if res is not None:
+                    data = messenger.serialize_message(msg=res)
+                    if data is not None and len(data) > 0:
+                        responses.append(data)
+            except Exception as error:
+                self.error('process message failed: %s, %s', error, msg)
+                traceback.print_exc()
+            g_process_histogram.observe(shared + time.time() - start)
+        return responses
+
+    def gate_received(self, gate, ship: Ship) -> Optional[bytes]:
+        if self.__sessions_gauge is None:
+            self.__count_session(gate=gate)
+        payload = ship.payload
+        g_bytes_received.inc(len(payload))
+        if payload.startswith(b'{'):
+            # JsON in lines
+            packages = payload.splitlines()
+        else:
+            packages = [payload]
+        g_packages_received.inc(len(packages))
+        if 0 < self.BATCH_PACKAGES <= len(packages):
+            responses = self.__process_batch(packages=packages)
+        else:
+            responses = self.__process_packages(packages=packages)
         # station MUST respond something to client request
-        if len(data) > 0:
-            data = data[:-1]  # remove last '\n'
-        return data
+        if len(responses) == 1:
+            return responses[0]
+        lines = []
+        for res in responses:
+            if res.startswith(b'{'):
+                lines.append(res)
+            else:
+                # D-MTP cannot be joined in lines, send it separately
+                self.send_payload(payload=res, priority=StarShip.NORMAL)
+        return b'\n'.join(lines)
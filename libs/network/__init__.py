@@ -27,7 +27,8 @@ from startrek import Ship, ShipDelegate
 from startrek import Gate, GateDelegate, GateStatus
 from startrek import StarShip, StarGate
 
-from .gate import StarTrek
+from .gate import StarTrek, AsyncTrek
+from .server import AsyncRequestHandler, AsyncTCPServer
 
 from .ws import WSShip, WSDocker
 from .mtp import MTPShip, MTPDocker
@@ -40,7 +41,8 @@ __all__ = [
     'Gate', 'GateDelegate', 'GateStatus',
     'StarShip', 'StarGate',
 
-    'StarTrek',
+    'StarTrek', 'AsyncTrek',
+    'AsyncRequestHandler', 'AsyncTCPServer',
 
     'WSShip', 'WSDocker',
     'MTPShip', 'MTPDocker',
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+#   Star Gate: Interfaces for network connection
+#
+#                                Written in 2021 by Moky <albert.moky@gmail.com>
+#
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2021 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Receive Buffer
+    ~~~~~~~~~~~~~~
+
+    Received data waiting to be parsed, peek & consume without copying the whole stream
+"""
+
+from typing import Optional
+
+
+class ReceiveBuffer:
+    """
+        Byte array with a read offset
+
+            1. received data is appended to the end;
+            2. 'peek()' returns a memoryview of the unread data (no copy);
+            3. 'consume()/skip()' only move the read offset forward,
+               the consumed space is dropped when it takes the bigger half.
+
+        NOTICE: the memoryviews should not be kept after parsing,
+                or the array must be copied before it can be resized.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__data = bytearray()
+        self.__offset = 0
+
+    def __len__(self) -> int:
+        return len(self.__data) - self.__offset
+
+    def __compact(self):
+        offset = self.__offset
+        if offset == 0:
+            return
+        try:
+            del self.__data[:offset]
+        except BufferError:
+            # still exported by some memoryview
+            self.__data = self.__data[offset:]
+        self.__offset = 0
+
+    def append(self, data: bytes):
+        if self.__offset > 0 and self.__offset >= len(self.__data) // 2:
+            self.__compact()
+        try:
+            self.__data.extend(data)
+        except BufferError:
+            # still exported by some memoryview
+            self.__data = self.__data + data
+
+    def peek(self, length: int) -> Optional[memoryview]:
+        """ Get the first 'length' bytes of unread data (may be shorter) """
+        if len(self) == 0:
+            return None
+        start = self.__offset
+        return memoryview(self.__data)[start:start+length]
+
+    def skip(self, length: int) -> int:
+        """ Drop the first 'length' bytes of unread data """
+        length = min(length, len(self))
+        self.__offset += length
+        if self.__offset == len(self.__data):
+            # all data consumed
+            self.__compact()
+        return length
+
+    def consume(self, length: int) -> Optional[bytes]:
+        """ Take out the first 'length' bytes of unread data """
+        if len(self) == 0:
+            return None
+        start = self.__offset
+        with memoryview(self.__data) as view:
+            data = bytes(view[start:start+length])
+        self.skip(length=len(data))
+        return data
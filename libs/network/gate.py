@@ -30,6 +30,7 @@
 
 import socket
 import threading
+import time
 from typing import Optional
 
 from tcp import Connection, ConnectionStatus, ConnectionDelegate
@@ -37,7 +38,15 @@ from tcp import BaseConnection, ActiveConnection
 
 from startrek import GateStatus, StarGate
 from startrek import Docker
+from startrek.runner import Runner
 
+from dmtp.mtp import Header as MTPHeader
+
+from ..utils import Log
+
+from .buffer import ReceiveBuffer
+from .sniffer import ProtocolSniffer
+from .protocol import NetMsgHead
 from .ws import WSDocker
 from .mtp import MTPDocker
 from .mars import MarsDocker
@@ -57,10 +66,17 @@ def gate_status(status: ConnectionStatus) -> GateStatus:
 
 class TCPGate(StarGate, ConnectionDelegate):
 
+    # protocols for new connections, register more to customize Docker
+    sniffer = ProtocolSniffer()
+    sniffer.register(magic=MTPHeader.MAGIC_CODE, docker_class=MTPDocker)
+    sniffer.register(magic=NetMsgHead.MAGIC_CODE, docker_class=MarsDocker, offset=NetMsgHead.MAGIC_CODE_OFFSET)
+    sniffer.register(magic=b'GET ', docker_class=WSDocker)
+
     def __init__(self, connection: Connection):
         super().__init__()
         self.__conn = connection
-        self.__chunks: Optional[bytes] = None
+        self.__buffer = ReceiveBuffer()
+        self.__docker_class = None  # protocol decided by sniffer
 
     @property
     def connection(self) -> Connection:
@@ -68,13 +84,28 @@ class TCPGate(StarGate, ConnectionDelegate):
 
     # Override
     def _create_docker(self) -> Optional[Docker]:
-        # override to customize Docker
-        if MTPDocker.check(gate=self):
-            return MTPDocker(gate=self)
-        if MarsDocker.check(gate=self):
-            return MarsDocker(gate=self)
-        if WSDocker.check(gate=self):
-            return WSDocker(gate=self)
+        docker_class = self.__docker_class
+        if docker_class is None:
+            # 1. classify the connection with the first bytes
+            view = self.peek(length=self.sniffer.length)
+            if view is None:
+                # received nothing
+                return None
+            try:
+                docker_class = self.sniffer.classify(data=view)
+            except ValueError as error:
+                Log.error('closing connection: %s' % error)
+                self.stop()
+                return None
+            finally:
+                view.release()
+            if docker_class is None:
+                # waiting for more data
+                return None
+            self.__docker_class = docker_class
+        # 2. check whether the first package is ready for this docker
+        if docker_class.check(gate=self):
+            return docker_class(gate=self)
 
     @property
     def running(self) -> bool:
@@ -102,22 +133,34 @@ class TCPGate(StarGate, ConnectionDelegate):
 
     # Override
     def receive(self, length: int, remove: bool) -> Optional[bytes]:
-        fragment = self.__receive(length=length)
-        if fragment is not None:
-            if len(fragment) > length:
-                if remove:
-                    self.__chunks = fragment[length:]
-                return fragment[:length]
-            elif remove:
-                # assert len(fragment) == length, 'fragment length error'
-                self.__chunks = None
-            return fragment
-
-    def __receive(self, length: int) -> Optional[bytes]:
-        cached = 0
-        if self.__chunks is not None:
-            cached = len(self.__chunks)
-        while cached < length:
+        buffer = self.__receive(length=length)
+        if remove:
+            return buffer.consume(length=length)
+        view = buffer.peek(length=length)
+        if view is not None:
+            return bytes(view)
+
+    def peek(self, length: int) -> Optional[memoryview]:
+        """
+        Get received data without removing it (no copy)
+
+        :param length: max length
+        :return: memoryview of received data, None on nothing received
+        """
+        return self.__receive(length=length).peek(length=length)
+
+    def skip(self, length: int) -> int:
+        """
+        Remove received data
+
+        :param length: max length
+        :return: length removed
+        """
+        return self.__receive(length=length).skip(length=length)
+
+    def __receive(self, length: int) -> ReceiveBuffer:
+        buffer = self.__buffer
+        while len(buffer) < length:
             # check available length from connection
             available = self.__conn.available
             if available <= 0:
@@ -127,12 +170,8 @@ class TCPGate(StarGate, ConnectionDelegate):
             if data is None:
                 break
             # append data
-            if self.__chunks is None:
-                self.__chunks = data
-            else:
-                self.__chunks += data
-            cached += len(data)
-        return self.__chunks
+            buffer.append(data=data)
+        return buffer
 
     #
     #   ConnectionDelegate
@@ -182,6 +221,16 @@ class StarTrek(TCPGate):
         with self.__receive_lock:
             return super().receive(length=length, remove=remove)
 
+    # Override
+    def peek(self, length: int) -> Optional[memoryview]:
+        with self.__receive_lock:
+            return super().peek(length=length)
+
+    # Override
+    def skip(self, length: int) -> int:
+        with self.__receive_lock:
+            return super().skip(length=length)
+
     # Override
     def setup(self):
         conn = self.connection
@@ -195,3 +244,191 @@ class StarTrek(TCPGate):
         conn = self.connection
         assert isinstance(conn, BaseConnection), 'connection error: %s' % conn
         conn.stop()
+
+
+class AsyncConnection(BaseConnection):
+    """
+        Non-blocking connection for the event loop
+        ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+        1. data is read only when the socket is readable;
+        2. data sent is buffered, the rest will be flushed when the socket is writable,
+           so a slow client will not stall other connections on the loop.
+    """
+
+    MAX_OUTPUT_LENGTH = 1 << 22  # 4 MB pending data, close the connection when exceeded
+
+    def __init__(self, sock: socket.socket):
+        super().__init__(sock=sock)
+        self.__output = bytearray()
+        self.__lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """ Length of data waiting to be sent """
+        return len(self.__output)
+
+    @property
+    def readable(self) -> bool:
+        """ Whether the receive cache has space """
+        return self.available < self.MAX_CACHE_LENGTH
+
+    # Override
+    def _receive(self) -> Optional[bytes]:
+        sock = self._sock
+        if sock is None:
+            return None
+        try:
+            # check whether data arrived or remote closed, without blocking
+            head = sock.recv(1, socket.MSG_PEEK)
+        except (BlockingIOError, InterruptedError):
+            return None
+        except socket.error as error:
+            Log.error('failed to receive data: %s' % error)
+            self.stop()
+            return None
+        if len(head) == 0:
+            # remote peer closed
+            self.stop()
+            return None
+        return super()._receive()
+
+    # Override
+    def send(self, data: bytes) -> int:
+        with self.__lock:
+            if len(self.__output) + len(data) > self.MAX_OUTPUT_LENGTH:
+                Log.error('too much data pending: %d + %d' % (len(self.__output), len(data)))
+                self.stop()
+                return -1
+            self.__output.extend(data)
+            if self.__flush() < 0:
+                return -1
+        return len(data)
+
+    def flush(self) -> int:
+        """
+        Send pending data when the socket is writable
+
+        :return: length sent, -1 on error
+        """
+        with self.__lock:
+            return self.__flush()
+
+    def __flush(self) -> int:
+        output = self.__output
+        if len(output) == 0:
+            return 0
+        sock = self.socket
+        if sock is None:
+            return -1
+        try:
+            sent = sock.send(output)
+        except (BlockingIOError, InterruptedError):
+            return 0
+        except socket.error as error:
+            Log.error('failed to send data: %d, %s' % (len(output), error))
+            self.stop()
+            return -1
+        del output[:sent]
+        # update the last sent time for the heartbeat states,
+        # BaseConnection keeps it private without a setter
+        self._BaseConnection__last_sent_time = time.time()
+        return sent
+
+
+class AsyncTrek(TCPGate):
+    """
+        Star Gate driven by event loop
+        ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+        No thread will be started for the connection, the event loop should
+        call 'read()' when the socket is readable, and then call 'process()'
+        until it returns False; the loop should stop reading while not 'readable',
+        and call 'write()' when the socket is writable while 'writable'.
+    """
+
+    @classmethod
+    def create(cls, sock: socket.socket) -> StarGate:
+        conn = AsyncConnection(sock=sock)
+        gate = AsyncTrek(connection=conn)
+        conn.delegate = gate
+        return gate
+
+    def __init__(self, connection: BaseConnection):
+        super().__init__(connection=connection)
+        self.__send_lock = threading.RLock()
+        self.__docker_ready = False
+
+    # Override
+    def send(self, data: bytes) -> bool:
+        # payloads may be sent from other threads (e.g.: dispatcher)
+        with self.__send_lock:
+            return super().send(data=data)
+
+    def read(self) -> bool:
+        """
+        Receive data from the readable socket into the connection cache
+
+        :return: False on connection closed
+        """
+        conn = self.connection
+        assert isinstance(conn, AsyncConnection), 'connection error: %s' % conn
+        # read until nothing more or the cache is full
+        while conn.process():
+            pass
+        return self.running
+
+    def write(self) -> bool:
+        """
+        Send pending data to the writable socket
+
+        :return: False on connection closed
+        """
+        conn = self.connection
+        assert isinstance(conn, AsyncConnection), 'connection error: %s' % conn
+        conn.flush()
+        return self.running
+
+    @property
+    def readable(self) -> bool:
+        """ Whether the connection cache has space for reading more data """
+        conn = self.connection
+        assert isinstance(conn, AsyncConnection), 'connection error: %s' % conn
+        return conn.readable
+
+    @property
+    def writable(self) -> bool:
+        """ Whether there is data waiting to be sent """
+        conn = self.connection
+        assert isinstance(conn, AsyncConnection), 'connection error: %s' % conn
+        return conn.pending > 0
+
+    # Override
+    def setup(self):
+        # NOTICE: 'StarGate.setup()' will wait for the docker in a run loop,
+        #         here we create the docker lazily in 'process()' instead.
+        Runner.setup(self)
+        conn = self.connection
+        assert isinstance(conn, BaseConnection), 'connection error: %s' % conn
+        conn.setup()
+
+    # Override
+    def finish(self):
+        super().finish()
+        conn = self.connection
+        assert isinstance(conn, BaseConnection), 'connection error: %s' % conn
+        conn.finish()
+
+    # Override
+    def process(self) -> bool:
+        # tick the connection status
+        if self.status != GateStatus.Connected:
+            return False
+        if not self.__docker_ready:
+            docker = self.docker
+            if docker is None:
+                # waiting for more data to decide the protocol
+                return False
+            docker.setup()
+            self.__docker_ready = True
+        return super().process()
@@ -28,7 +28,7 @@
 # SOFTWARE.
 # ==============================================================================
 
-from typing import Optional
+from typing import Optional, Union
 
 from startrek import Gate
 from startrek import Ship, ShipDelegate
@@ -52,9 +52,13 @@ def fetch_sn(body: bytes) -> Optional[bytes]:
 class MarsShip(StarShip):
     """ Star Ship with Mars Package """
 
-    def __init__(self, mars: NetMsg, priority: int = 0, delegate: Optional[ShipDelegate] = None):
+    def __init__(self, mars: NetMsg, priority: int = 0, delegate: Optional[ShipDelegate] = None,
+                 sn: Optional[bytes] = None, payload: Optional[bytes] = None):
         super().__init__(priority=priority, delegate=delegate)
         self.__mars = mars
+        # known when packing, no need to cut them from the body
+        self.__sn = sn
+        self.__payload = payload
 
     @property
     def mars(self) -> NetMsg:
@@ -68,15 +72,18 @@ class MarsShip(StarShip):
     # Override
     @property
     def sn(self) -> bytes:
-        sn = fetch_sn(body=self.__mars.body)
-        if sn is None:
-            return seq_to_sn(seq=self.__mars.head.seq)
-        else:
-            return sn
+        if self.__sn is None:
+            sn = fetch_sn(body=self.__mars.body)
+            if sn is None:
+                sn = seq_to_sn(seq=self.__mars.head.seq)
+            self.__sn = sn
+        return self.__sn
 
     # Override
     @property
     def payload(self) -> bytes:
+        if self.__payload is not None:
+            return self.__payload
         body = self.__mars.body
         sn = fetch_sn(body=body)
         if sn is None:
@@ -97,7 +104,7 @@ class MarsDocker(StarDocker):
         super().__init__(gate=gate)
 
     @classmethod
-    def parse_head(cls, buffer: bytes) -> Optional[NetMsgHead]:
+    def parse_head(cls, buffer: Union[bytes, memoryview]) -> Optional[NetMsgHead]:
         head = NetMsgHead.parse(data=buffer)
         if head is not None:
             if head.version != 200:
@@ -118,33 +125,33 @@ class MarsDocker(StarDocker):
     # noinspection PyMethodMayBeStatic
     def pack(self, payload: bytes, priority: int = 0, delegate: Optional[ShipDelegate] = None) -> StarShip:
         seq = NetMsgSeq.generate()
-        sn = seq.to_bytes(length=4, byteorder='big')
-        body = b'Mars SN:' + sn + b'\n' + payload
+        sn = seq_to_sn(seq=seq)
         # pack sn + payload
-        head = NetMsgHead.new(cmd=NetMsgHead.PUSH_MESSAGE, body_len=len(body))
-        mars = NetMsg.new(head=head, body=body)
-        return MarsShip(mars=mars, priority=priority, delegate=delegate)
+        mars = NetMsg.join(cmd=NetMsgHead.PUSH_MESSAGE, parts=[b'Mars SN:', sn, b'\n', payload])
+        return MarsShip(mars=mars, priority=priority, delegate=delegate, sn=sn, payload=payload)
 
     def __seek_header(self) -> Optional[NetMsgHead]:
-        buffer = self.gate.receive(length=512, remove=False)
-        if buffer is None:
+        gate = self.gate
+        view = gate.peek(length=512)
+        if view is None:
             # received nothing
             return None
-        head = self.parse_head(buffer=buffer)
+        head = self.parse_head(buffer=view)
         if head is None:
-            buf_len = len(buffer)
+            buf_len = len(view)
             # not a Mars package?
             if buf_len < self.MAX_HEAD_LENGTH:
                 # wait for more data
                 return None
             # locate next header
-            pos = buffer.find(NetMsgHead.MAGIC_CODE, NetMsgHead.MAGIC_CODE_OFFSET+1)
+            pos = bytes(view).find(NetMsgHead.MAGIC_CODE, NetMsgHead.MAGIC_CODE_OFFSET+1)
+            view.release()
             if pos > NetMsgHead.MAGIC_CODE_OFFSET:
                 # found next head, skip data before it
-                self.gate.receive(length=pos-NetMsgHead.MAGIC_CODE_OFFSET, remove=True)
+                gate.skip(length=pos-NetMsgHead.MAGIC_CODE_OFFSET)
             elif buf_len > 500:
                 # skip the whole buffer
-                self.gate.receive(length=buf_len, remove=True)
+                gate.skip(length=buf_len)
         return head
 
     def __receive_package(self) -> Optional[NetMsg]:
@@ -159,12 +166,14 @@ class MarsDocker(StarDocker):
         assert body_len >= 0, 'body length error: %d' % body_len
         pack_len = head.length + body_len
         # 2. receive data with 'head.length + body.length'
-        buffer = self.gate.receive(length=pack_len, remove=False)
-        if len(buffer) < pack_len:
+        gate = self.gate
+        view = gate.peek(length=pack_len)
+        if len(view) < pack_len:
             # waiting for more data
             return None
+        view.release()
         # receive package (remove from gate)
-        buffer = self.gate.receive(length=pack_len, remove=True)
+        buffer = gate.receive(length=pack_len, remove=True)
         if body_len > 0:
             body = buffer[head.length:]
         else:
@@ -215,9 +224,8 @@ class MarsDocker(StarDocker):
         # 3. response
         if cmd in [NetMsgHead.NOOP, NetMsgHead.SEND_MSG]:
             # pack with request.seq
-            head = NetMsgHead.new(cmd=cmd, seq=head.seq, body_len=len(res))
-            mars = NetMsg.new(head=head, body=res)
-            return MarsShip(mars=mars)
+            mars = NetMsg.join(cmd=cmd, seq=head.seq, parts=[res])
+            return MarsShip(mars=mars, payload=res)
         else:
             # pack and put into waiting queue
             return self.pack(payload=res, priority=StarShip.SLOWER)
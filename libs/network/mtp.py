@@ -100,25 +100,27 @@ class MTPDocker(StarDocker):
         return MTPShip(mtp=mtp, priority=priority, delegate=delegate)
 
     def __seek_header(self) -> Optional[Header]:
-        buffer = self.gate.receive(length=512, remove=False)
-        if buffer is None:
+        gate = self.gate
+        view = gate.peek(length=512)
+        if view is None:
             # received nothing
             return None
-        head = self.parse_head(buffer=buffer)
+        head = self.parse_head(buffer=bytes(view[:self.MAX_HEAD_LENGTH]))
         if head is None:
-            buf_len = len(buffer)
+            buf_len = len(view)
             # not a MTP package?
             if buf_len < self.MAX_HEAD_LENGTH:
                 # wait for more data
                 return None
             # locate next header
-            pos = buffer.find(Header.MAGIC_CODE, 1)  # MAGIC_CODE_OFFSET = 0
+            pos = bytes(view).find(Header.MAGIC_CODE, 1)  # MAGIC_CODE_OFFSET = 0
+            view.release()
             if pos > 0:
                 # found next head(starts with 'DIM'), skip data before it
-                self.gate.receive(length=pos, remove=True)
+                gate.skip(length=pos)
             elif buf_len > 500:
                 # skip the whole buffer
-                self.gate.receive(length=buf_len, remove=True)
+                gate.skip(length=buf_len)
         return head
 
     def __receive_package(self) -> Optional[Package]:
@@ -131,12 +133,14 @@ class MTPDocker(StarDocker):
         assert body_len >= 0, 'body length error: %d' % body_len
         pack_len = head.length + body_len
         # 2. receive data with 'head.length + body.length'
-        buffer = self.gate.receive(length=pack_len, remove=False)
-        if len(buffer) < pack_len:
+        gate = self.gate
+        view = gate.peek(length=pack_len)
+        if len(view) < pack_len:
             # waiting for more data
             return None
+        view.release()
         # receive package (remove from gate)
-        buffer = self.gate.receive(length=pack_len, remove=True)
+        buffer = gate.receive(length=pack_len, remove=True)
         data = Data(data=buffer)
         body = data.slice(start=head.length)
         return Package(data=data, head=head, body=body)
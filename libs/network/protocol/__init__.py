@@ -28,14 +28,14 @@
 # SOFTWARE.
 # ==============================================================================
 
-from .ws import WebSocket
+from .ws import WebSocket, WebSocketFrame, WebSocketParser, PerMessageDeflate
 from .mars import NetMsg, NetMsgHead, NetMsgSeq
 
 
 __all__ = [
 
     # Web Socket
-    'WebSocket',
+    'WebSocket', 'WebSocketFrame', 'WebSocketParser', 'PerMessageDeflate',
 
     # Tencent Mars
     'NetMsg', 'NetMsgHead', 'NetMsgSeq',
@@ -33,24 +33,19 @@
     ~~~~~~~~~~~~~~~~~~~~~
 """
 
-import binascii
-import random
+import os
+import struct
 import threading
-from typing import Optional
-
-
-def read_int(data, pos):
-    return int.from_bytes(bytes=data[pos:pos + 4], byteorder='big')
-
-
-def append_int(data, i: int):
-    return data + i.to_bytes(length=4, byteorder='big')
+from typing import Optional, Union, Sequence
 
 
 class NetMsgHead:
 
     MIN_HEAD_LEN = 4 + 4 + 4 + 4 + 4
 
+    # head_length, version, cmd, seq, body_len
+    HEAD = struct.Struct('>IIIII')
+
     MAGIC_CODE = b'\x00\x00\x00\xc8\x00\x00\x00'  # version = 0xC8
     MAGIC_CODE_OFFSET = 4
 
@@ -130,45 +125,32 @@ class NetMsgHead:
         else:
             head_len = cls.MIN_HEAD_LEN
         # prepare data
-        data = b''
-        data = append_int(data, head_len)
-        data = append_int(data, version)
-        data = append_int(data, cmd)
-        data = append_int(data, seq)
-        data = append_int(data, body_len)
+        data = cls.HEAD.pack(head_len, version, cmd, seq, body_len)
         if options:
             data = data + options
         return cls(data=data, version=version, cmd=cmd, seq=seq, options=options, body_len=body_len)
 
     @classmethod
-    def parse(cls, data: bytes):
+    def parse(cls, data: Union[bytes, memoryview]):
         # check data length
         data_len = len(data)
         if data_len < cls.MIN_HEAD_LEN:
             # raise ValueError('Mars data length error: %d' % data_len)
             return None
         # get fields
-        head_len = read_int(data, 0)
-        version = read_int(data, 4)
-        cmd = read_int(data, 8)
-        seq = read_int(data, 12)
-        body_len = read_int(data, 16)
+        head_len, version, cmd, seq, body_len = cls.HEAD.unpack_from(data)
         # check head length
         if data_len < head_len or head_len < cls.MIN_HEAD_LEN:
             # raise ValueError('Mars head length error: %d' % head_len)
             return None
-        elif data_len > head_len:
-            # cut head
-            data = data[:head_len]
+        else:
+            # cut head (copy it, the data may be a memoryview of the receive buffer)
+            data = bytes(data[:head_len])
         # get options
         if head_len == cls.MIN_HEAD_LEN:
             options = None
         else:
             options = data[cls.MIN_HEAD_LEN:]
-        # check body length
-        if body_len < 0:
-            # raise ValueError('Mars body length error: %d' % body_len)
-            return None
         return cls(data=data, version=version, cmd=cmd, seq=seq, options=options, body_len=body_len)
 
 
@@ -179,7 +161,7 @@ class NetMsg:
 
         :param data: msg pack data (if data is None, use other parameters to create msg pack)
         :param head: msg pack head data (if head is None, use other parameters to create msg head)
-        :param body: msg pack body
+        :param body: msg pack body (if body is None, cut from data when needed)
         :return:
         """
         super(NetMsg, self).__init__()
@@ -201,6 +183,10 @@ class NetMsg:
 
     @property
     def body(self) -> Optional[bytes]:
+        if self.__body is None:
+            head = self.__head
+            if head.body_length > 0:
+                self.__body = self.__data[head.length:head.length + head.body_length]
         return self.__body
 
     @classmethod
@@ -211,6 +197,24 @@ class NetMsg:
             data = head.data + body
         return cls(data=data, head=head, body=body)
 
+    @classmethod
+    def join(cls, cmd: int, seq: int = 0, parts: Sequence[bytes] = ()):
+        """
+        Create msg pack with body parts, the parts will be copied only once
+        (into the pack data), and the body will be cut from it when needed
+
+        :param cmd:   cmd id
+        :param seq:   serial number
+        :param parts: body parts
+        :return: NetMsg
+        """
+        body_len = 0
+        for item in parts:
+            body_len += len(item)
+        head = NetMsgHead.new(cmd=cmd, seq=seq, body_len=body_len)
+        data = b''.join([head.data, *parts])
+        return cls(data=data, head=head)
+
     @classmethod
     def parse(cls, data: bytes):
         head = NetMsgHead.parse(data=data)
@@ -237,16 +241,13 @@ class NetMsg:
 
 
 def random_bytes(length: int) -> bytes:
-    r = range(length << 1)
-    # noinspection PyUnusedLocal
-    a = ''.join([random.choice('0123456789ABCDEF') for i in r])
-    return binascii.a2b_hex(a)
+    return os.urandom(length)
 
 
 class NetMsgSeq:
 
     __number_lock = threading.Lock()
-    __number = int.from_bytes(bytes=random_bytes(4), byteorder='big')
+    __number = int.from_bytes(bytes=random_bytes(4), byteorder='big')  # start from a random number
 
     @classmethod
     def generate(cls) -> int:
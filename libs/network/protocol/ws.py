@@ -36,12 +36,41 @@
 
 import hashlib
 import struct
+import threading
+import zlib
+from typing import Optional, Union, List
 
 from dimp import base64_encode
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def unmask(payload: Union[bytes, memoryview], mask: bytes) -> bytes:
+    """ XOR payload with the 4 bytes masking-key, word by word """
+    length = len(payload)
+    if length == 0:
+        return b''
+    key = (mask * ((length >> 2) + 1))[:length]
+    if numpy is not None:
+        data = numpy.frombuffer(payload, dtype=numpy.uint8)
+        return numpy.bitwise_xor(data, numpy.frombuffer(key, dtype=numpy.uint8)).tobytes()
+    data = int.from_bytes(payload, byteorder='little') ^ int.from_bytes(key, byteorder='little')
+    return data.to_bytes(length, byteorder='little')
+
 
 class WebSocket:
 
+    # op codes
+    CONTINUATION = 0x0
+    TEXT = 0x1
+    BINARY = 0x2
+    CLOSE = 0x8
+    PING = 0x9
+    PONG = 0xA
+
     #
     #   Protocol: WebSocket Handshake
     #
@@ -55,18 +84,32 @@ class WebSocket:
     ws_suffix = b'\r\n\r\n'
 
     @classmethod
-    def handshake(cls, stream: bytes) -> bytes:
-        pos1 = stream.find(b'Sec-WebSocket-Key:')
-        pos1 += len('Sec-WebSocket-Key:')
-        pos2 = stream.find(b'\r\n', pos1)
-        key = stream[pos1:pos2].strip()
+    def handshake(cls, stream: bytes, extensions: Optional[str] = None) -> bytes:
+        key = cls.header(stream=stream, name=b'Sec-WebSocket-Key')
         sec = hashlib.sha1(key + cls.ws_magic).digest()
         sec = base64_encode(sec)
-        return cls.ws_prefix + bytes(sec, 'UTF-8') + cls.ws_suffix
+        res = cls.ws_prefix + bytes(sec, 'UTF-8')
+        if extensions is not None:
+            res += b'\r\nSec-WebSocket-Extensions: ' + bytes(extensions, 'UTF-8')
+        return res + cls.ws_suffix
+
+    @classmethod
+    def header(cls, stream: bytes, name: bytes) -> Optional[bytes]:
+        """ Get field value from handshake request (case-insensitive name) """
+        pos1 = stream.lower().find(b'\r\n' + name.lower() + b':')
+        if pos1 < 0:
+            return None
+        pos1 += len(name) + 3
+        pos2 = stream.find(b'\r\n', pos1)
+        if pos2 < 0:
+            pos2 = len(stream)
+        return stream[pos1:pos2].strip()
 
     @classmethod
     def is_handshake(cls, stream: bytes) -> bool:
-        return stream.find(b'Sec-WebSocket-Key') > 0
+        """ Check whether the whole handshake request received """
+        pos = stream.find(b'\r\n\r\n')
+        return pos > 0 and cls.header(stream=stream[:pos], name=b'Sec-WebSocket-Key') is not None
 
     """
         RFC: https://tools.ietf.org/html/rfc6455#section-5.2
@@ -91,116 +134,322 @@ class WebSocket:
         +---------------------------------------------------------------+
     """
     @classmethod
-    def parse(cls, stream: bytes) -> (bytes, bytes):
+    def parse(cls, stream: Union[bytes, memoryview]) -> (Optional[bytes], Union[bytes, memoryview]):
         """
         Parse WebSocket data stream
 
         :param stream: data stream
         :return: (payload, remaining_data)
         """
-        stream_len = len(stream)
-        if stream_len < 2:
-            return None, stream
-        data = b''
+        parser = WebSocketParser()
         pos = 0
         while True:
-            if stream_len < pos + 2:
-                # self.info('incomplete ws package for op code: %d' % stream_len)
-                return None, stream
-            # 1. check whether a continuation frame
-            ch0 = stream[pos+0]
-            # fin: indicates that this is the final fragment in a message.
-            # op: 0 - denotes a continuation frame
-            fin = ch0 >> 7
-            op = ch0 & 0x0F
-            # 2. get payload length
-            ch1 = stream[pos+1]
-            mask = ch1 >> 7
-            msg_len = ch1 & 0x7F
-            if msg_len == 126:
-                if stream_len < pos + 4:
-                    # self.info('incomplete ws package for msg len: %d' % stream_len)
-                    return None, stream
-                b2 = stream[pos+2]
-                b3 = stream[pos+3]
-                msg_len = (b2 << 8) | b3
-                pos += 4
-            elif msg_len == 127:
-                if stream_len < pos + 10:
-                    # self.info('incomplete ws package for msg len: %d' % stream_len)
-                    return None, stream
-                b2 = stream[pos+2]
-                b3 = stream[pos+3]
-                b4 = stream[pos+4]
-                b5 = stream[pos+5]
-                b6 = stream[pos+6]
-                b7 = stream[pos+7]
-                b8 = stream[pos+8]
-                b9 = stream[pos+9]
-                msg_len = b2 << 56 | b3 << 48 | b4 << 40 | b5 << 32 | b6 << 24 | b7 << 16 | b8 << 8 | b9
-                pos += 10
-            else:
-                pos += 2
-            # 3. get masking-key
-            if mask == 1:
-                if stream_len < pos + 4:
-                    # self.info('incomplete ws package for mask: %d' % stream_len)
-                    return None, stream
-                mask = stream[pos:pos+4]
-                pos += 4
-            else:
-                mask = None
-            # 4. get payload
-            if stream_len < pos + msg_len:
-                # self.info('incomplete ws package for payload: %d' % stream_len)
+            count, frame = parser.parse(stream=stream[pos:])
+            if count == 0:
+                # incomplete
                 return None, stream
-            payload = stream[pos:pos+msg_len]
-            pos += msg_len
-            if mask is None:
-                content = payload
-            else:
-                content = bytearray()
-                for i, d in enumerate(payload):
-                    content.append(d ^ mask[i % 4])
-            # 5. check op_code
-            if op == 0:
-                data += content
-            elif op == 1:
-                # TEXT
-                data += content
-            elif op == 2:
-                # BINARY
-                data += content
-            elif op == 8:
-                # TODO: CLOSE
-                pass
-            elif op == 9:
-                # TODO: PING
-                pass
-            elif op == 10:
-                # TODO: PONG
-                pass
-            else:
-                # self.error('ws op error: %d => %s' % (op, stream))
+            pos += count
+            if parser.error is not None:
                 return None, b''
-            # 6. check final fragment
-            if fin == 1 or op == 0:
-                # cut the received package(s) and return the remaining
-                stream = stream[pos:]
-                break
-        # self.info('received ws payload len: %d' % len(data))
-        return data, stream
+            if frame is not None and frame.opcode in [WebSocket.TEXT, WebSocket.BINARY]:
+                return frame.payload, stream[pos:]
 
     @classmethod
-    def pack(cls, payload: bytes) -> bytes:
-        head = struct.pack('B', 129)
+    def pack(cls, payload: bytes, opcode: int = TEXT, compressed: bool = False) -> bytes:
+        ch0 = 0xC0 | opcode if compressed else 0x80 | opcode  # FIN, RSV1 (compressed)
         msg_len = len(payload)
         if msg_len < 126:
-            head += struct.pack('B', msg_len)
+            head = struct.pack('!BB', ch0, msg_len)
         elif msg_len <= (2 ** 16 - 1):
-            head += struct.pack('!BH', 126, msg_len)
+            head = struct.pack('!BBH', ch0, 126, msg_len)
         elif msg_len <= (2 ** 64 - 1):
-            head += struct.pack('!BQ', 127, msg_len)
+            head = struct.pack('!BBQ', ch0, 127, msg_len)
         else:
             raise ValueError('message is too long: %d' % msg_len)
         return head + payload
+
+
+class WebSocketFrame:
+    """ Control frame, or a data message (with fragments joined) """
+
+    def __init__(self, opcode: int, payload: bytes, compressed: bool = False):
+        super().__init__()
+        self.opcode = opcode
+        self.payload = payload
+        self.compressed = compressed  # RSV1 set in the first frame
+
+
+class WebSocketParser:
+    """
+        Incremental parser for one connection
+
+            1. the frame head is kept until the whole frame received,
+               so it won't be parsed again while waiting for the payload;
+            2. fragments of a data message are kept until the final one,
+               control frames in the middle are returned at once.
+    """
+
+    MAX_HEAD_LENGTH = 14                     # 2 + 8 (extended length) + 4 (masking-key)
+    MAX_MESSAGE_LENGTH = 16 * 1024 * 1024    # 16 MB
+
+    def __init__(self):
+        super().__init__()
+        self.__head: Optional[tuple] = None  # (fin, rsv, op, mask, payload_length, head_length)
+        self.__opcode = 0                    # op code of the fragmented message
+        self.__compressed = False            # RSV1 of the fragmented message
+        self.__fragments: List[bytes] = []
+        self.__fragments_length = 0
+        self.__error: Optional[str] = None
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.__error
+
+    @property
+    def expected(self) -> int:
+        """ Length of data needed for parsing next frame """
+        head = self.__head
+        if head is None:
+            return self.MAX_HEAD_LENGTH
+        return head[5] + head[4]
+
+    @classmethod
+    def parse_head(cls, stream: Union[bytes, memoryview]) -> Optional[tuple]:
+        stream_len = len(stream)
+        if stream_len < 2:
+            return None
+        ch0 = stream[0]
+        ch1 = stream[1]
+        fin = ch0 >> 7
+        rsv = (ch0 >> 4) & 0x07  # RSV1, RSV2, RSV3
+        op = ch0 & 0x0F
+        msg_len = ch1 & 0x7F
+        pos = 2
+        if msg_len == 126:
+            if stream_len < 4:
+                return None
+            msg_len = int.from_bytes(stream[2:4], byteorder='big')
+            pos = 4
+        elif msg_len == 127:
+            if stream_len < 10:
+                return None
+            msg_len = int.from_bytes(stream[2:10], byteorder='big')
+            pos = 10
+        if ch1 >> 7:
+            if stream_len < pos + 4:
+                return None
+            mask = bytes(stream[pos:pos+4])
+            pos += 4
+        else:
+            mask = None
+        return fin, rsv, op, mask, msg_len, pos
+
+    def __fail(self, error: str, length: int) -> (int, None):
+        self.__error = error
+        self.__head = None
+        self.__fragments = []
+        self.__fragments_length = 0
+        return length, None
+
+    def parse(self, stream: Union[bytes, memoryview]) -> (int, Optional[WebSocketFrame]):
+        """
+        Parse one frame from the head of data stream
+
+        :param stream: received data
+        :return: (length of data used, control frame or completed message)
+        """
+        head = self.__head
+        if head is None:
+            head = self.parse_head(stream=stream)
+            if head is None:
+                # waiting for more data
+                return 0, None
+            self.__head = head
+        fin, rsv, op, mask, msg_len, pos = head
+        if rsv & 0x03:
+            # no extension negotiated for RSV2 & RSV3
+            return self.__fail(error='RSV error: %d' % rsv, length=len(stream))
+        if rsv and (op >= WebSocket.CLOSE or op == WebSocket.CONTINUATION):
+            return self.__fail(error='RSV1 error: %d' % op, length=len(stream))
+        if op not in [WebSocket.CONTINUATION, WebSocket.TEXT, WebSocket.BINARY,
+                      WebSocket.CLOSE, WebSocket.PING, WebSocket.PONG]:
+            return self.__fail(error='op code error: %d' % op, length=len(stream))
+        if op >= WebSocket.CLOSE and (fin == 0 or msg_len > 125):
+            # control frames must not be fragmented, and payload length <= 125
+            return self.__fail(error='control frame error: %d, fin=%d, len=%d' % (op, fin, msg_len),
+                               length=len(stream))
+        if msg_len > self.MAX_MESSAGE_LENGTH or self.__fragments_length + msg_len > self.MAX_MESSAGE_LENGTH:
+            return self.__fail(error='message too long: %d' % (self.__fragments_length + msg_len), length=len(stream))
+        end = pos + msg_len
+        if len(stream) < end:
+            # waiting for the payload
+            return 0, None
+        self.__head = None
+        if mask is None:
+            payload = bytes(stream[pos:end])
+        else:
+            payload = unmask(payload=stream[pos:end], mask=mask)
+        # control frames
+        if op >= WebSocket.CLOSE:
+            return end, WebSocketFrame(opcode=op, payload=payload)
+        # data frames
+        if op != WebSocket.CONTINUATION:
+            # first fragment
+            self.__opcode = op
+            self.__compressed = rsv == 0x04
+            self.__fragments = []
+            self.__fragments_length = 0
+        self.__fragments.append(payload)
+        self.__fragments_length += msg_len
+        if fin == 0:
+            # waiting for next fragment
+            return end, None
+        fragments = self.__fragments
+        self.__fragments = []
+        self.__fragments_length = 0
+        if len(fragments) == 1:
+            payload = fragments[0]
+        else:
+            payload = b''.join(fragments)
+        return end, WebSocketFrame(opcode=self.__opcode, payload=payload, compressed=self.__compressed)
+
+
+class PerMessageDeflate:
+    """
+        Compression Extension for WebSocket
+        ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+        RFC: https://tools.ietf.org/html/rfc7692
+
+            1. messages shorter than 'THRESHOLD' are sent uncompressed;
+            2. the server compressor is limited by 'MAX_WINDOW_BITS' & 'MEMORY_LEVEL';
+            3. decompressed messages are limited in 'MAX_MESSAGE_LENGTH'.
+
+        NOTICE: payloads may be sent directly by other threads, so the server
+                context takeover is disabled by default; enable it only when
+                all messages are packed & sent in order by one thread.
+    """
+
+    NAME = 'permessage-deflate'
+
+    THRESHOLD = 256                 # bytes
+    LEVEL = 6                       # zlib compress level (1-9)
+    MEMORY_LEVEL = 5                # zlib memLevel (1-9), 5: 16 KB for the compressor state
+    MAX_WINDOW_BITS = 12            # 9-15, 12: 16 KB for the compressor window
+    SERVER_CONTEXT_TAKEOVER = False
+    MAX_MESSAGE_LENGTH = WebSocketParser.MAX_MESSAGE_LENGTH
+
+    TAIL = b'\x00\x00\xff\xff'
+
+    def __init__(self, server_no_context_takeover: bool, client_no_context_takeover: bool,
+                 server_max_window_bits: int, server_max_window_bits_offered: bool):
+        super().__init__()
+        self.__server_no_context_takeover = server_no_context_takeover
+        self.__client_no_context_takeover = client_no_context_takeover
+        self.__server_max_window_bits = server_max_window_bits
+        self.__server_max_window_bits_offered = server_max_window_bits_offered
+        self.__compressor = None
+        self.__decompressor = None
+        self.__lock = threading.Lock()
+
+    @property
+    def response(self) -> str:
+        """ Value for 'Sec-WebSocket-Extensions' in handshake response """
+        params = [self.NAME]
+        if self.__server_no_context_takeover:
+            params.append('server_no_context_takeover')
+        if self.__client_no_context_takeover:
+            params.append('client_no_context_takeover')
+        if self.__server_max_window_bits_offered:
+            # not offered: compress with a smaller window silently, the client inflates it with 15 bits
+            params.append('server_max_window_bits=%d' % self.__server_max_window_bits)
+        return '; '.join(params)
+
+    @classmethod
+    def negotiate(cls, offers: Optional[bytes]) -> Optional:
+        """
+        Accept the first valid 'permessage-deflate' offer
+
+        :param offers: value of 'Sec-WebSocket-Extensions' in handshake request
+        :return: None on not offered
+        """
+        if offers is None:
+            return None
+        for offer in offers.decode('utf-8', errors='ignore').split(','):
+            params = [item.strip() for item in offer.split(';')]
+            if params[0].lower() != cls.NAME:
+                continue
+            info = {}
+            for item in params[1:]:
+                pair = item.split('=', 1)
+                key = pair[0].strip().lower()
+                if key in info:
+                    # duplicated parameter, decline this offer
+                    info = None
+                    break
+                info[key] = pair[1].strip().strip('"') if len(pair) == 2 else None
+            if info is None:
+                continue
+            deflate = cls.__accept(info=info)
+            if deflate is not None:
+                return deflate
+
+    @classmethod
+    def __accept(cls, info: dict) -> Optional:
+        server_bits = 15
+        offered = 'server_max_window_bits' in info
+        for key, value in info.items():
+            if key in ['server_no_context_takeover', 'client_no_context_takeover']:
+                if value is not None:
+                    return None
+            elif key == 'server_max_window_bits':
+                if value is None or not value.isdigit() or not 8 <= int(value) <= 15:
+                    return None
+                server_bits = int(value)
+                if server_bits == 8:
+                    # zlib doesn't support raw deflate with 8 bits window,
+                    # and the response must not be larger than the offer
+                    return None
+            elif key == 'client_max_window_bits':
+                # the server may not respond it, then the client will use 15
+                if value is not None and (not value.isdigit() or not 8 <= int(value) <= 15):
+                    return None
+            else:
+                # unknown parameter
+                return None
+        server_bits = min(server_bits, cls.MAX_WINDOW_BITS)
+        no_takeover = 'server_no_context_takeover' in info or not cls.SERVER_CONTEXT_TAKEOVER
+        return cls(server_no_context_takeover=no_takeover,
+                   client_no_context_takeover='client_no_context_takeover' in info,
+                   server_max_window_bits=server_bits, server_max_window_bits_offered=offered)
+
+    def compress(self, payload: bytes) -> Optional[bytes]:
+        """ Compress message payload, return None when it's too short """
+        if len(payload) < self.THRESHOLD:
+            return None
+        with self.__lock:
+            compressor = self.__compressor
+            if compressor is None:
+                compressor = zlib.compressobj(self.LEVEL, zlib.DEFLATED, -self.__server_max_window_bits,
+                                              self.MEMORY_LEVEL)
+                if not self.__server_no_context_takeover:
+                    self.__compressor = compressor
+            data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data.endswith(self.TAIL):
+            data = data[:-4]
+        return data
+
+    def decompress(self, payload: bytes) -> bytes:
+        """ Decompress message payload, raise ValueError when it's too long """
+        with self.__lock:
+            decompressor = self.__decompressor
+            if decompressor is None:
+                decompressor = zlib.decompressobj(-15)
+                if not self.__client_no_context_takeover:
+                    self.__decompressor = decompressor
+            data = decompressor.decompress(payload + self.TAIL, self.MAX_MESSAGE_LENGTH)
+            if len(decompressor.unconsumed_tail) > 0:
+                # drop the context
+                self.__decompressor = None
+                raise ValueError('message too long: > %d' % self.MAX_MESSAGE_LENGTH)
+        return data
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+#
+#   Star Gate: Interfaces for network connection
+#
+#                                Written in 2021 by Moky <albert.moky@gmail.com>
+#
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2021 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Async TCP Server
+    ~~~~~~~~~~~~~~~~
+
+    One event loop for all connections, instead of one thread for each
+"""
+
+import asyncio
+import socket
+import traceback
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Set
+
+from ..utils import Logging
+
+
+class AsyncRequestHandler(ABC):
+    """
+        Handler for each connection driven by the event loop
+
+        @abstract properties:
+            running()
+
+        @abstract methods:
+            - setup()
+            - finish()
+            - read()
+            - process()
+            - tick()
+
+        override 'readable', 'writable' and 'write()' for non-blocking sending
+    """
+
+    def __init__(self, request: socket.socket, client_address: tuple, server):
+        super().__init__()
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+
+    def wakeup(self):
+        """ Ask the event loop to process this handler (thread safe) """
+        self.server.wakeup(handler=self)
+
+    @property
+    def running(self) -> bool:
+        """ Check whether the connection still alive """
+        raise NotImplemented
+
+    @abstractmethod
+    def setup(self):
+        """ Prepare for handling """
+        raise NotImplemented
+
+    @abstractmethod
+    def finish(self):
+        """ Cleanup after handled """
+        raise NotImplemented
+
+    @abstractmethod
+    def read(self) -> bool:
+        """
+        Receive data when the socket is readable
+
+        :return: False on connection closed
+        """
+        raise NotImplemented
+
+    @property
+    def readable(self) -> bool:
+        """ Whether ready for reading more data (False to pause reading) """
+        return True
+
+    @property
+    def writable(self) -> bool:
+        """ Whether there is data waiting for the socket writable """
+        return False
+
+    def write(self) -> bool:
+        """
+        Send pending data when the socket is writable
+
+        :return: False on connection closed
+        """
+        return True
+
+    @abstractmethod
+    def process(self) -> bool:
+        """
+        Process received data and waiting tasks
+
+        :return: False on nothing to do
+        """
+        raise NotImplemented
+
+    @abstractmethod
+    def tick(self) -> bool:
+        """
+        Periodic checking (heartbeat, cached messages, ...)
+
+        :return: False on connection closed
+        """
+        raise NotImplemented
+
+
+class AsyncTCPServer(Logging):
+
+    TICK_INTERVAL = 2   # seconds for checking heartbeats
+    MAX_PROCESSES = 64  # max processes for one handler before yielding to others
+
+    def __init__(self, server_address: tuple, RequestHandlerClass):
+        super().__init__()
+        self.server_address = server_address
+        self.RequestHandlerClass = RequestHandlerClass
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__running = False
+        self.__handlers: Dict[AsyncRequestHandler, int] = {}  # handler -> fileno
+        self.__paused: Set[AsyncRequestHandler] = set()   # handlers not reading (cache full)
+        self.__writing: Set[AsyncRequestHandler] = set()  # handlers waiting for writable
+
+    @property
+    def count(self) -> int:
+        return len(self.__handlers)
+
+    def serve_forever(self):
+        asyncio.run(self.__serve())
+
+    def shutdown(self):
+        self.__running = False
+
+    def wakeup(self, handler: AsyncRequestHandler):
+        loop = self.__loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self.__drive, handler)
+
+    async def __serve(self):
+        loop = asyncio.get_running_loop()
+        self.__loop = loop
+        self.__running = True
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.server_address)
+        sock.listen(socket.SOMAXCONN)
+        sock.setblocking(False)
+        loop.add_reader(sock.fileno(), self.__accept, sock)
+        try:
+            while self.__running:
+                await asyncio.sleep(self.TICK_INTERVAL)
+                for handler in list(self.__handlers.keys()):
+                    self.__tick(handler=handler)
+        finally:
+            loop.remove_reader(sock.fileno())
+            for handler in list(self.__handlers.keys()):
+                self.__close(handler=handler)
+            sock.close()
+            self.__loop = None
+
+    def __accept(self, sock: socket.socket):
+        try:
+            request, client_address = sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        # never block the loop: read when readable, and buffer the data unsent until writable
+        request.setblocking(False)
+        try:
+            handler = self.RequestHandlerClass(request=request, client_address=client_address, server=self)
+            handler.setup()
+        except Exception as error:
+            self.error('failed to setup handler for %s: %s' % (client_address, error))
+            traceback.print_exc()
+            request.close()
+            return
+        fileno = request.fileno()
+        self.__handlers[handler] = fileno
+        self.__loop.add_reader(fileno, self.__read, handler)
+        self.__drive(handler=handler)
+
+    def __close(self, handler: AsyncRequestHandler):
+        fileno = self.__handlers.pop(handler, None)
+        if fileno is None:
+            # already closed
+            return
+        for remove in [self.__loop.remove_reader, self.__loop.remove_writer]:
+            try:
+                remove(fileno)
+            except OSError:
+                # socket already closed by the connection
+                pass
+        self.__paused.discard(handler)
+        self.__writing.discard(handler)
+        try:
+            handler.finish()
+        except Exception as error:
+            self.error('failed to finish handler for %s: %s' % (handler.client_address, error))
+            traceback.print_exc()
+
+    def __read(self, handler: AsyncRequestHandler):
+        try:
+            alive = handler.read()
+        except Exception as error:
+            self.error('failed to read data from %s: %s' % (handler.client_address, error))
+            traceback.print_exc()
+            alive = False
+        if alive:
+            self.__drive(handler=handler)
+        else:
+            self.__close(handler=handler)
+
+    def __write(self, handler: AsyncRequestHandler):
+        try:
+            alive = handler.write()
+        except Exception as error:
+            self.error('failed to write data to %s: %s' % (handler.client_address, error))
+            traceback.print_exc()
+            alive = False
+        if alive:
+            self.__drive(handler=handler)
+        else:
+            self.__close(handler=handler)
+
+    def __watch(self, handler: AsyncRequestHandler):
+        """ Update the events to watch for the handler's socket """
+        fileno = self.__handlers.get(handler)
+        if fileno is None:
+            # closed
+            return
+        loop = self.__loop
+        # stop reading while the cache is full, until processed
+        if handler.readable:
+            if handler in self.__paused:
+                self.__paused.discard(handler)
+                loop.add_reader(fileno, self.__read, handler)
+        elif handler not in self.__paused:
+            self.__paused.add(handler)
+            loop.remove_reader(fileno)
+        # wait for writable while data pending
+        if handler.writable:
+            if handler not in self.__writing:
+                self.__writing.add(handler)
+                loop.add_writer(fileno, self.__write, handler)
+        elif handler in self.__writing:
+            self.__writing.discard(handler)
+            loop.remove_writer(fileno)
+
+    def __tick(self, handler: AsyncRequestHandler):
+        try:
+            alive = handler.tick()
+        except Exception as error:
+            self.error('failed to tick handler for %s: %s' % (handler.client_address, error))
+            traceback.print_exc()
+            alive = False
+        if alive:
+            self.__drive(handler=handler)
+        else:
+            self.__close(handler=handler)
+
+    def __drive(self, handler: AsyncRequestHandler):
+        if handler not in self.__handlers:
+            # closed
+            return
+        try:
+            for _ in range(self.MAX_PROCESSES):
+                if not handler.process():
+                    break
+            else:
+                # still busy, continue after other handlers
+                self.__loop.call_soon(self.__drive, handler)
+            alive = handler.running
+        except Exception as error:
+            self.error('failed to process handler for %s: %s' % (handler.client_address, error))
+            traceback.print_exc()
+            alive = False
+        if alive:
+            try:
+                self.__watch(handler=handler)
+            except OSError as error:
+                # socket closed by another thread
+                self.error('failed to watch socket of %s: %s' % (handler.client_address, error))
+                alive = False
+        if not alive:
+            # connection closed while sending, remove it before the 'fileno' reused
+            self.__close(handler=handler)
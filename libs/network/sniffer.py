@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+#   Star Gate: Interfaces for network connection
+#
+#                                Written in 2021 by Moky <albert.moky@gmail.com>
+#
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2021 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Protocol Sniffer
+    ~~~~~~~~~~~~~~~~
+
+    Classify a new connection by the magic code in the first bytes received
+"""
+
+from typing import Optional, Union, List, Tuple
+
+
+class ProtocolSniffer:
+
+    def __init__(self):
+        super().__init__()
+        self.__protocols: List[Tuple[int, bytes, type]] = []  # (offset, magic, docker class)
+        self.__length = 0
+
+    @property
+    def length(self) -> int:
+        """ Bytes needed to classify all protocols """
+        return self.__length
+
+    def register(self, magic: bytes, docker_class: type, offset: int = 0):
+        """
+        Register protocol with magic code
+
+        :param magic:        magic code
+        :param docker_class: docker for this protocol
+        :param offset:       position of the magic code in the first package
+        """
+        self.__protocols.append((offset, magic, docker_class))
+        self.__length = max(self.__length, offset + len(magic))
+
+    def classify(self, data: Union[bytes, memoryview]) -> Optional[type]:
+        """
+        Check magic codes of all protocols in the first bytes received
+
+        :param data: first bytes received
+        :return: docker class; None on waiting for more data
+        :raise ValueError: on unknown protocol
+        """
+        data_len = len(data)
+        waiting = False
+        for offset, magic, docker_class in self.__protocols:
+            end = offset + len(magic)
+            if data_len >= end:
+                if data[offset:end] == magic:
+                    return docker_class
+            elif data_len <= offset or magic.startswith(data[offset:]):
+                # partially matched, waiting for more data
+                waiting = True
+        if waiting:
+            return None
+        raise ValueError('unknown protocol: %s' % bytes(data[:self.__length]))
@@ -28,6 +28,7 @@
 # SOFTWARE.
 # ==============================================================================
 
+import zlib
 from typing import Optional
 
 from startrek import Gate
@@ -35,24 +36,40 @@ from startrek import Ship, ShipDelegate
 from startrek import StarShip
 from startrek import StarDocker
 
-from .protocol import WebSocket
+from ..utils import Log
+
+from .protocol import WebSocket, WebSocketFrame, WebSocketParser, PerMessageDeflate
 
 
 def seq_to_sn(seq: int) -> bytes:
     return seq.to_bytes(length=4, byteorder='big')
 
 
+def pack_frame(payload: bytes, deflate: Optional[PerMessageDeflate]) -> bytes:
+    if deflate is not None:
+        data = deflate.compress(payload=payload)
+        if data is not None:
+            return WebSocket.pack(payload=data, compressed=True)
+    return WebSocket.pack(payload=payload)
+
+
 class WSShip(StarShip):
     """ Star Ship with WebSocket Package """
 
-    def __init__(self, package: bytes, payload: bytes, priority: int = 0, delegate: Optional[ShipDelegate] = None):
+    def __init__(self, package: Optional[bytes], payload: bytes, priority: int = 0,
+                 delegate: Optional[ShipDelegate] = None, deflate: Optional[PerMessageDeflate] = None):
         super().__init__(priority=priority, delegate=delegate)
         self.__package = package
         self.__payload = payload
+        self.__deflate = deflate
 
     @property
     def package(self) -> bytes:
         """ Get request will be sent to remote star """
+        if self.__package is None:
+            # pack when sending, so compressed messages leave in the same order
+            # as they passed through the compression context
+            self.__package = pack_frame(payload=self.__payload, deflate=self.__deflate)
         return self.__package
 
     # Override
@@ -71,8 +88,12 @@ class WSDocker(StarDocker):
 
     MAX_PACK_LENGTH = 65536  # 64 KB
 
+    DEFLATE_ENABLED = True  # accept 'permessage-deflate' offered by client
+
     def __init__(self, gate: Gate):
         super().__init__(gate=gate)
+        self.__parser = WebSocketParser()
+        self.__deflate: Optional[PerMessageDeflate] = None
 
     @classmethod
     def check(cls, gate: Gate) -> bool:
@@ -82,39 +103,106 @@ class WSDocker(StarDocker):
 
     # Override
     def setup(self):
-        buffer = self.gate.receive(length=self.MAX_PACK_LENGTH, remove=True)
+        buffer = self.gate.receive(length=self.MAX_PACK_LENGTH, remove=False)
         if buffer is not None:
+            # remove the handshake request only, frames may follow it
+            pos = buffer.find(b'\r\n\r\n')
+            if pos > 0:
+                buffer = buffer[:pos+4]
+            self.gate.receive(length=len(buffer), remove=True)
             # response for handshake
-            res = WebSocket.handshake(stream=buffer)
+            extensions = None
+            if self.DEFLATE_ENABLED:
+                offers = WebSocket.header(stream=buffer, name=b'Sec-WebSocket-Extensions')
+                self.__deflate = PerMessageDeflate.negotiate(offers=offers)
+                if self.__deflate is not None:
+                    extensions = self.__deflate.response
+            res = WebSocket.handshake(stream=buffer, extensions=extensions)
             self.gate.send(data=res)
 
     # Override
-    # noinspection PyMethodMayBeStatic
     def pack(self, payload: bytes, priority: int = 0, delegate: Optional[ShipDelegate] = None) -> StarShip:
-        req_pack = WebSocket.pack(payload=payload)
-        return WSShip(package=req_pack, payload=payload, priority=priority, delegate=delegate)
-
-    def __receive_package(self) -> (Optional[bytes], Optional[bytes]):
-        # 1. check received data
-        buffer = self.gate.receive(length=self.MAX_PACK_LENGTH, remove=False)
-        if buffer is None:
-            # received nothing
-            return None, None
-        payload, remaining = WebSocket.parse(stream=buffer)
-        old_len = len(buffer)
-        new_len = len(remaining)
-        if new_len < old_len:
-            # 2. cut for received package
-            pack = self.gate.receive(length=old_len-new_len, remove=True)
-            return pack, payload
+        deflate = self.__deflate
+        if deflate is None:
+            req_pack = WebSocket.pack(payload=payload)
         else:
-            return None, None
+            req_pack = None  # pack when sending
+        return WSShip(package=req_pack, payload=payload, priority=priority, delegate=delegate, deflate=deflate)
+
+    def __receive_frame(self) -> Optional[WebSocketFrame]:
+        gate = self.gate
+        parser = self.__parser
+        while True:
+            # 1. check received data
+            expected = parser.expected
+            view = gate.peek(length=expected)
+            if view is None:
+                # received nothing
+                return None
+            count, frame = parser.parse(stream=view)
+            view.release()
+            if count == 0:
+                if parser.expected != expected:
+                    # frame head parsed, try again with the whole frame length
+                    continue
+                # waiting for more data
+                return None
+            # 2. cut for received frame
+            gate.skip(length=count)
+            error = parser.error
+            if error is not None:
+                Log.error('ws frame error: %s' % error)
+                self.__close(code=1002)  # protocol error
+                return None
+            if frame is not None:
+                return frame
+
+    def __close(self, code: int = 1000):
+        """ Send CLOSE frame and stop the gate """
+        self.gate.send(data=WebSocket.pack(payload=code.to_bytes(length=2, byteorder='big'), opcode=WebSocket.CLOSE))
+        self.gate.stop()
+
+    def __decompress(self, payload: bytes) -> Optional[bytes]:
+        deflate = self.__deflate
+        if deflate is None:
+            Log.error('ws frame error: compressed without negotiation')
+            self.__close(code=1002)  # protocol error
+            return None
+        try:
+            return deflate.decompress(payload=payload)
+        except ValueError as error:
+            Log.error('ws frame error: %s' % error)
+            self.__close(code=1009)  # message too big
+        except zlib.error as error:
+            Log.error('ws frame error: %s' % error)
+            self.__close(code=1007)  # invalid payload data
+        return None
 
     # Override
     def get_income_ship(self) -> Optional[Ship]:
-        income, payload = self.__receive_package()
-        if income is not None:
-            return WSShip(package=income, payload=payload)
+        while True:
+            frame = self.__receive_frame()
+            if frame is None:
+                return None
+            opcode = frame.opcode
+            if opcode == WebSocket.PING:
+                # respond PONG with the same payload
+                self.gate.send(data=WebSocket.pack(payload=frame.payload, opcode=WebSocket.PONG))
+            elif opcode == WebSocket.CLOSE:
+                # respond CLOSE with the same status code
+                code = frame.payload[:2]
+                self.gate.send(data=WebSocket.pack(payload=code, opcode=WebSocket.CLOSE))
+                self.gate.stop()
+                return None
+            elif opcode in [WebSocket.TEXT, WebSocket.BINARY]:
+                # income package with fragments joined
+                payload = frame.payload
+                if frame.compressed:
+                    payload = self.__decompress(payload=payload)
+                    if payload is None:
+                        return None
+                return WSShip(package=frame.payload, payload=payload)
+            # PONG: just ignore
 
     # Override
     def process_income_ship(self, income: Ship) -> Optional[StarShip]:
@@ -127,10 +215,10 @@ class WSDocker(StarDocker):
         elif body == ping_body:
             # respond Command: 'PONG' -> 'PING'
             return self.pack(payload=pong_body, priority=StarShip.SLOWER)
-        elif income == pong_body:
+        elif body == pong_body:
             # just ignore
             return None
-        elif income == noop_body:
+        elif body == noop_body:
             # just ignore
             return None
         # 2. process payload by delegate
@@ -142,8 +230,7 @@ class WSDocker(StarDocker):
         # 3. response
         if res is None or len(res) == 0:
             res = ok_body
-        req_pack = WebSocket.pack(payload=res)
-        return WSShip(package=req_pack, payload=res, priority=StarShip.NORMAL)
+        return self.pack(payload=res, priority=StarShip.NORMAL)
 
     # Override
     def remove_linked_ship(self, income: Ship):
@@ -151,10 +238,8 @@ class WSDocker(StarDocker):
         pass
 
     # Override
-    # noinspection PyMethodMayBeStatic
     def get_heartbeat(self) -> Optional[StarShip]:
-        req_pack = WebSocket.pack(payload=noop_body)
-        return WSShip(package=req_pack, payload=noop_body, priority=StarShip.NORMAL)
+        return self.pack(payload=noop_body, priority=StarShip.NORMAL)
 
 
 #
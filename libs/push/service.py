@@ -28,7 +28,8 @@ from typing import Set, Dict
 from dimp import ID
 
 from ..utils import Singleton
-from ..utils import NotificationCenter, NotificationObserver, Notification
+from ..utils import NotificationCenter, NotificationObserver, NotificationQueue, Notification, user_key
+from ..utils import MetricsRegistry
 
 
 class PushService:
@@ -46,6 +47,12 @@ class PushService:
         raise NotImplemented
 
 
+g_metrics = MetricsRegistry()
+g_pushed = g_metrics.counter(name='dim_push_notifications_total', labels={'result': 'sent'},
+                             desc='Push notifications for offline receivers')
+g_push_failed = g_metrics.counter(name='dim_push_notifications_total', labels={'result': 'failed'})
+
+
 @Singleton
 class NotificationPusher(PushService, NotificationObserver):
 
@@ -55,8 +62,10 @@ class NotificationPusher(PushService, NotificationObserver):
         self.__services: Set[PushService] = set()
         # counting offline messages
         self.__badges: Dict[ID, int] = {}
-        # observing notifications
+        # observing notifications, only the last one for the same user is needed
+        queue = NotificationQueue(observer=self, policy=NotificationQueue.COALESCE, key=user_key)
         nc = NotificationCenter()
+        nc.set_queue(observer=self, queue=queue)
         nc.add(observer=self, name='user_online')
 
     def __del__(self):
@@ -99,4 +108,8 @@ class NotificationPusher(PushService, NotificationObserver):
         for service in self.__services:
             if service.push_notification(sender=sender, receiver=receiver, message=message, badge=badge):
                 sent += 1
-        return sent > 0
+        if sent > 0:
+            g_pushed.inc()
+            return True
+        g_push_failed.inc()
+        return False
@@ -39,6 +39,8 @@ from dimp import Command
 from dimsdk import HandshakeCommand
 from dimsdk import CommandProcessor
 
+from ...common import CommonPacker
+
 from ..messenger import ServerMessenger
 from ..session import SessionServer
 
@@ -48,7 +50,7 @@ g_session_server = SessionServer()
 
 class HandshakeCommandProcessor(CommandProcessor):
 
-    def __offer(self, sender: ID, session_key: str = None) -> Content:
+    def __offer(self, cmd: HandshakeCommand, sender: ID, session_key: str = None) -> Content:
         # set/update session in session server with new session key
         messenger = self.messenger
         assert isinstance(messenger, ServerMessenger), 'messenger error: %s' % messenger
@@ -59,6 +61,12 @@ class HandshakeCommandProcessor(CommandProcessor):
             response = messenger.handshake_accepted(session=session)
             if response is None:
                 response = HandshakeCommand.success()
+            # choose message format from client's offer
+            packer = messenger.packer
+            if isinstance(packer, CommonPacker):
+                mtp = packer.negotiate_format(formats=cmd.get('formats'))
+                if mtp is not None:
+                    response['format'] = mtp
             return response
         else:
             # session key not match, ask client to sign it with the new session key
@@ -73,7 +81,7 @@ class HandshakeCommandProcessor(CommandProcessor):
         else:
             # C -> S: Hello world!
             assert 'Hello world!' == message, 'Handshake command error: %s' % cmd
-            return self.__offer(session_key=cmd.session, sender=msg.sender)
+            return self.__offer(cmd=cmd, session_key=cmd.session, sender=msg.sender)
 
 
 # register
@@ -35,7 +35,8 @@ import threading
 import traceback
 import weakref
 from abc import abstractmethod
-from typing import Optional, List, Set
+from collections import deque
+from typing import Optional, List, Set, Deque, Tuple, Callable
 
 from dimp import ID, NetworkType
 from dimp import ReliableMessage
@@ -43,6 +44,7 @@ from dimp import ContentType, Content, TextContent
 
 from ..utils import Singleton, Log, Logging
 from ..utils import Notification, NotificationObserver, NotificationCenter
+from ..utils import MetricsRegistry, Tracer
 from ..push import PushService
 from ..common import NotificationNames
 from ..common import Database, SharedFacebook
@@ -55,13 +57,27 @@ g_session_server = SessionServer()
 g_facebook = SharedFacebook()
 g_database = Database()
 
+g_metrics = MetricsRegistry()
+g_tracer = Tracer()
+g_dispatched_single = g_metrics.counter(name='dim_messages_dispatched_total', labels={'kind': 'single'},
+                                        desc='Messages dispatched to workers')
+g_dispatched_group = g_metrics.counter(name='dim_messages_dispatched_total', labels={'kind': 'group'})
+g_dispatched_broadcast = g_metrics.counter(name='dim_messages_dispatched_total', labels={'kind': 'broadcast'})
+g_delivered_online = g_metrics.counter(name='dim_messages_delivered_total', labels={'result': 'online'},
+                                       desc='Personal messages delivered to sessions or cached')
+g_delivered_cached = g_metrics.counter(name='dim_messages_delivered_total', labels={'result': 'cached'})
+g_redirect_failed = g_metrics.counter(name='dim_messages_redirect_failed_total',
+                                      desc='Messages failed to redirect to roaming stations')
+g_push_unavailable = g_metrics.counter(name='dim_push_unavailable_total',
+                                       desc='Push notifications skipped for service not initialized')
+
 
 @Singleton
 class Dispatcher(NotificationObserver):
 
     def __init__(self):
         super().__init__()
-        self.__single_worker = SingleDispatcher()
+        self.__single_worker = WorkerPool(factory=SingleDispatcher)
         self.__group_worker = GroupDispatcher()
         self.__broadcast_worker = BroadcastDispatcher()
         # Notifications
@@ -90,6 +106,22 @@ class Dispatcher(NotificationObserver):
     def push_service(self, service: PushService):
         self.__push_service = weakref.ref(service)
 
+    @property
+    def shards(self) -> int:
+        """ Count of workers for delivering personal messages """
+        return self.__single_worker.count
+
+    @shards.setter
+    def shards(self, count: int):
+        """ Set count of workers for personal messages (call it before start) """
+        pool = WorkerPool(factory=SingleDispatcher, count=count)
+        station = self.__group_worker.station
+        if station is not None:
+            pool.station = station
+            for sid in self.__group_worker.neighbors:
+                pool.add_neighbor(station=sid)
+        self.__single_worker = pool
+
     def start(self):
         self.__single_worker.start()
         self.__group_worker.start()
@@ -100,6 +132,14 @@ class Dispatcher(NotificationObserver):
         self.__group_worker.stop()
         self.__broadcast_worker.stop()
 
+    def statistics(self, reset: bool = False) -> dict:
+        """ Get queue depths and waiting times of the workers """
+        return {
+            'single': self.__single_worker.statistics(reset=reset),
+            'group': self.__group_worker.statistics(reset=reset),
+            'broadcast': self.__broadcast_worker.statistics(reset=reset),
+        }
+
     #
     #    Notification Observer
     #
@@ -140,16 +180,20 @@ class Dispatcher(NotificationObserver):
     def deliver(self, msg: ReliableMessage) -> Optional[Content]:
         # post notification for monitor
         NotificationCenter().post(name=NotificationNames.DELIVER_MESSAGE, sender=self, info=msg.dictionary)
+        g_tracer.mark(msg=msg, stage='dispatch')
         # dispatch task to the worker
         receiver = msg.receiver
         if receiver.is_broadcast:
             self.__broadcast_worker.add_msg(msg=msg)
+            g_dispatched_broadcast.inc()
             res = msg_receipt(msg=msg, text='Message broadcasting')
         elif receiver.is_group:
             self.__group_worker.add_msg(msg=msg)
+            g_dispatched_group.inc()
             res = msg_receipt(msg=msg, text='Group Message delivering')
         else:
             self.__single_worker.add_msg(msg=msg)
+            g_dispatched_single.inc()
             res = msg_receipt(msg=msg, text='Message delivering')
         # only respond to my own users
         stations = _roaming_stations(user=msg.sender)
@@ -186,11 +230,12 @@ def _redirect_message(msg: ReliableMessage, neighbor: ID, bridge: ID) -> int:
     """ redirect message to neighbor station for roaming user """
     cnt = _push_message(msg=msg, receiver=neighbor)
     if cnt == 0:
-        Log.warning('remote station (%s) not connected, trying bridge (%s)...' % (neighbor, bridge))
+        Log.warning('remote station (%s) not connected, trying bridge (%s)...', neighbor, bridge)
         msg['target'] = str(neighbor)
         cnt = _push_message(msg=msg, receiver=bridge)
         if cnt == 0:
-            Log.error('station bridge (%s) not connected, cannot redirect.' % bridge)
+            Log.error('station bridge (%s) not connected, cannot redirect.', bridge)
+            g_redirect_failed.inc()
     return cnt
 
 
@@ -205,9 +250,11 @@ def _deliver_message(msg: ReliableMessage, receiver: ID, station: ID) -> Optiona
         # 2.1. redirect message to the roaming station
         cnt += _redirect_message(msg=msg, neighbor=sid, bridge=station)
     if cnt > 0:
+        g_delivered_online.inc()
         return msg_receipt(msg=msg, text='Message delivered to %d session(s)' % cnt)
     # 3. store in local cache file
     g_database.store_message(msg)
+    g_delivered_cached.inc()
     # check mute-list
     sender = msg.sender
     group = msg.group
@@ -239,6 +286,7 @@ def _push_notification(sender: ID, receiver: ID, group: ID, msg_type: int = 0) -
     service = Dispatcher().push_service
     if service is None:
         Log.error('push notification service not initialized')
+        g_push_unavailable.inc()
         return False
     if msg_type == 0:
         something = 'a message'
@@ -255,7 +303,7 @@ def _push_notification(sender: ID, receiver: ID, group: ID, msg_type: int = 0) -
     elif msg_type in [ContentType.MONEY, ContentType.TRANSFER]:
         something = 'some money'
     else:
-        Log.warning('ignore msg type: %d' % msg_type)
+        Log.warning('ignore msg type: %d', msg_type)
         return False
     from_name = g_facebook.name(identifier=sender)
     to_name = g_facebook.name(identifier=receiver)
@@ -269,13 +317,26 @@ def _push_notification(sender: ID, receiver: ID, group: ID, msg_type: int = 0) -
 
 class Worker(threading.Thread, Logging):
 
+    BATCH_SIZE = 128  # max messages taken from the waiting queue each time
+
     def __init__(self):
         super().__init__()
         self.__running = True
         self.__station: Optional[ID] = None
-        self.__neighbors: Set[ID] = set()                # station ID list
-        self.__waiting_list: List[ReliableMessage] = []  # ReliableMessage list
+        self.__neighbors: Set[ID] = set()  # station ID list
         self.__lock = threading.Lock()
+        # waiting queue: (ReliableMessage, enqueue time)
+        self.__waiting_queue: Deque[Tuple[ReliableMessage, float]] = deque()
+        self.__condition = threading.Condition()
+        # statistics
+        name = self.__class__.__name__
+        self.__wait_histogram = g_metrics.histogram(name='dim_dispatcher_wait_seconds', labels={'worker': name},
+                                                    desc='Time messages waiting in the dispatcher queue')
+        self.__deliver_histogram = g_metrics.histogram(name='dim_dispatcher_deliver_seconds', labels={'worker': name},
+                                                       desc='Time spent on delivering one message')
+        self.__delivered_count = 0
+        self.__wait_total = 0.0
+        self.__wait_max = 0.0
 
     @property
     def station(self) -> ID:
@@ -301,13 +362,69 @@ class Worker(threading.Thread, Logging):
             self.__neighbors.discard(station)
 
     def add_msg(self, msg: ReliableMessage):
-        with self.__lock:
-            self.__waiting_list.append(msg)
+        with self.__condition:
+            self.__waiting_queue.append((msg, time.time()))
+            self.__condition.notify()
 
     def pop_msg(self) -> Optional[ReliableMessage]:
-        with self.__lock:
-            if len(self.__waiting_list) > 0:
-                return self.__waiting_list.pop(0)
+        with self.__condition:
+            if len(self.__waiting_queue) > 0:
+                msg, enqueue_time = self.__waiting_queue.popleft()
+                self.__count_wait(now=time.time(), enqueue_time=enqueue_time)
+                return msg
+
+    def pop_msgs(self, timeout: Optional[float] = None) -> List[ReliableMessage]:
+        """
+        Wait for new messages, and take them out in a batch
+
+        :param timeout: seconds to wait when the queue is empty
+        :return: messages in the order they were added
+        """
+        with self.__condition:
+            if len(self.__waiting_queue) == 0:
+                self.__condition.wait(timeout=timeout)
+            now = time.time()
+            messages = []
+            while len(self.__waiting_queue) > 0 and len(messages) < self.BATCH_SIZE:
+                msg, enqueue_time = self.__waiting_queue.popleft()
+                self.__count_wait(now=now, enqueue_time=enqueue_time)
+                messages.append(msg)
+            return messages
+
+    def __count_wait(self, now: float, enqueue_time: float):
+        wait = now - enqueue_time
+        self.__wait_histogram.observe(wait)
+        self.__delivered_count += 1
+        self.__wait_total += wait
+        if wait > self.__wait_max:
+            self.__wait_max = wait
+
+    @property
+    def queue_length(self) -> int:
+        """ Messages waiting for delivering """
+        with self.__condition:
+            return len(self.__waiting_queue)
+
+    def statistics(self, reset: bool = False) -> dict:
+        """
+        Get queue depth and waiting times
+
+        :param reset: whether reset the counters after taken
+        :return: {'depth': ..., 'count': ..., 'wait_avg': ..., 'wait_max': ...}
+        """
+        with self.__condition:
+            count = self.__delivered_count
+            info = {
+                'depth': len(self.__waiting_queue),
+                'count': count,
+                'wait_avg': self.__wait_total / count if count > 0 else 0.0,
+                'wait_max': self.__wait_max,
+            }
+            if reset:
+                self.__delivered_count = 0
+                self.__wait_total = 0.0
+                self.__wait_max = 0.0
+            return info
 
     @abstractmethod
     def deliver(self, msg: ReliableMessage) -> Optional[Content]:
@@ -319,26 +436,111 @@ class Worker(threading.Thread, Logging):
     def run(self):
         self.info('dispatcher starting...')
         while self.__running:
-            try:
-                while self.__running:
-                    msg = self.pop_msg()
-                    if msg is None:
-                        time.sleep(0.1)
-                        break
+            # wake up as soon as new message added
+            messages = self.pop_msgs(timeout=1.0)
+            for msg in messages:
+                g_tracer.mark(msg=msg, stage='worker')
+                start = time.time()
+                try:
                     res = self.deliver(msg=msg)
                     if res is not None:
                         # TODO: respond the delivering result to the sender
                         pass
-            except Exception as error:
-                self.error('dispatcher error: %s' % error)
-                traceback.print_exc()
-            finally:
-                # sleep for next loop
-                time.sleep(0.1)
+                except Exception as error:
+                    self.error('dispatcher error: %s', error)
+                    traceback.print_exc()
+                self.__deliver_histogram.observe(time.time() - start)
         self.info('dispatcher exit!')
 
     def stop(self):
         self.__running = False
+        with self.__condition:
+            self.__condition.notify_all()
+
+
+class WorkerPool:
+    """
+        Worker Pool
+        ~~~~~~~~~~~
+
+        Messages are sharded to workers by receiver,
+        so messages for the same receiver will be delivered in order,
+        while messages for different receivers could be delivered in parallel.
+    """
+
+    def __init__(self, factory: Callable[[], Worker], count: int = 1):
+        super().__init__()
+        assert count > 0, 'worker count error: %d' % count
+        self.__workers: List[Worker] = [factory() for _ in range(count)]
+
+    @property
+    def count(self) -> int:
+        return len(self.__workers)
+
+    @property
+    def workers(self) -> List[Worker]:
+        return self.__workers.copy()
+
+    def worker(self, receiver: ID) -> Worker:
+        """ Get the worker for this receiver """
+        index = hash(receiver) % len(self.__workers)
+        return self.__workers[index]
+
+    @property
+    def station(self) -> ID:
+        return self.__workers[0].station
+
+    @station.setter
+    def station(self, server: ID):
+        for worker in self.__workers:
+            worker.station = server
+
+    def add_neighbor(self, station: ID):
+        for worker in self.__workers:
+            worker.add_neighbor(station=station)
+
+    def remove_neighbor(self, station: ID):
+        for worker in self.__workers:
+            worker.remove_neighbor(station=station)
+
+    def add_msg(self, msg: ReliableMessage):
+        self.worker(receiver=msg.receiver).add_msg(msg=msg)
+
+    @property
+    def queue_length(self) -> int:
+        return sum([worker.queue_length for worker in self.__workers])
+
+    def statistics(self, reset: bool = False) -> dict:
+        """ Get queue depth and waiting times of all workers """
+        depth = 0
+        count = 0
+        wait_total = 0.0
+        wait_max = 0.0
+        for worker in self.__workers:
+            info = worker.statistics(reset=reset)
+            depth += info['depth']
+            count += info['count']
+            wait_total += info['wait_avg'] * info['count']
+            wait_max = max(wait_max, info['wait_max'])
+        return {
+            'workers': len(self.__workers),
+            'depth': depth,
+            'count': count,
+            'wait_avg': wait_total / count if count > 0 else 0.0,
+            'wait_max': wait_max,
+        }
+
+    def start(self):
+        for worker in self.__workers:
+            worker.start()
+
+    def stop(self):
+        for worker in self.__workers:
+            worker.stop()
+
+    def join(self, timeout: Optional[float] = None):
+        for worker in self.__workers:
+            worker.join(timeout=timeout)
 
 
 class SingleDispatcher(Worker):
@@ -356,7 +558,7 @@ class GroupDispatcher(Worker):
         if assistants is None or len(assistants) == 0:
             raise LookupError('failed to get assistant for group: %s' % msg.receiver)
         bot = assistants[0]
-        self.info('deliver group message to assistant: %s' % bot)
+        self.info('deliver group message to assistant: %s', bot)
         return _deliver_message(msg=msg, receiver=bot, station=self.station)
 
 
@@ -364,7 +566,7 @@ class BroadcastDispatcher(Worker):
     """ broadcast (split and deliver) to everyone """
 
     def deliver(self, msg: ReliableMessage) -> Optional[Content]:
-        self.info('broadcasting message: %s -> %s, %s' % (msg.sender, msg.receiver, msg.group))
+        self.info('broadcasting message: %s -> %s, %s', msg.sender, msg.receiver, msg.group)
         receiver = msg.receiver
         # check for group bots: assistants
         if receiver in ['assistant@anywhere', 'assistants@everywhere']:
@@ -383,7 +585,7 @@ class BroadcastDispatcher(Worker):
             if cnt > 0:
                 success += 1
             else:
-                self.warning('failed to push message to assistant: %s' % ass)
+                self.warning('failed to push message to assistant: %s', ass)
         # response
         text = 'Message broadcast to %d/%d assistants' % (success, len(assistants))
         res = TextContent(text=text)
@@ -409,7 +611,7 @@ class BroadcastDispatcher(Worker):
         for sid in neighbors:
             # check traces
             if msg_traced(msg=msg, node=sid):  # and is_broadcast_message(msg=msg):
-                self.info('ignore traced msg: %s in %s' % (sid, msg.get('traces')))
+                self.info('ignore traced msg: %s in %s', sid, msg.get('traces'))
                 continue
             assert sid != self.station, 'neighbors error: %s, %s' % (self.station, neighbors)
             # push to neighbor station
@@ -418,15 +620,15 @@ class BroadcastDispatcher(Worker):
                 sent_neighbors.append(str(sid))
                 success += 1
             else:
-                self.warning('failed to push message to remote station: %s' % sid)
+                self.warning('failed to push message to remote station: %s', sid)
         # 2. push to the bridge (octopus) of current station
         sent_neighbors.append(str(self.station))
         msg['sent_neighbors'] = sent_neighbors
-        self.info('push to the bridge (%s) ignoring sent stations: %s' % (self.station, sent_neighbors))
+        self.info('push to the bridge (%s) ignoring sent stations: %s', self.station, sent_neighbors)
         cnt = _push_message(msg=msg, receiver=self.station)
         if cnt == 0:
             # FIXME: what about the failures
-            self.error('failed to push message to station bridge: %s' % self.station)
+            self.error('failed to push message to station bridge: %s', self.station)
         # response
         text = 'Message broadcast to %d/%d stations' % (success, len(neighbors))
         res = TextContent(text=text)
@@ -30,16 +30,18 @@
     Transform and send message
 """
 
-from typing import Optional
+from typing import Optional, List, Dict
 
+from dimp import sha256
 from dimp import ID
 from dimp import Envelope, InstantMessage, ReliableMessage
 from dimp import Command
 from dimp import Processor
 
-from ..utils import NotificationCenter
+from ..utils import NotificationCenter, CacheManager, MetricsRegistry, Tracer
 from ..common import NotificationNames
 from ..common import CommonMessenger, CommonFacebook, SharedFacebook
+from ..common import CryptoExecutor
 
 from .session import Session, SessionServer
 from .dispatcher import Dispatcher
@@ -48,15 +50,30 @@ from .dispatcher import Dispatcher
 g_session_server = SessionServer()
 g_dispatcher = Dispatcher()
 g_facebook = SharedFacebook()
+g_tracer = Tracer()
+g_crypto = CryptoExecutor()
+g_metrics = MetricsRegistry()
+
+g_verified_cached = g_metrics.counter(name='dim_signatures_verified_total', labels={'result': 'cached'},
+                                      desc='Message signatures verified by the station')
+g_verified_checked = g_metrics.counter(name='dim_signatures_verified_total', labels={'result': 'checked'})
+g_verified_failed = g_metrics.counter(name='dim_signatures_verified_total', labels={'result': 'failed'})
+g_verified_batched = g_metrics.counter(name='dim_signatures_verified_total', labels={'result': 'batched'})
 
 
 class ServerMessenger(CommonMessenger):
 
+    VERIFIED_CACHE_SIZE = 65536  # max signatures in the verified cache
+    VERIFIED_LIFE_SPAN = 3600    # seconds for keeping a verified signature
+
     def __init__(self):
         super().__init__()
         from .filter import Filter
         self.__filter = Filter(messenger=self)
         self.__current_session: Optional[Session] = None
+        # (sender, sha256(data), signature) -> key data, shared by all sessions
+        self.__verified = CacheManager().pool(name='verified_signatures', max_size=self.VERIFIED_CACHE_SIZE,
+                                              life_span=self.VERIFIED_LIFE_SPAN)
 
     @property
     def facebook(self) -> CommonFacebook:
@@ -69,10 +86,82 @@ class ServerMessenger(CommonMessenger):
         from .processor import ServerProcessor
         return ServerProcessor(messenger=self)
 
+    # Override
+    def verify_data_signature(self, data: bytes, signature: bytes, sender: ID, msg: ReliableMessage) -> bool:
+        """
+        Verify message signature with the sender's visa/meta keys
+
+        Broadcast and roaming messages may loop back through the neighbours,
+        so the positive results are cached with the key which verified them;
+        when the sender's visa/meta key changed, the cached result is ignored.
+        """
+        keys = self.facebook.public_keys_for_verification(identifier=sender)
+        if keys is None or len(keys) == 0:
+            return False
+        cache_key = (str(sender), sha256(data), signature)
+        verified, _ = self.__verified.fetch(key=cache_key)
+        if verified is not None:
+            for key in keys:
+                if key.get('data') == verified:
+                    g_verified_cached.inc()
+                    return True
+        key = g_crypto.verify(keys=keys, data=data, signature=signature)
+        if key is None:
+            g_verified_failed.inc()
+            return False
+        self.__verified.update(key=cache_key, value=key.get('data'))
+        g_verified_checked.inc()
+        return True
+
+    def verify_signatures(self, messages: List[ReliableMessage]) -> int:
+        """
+        Check signatures of messages in one batch (in parallel when the crypto executor started),
+        the verified results are cached for verifying each message later
+
+        :param messages: network messages
+        :return: count of signatures verified
+        """
+        # group by sender, so the keys will be loaded only once for each sender
+        senders: Dict[str, List[ReliableMessage]] = {}
+        for msg in messages:
+            senders.setdefault(str(msg.sender), []).append(msg)
+        jobs = []
+        cache_keys = []
+        for sender, items in senders.items():
+            identifier = items[0].sender
+            if self.facebook.meta(identifier=identifier) is None:
+                # meta not found, verify them later with the attached meta
+                continue
+            keys = self.facebook.public_keys_for_verification(identifier=identifier)
+            if keys is None or len(keys) == 0:
+                continue
+            for msg in items:
+                if msg.delegate is None:
+                    msg.delegate = self
+                data = msg.data
+                signature = msg.signature
+                cache_key = (sender, sha256(data), signature)
+                verified, _ = self.__verified.fetch(key=cache_key)
+                if verified is not None:
+                    continue
+                jobs.append((keys, data, signature))
+                cache_keys.append(cache_key)
+        if len(jobs) == 0:
+            return 0
+        count = 0
+        results = g_crypto.verify_batch(jobs=jobs)
+        for cache_key, key in zip(cache_keys, results):
+            if key is not None:
+                self.__verified.update(key=cache_key, value=key.get('data'))
+                count += 1
+        g_verified_batched.inc(count)
+        return count
+
     def deliver_message(self, msg: ReliableMessage) -> Optional[ReliableMessage]:
         """ Deliver message to the receiver, or broadcast to neighbours """
         # FIXME: check deliver permission
         res = self.__filter.check_deliver(msg=msg)
+        g_tracer.mark(msg=msg, stage='filter')
         if res is None:
             # delivering is allowed, call dispatcher to deliver this message
             res = g_dispatcher.deliver(msg=msg)
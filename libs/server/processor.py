@@ -33,6 +33,7 @@ from typing import Optional
 from dimp import NetworkType
 from dimp import ReliableMessage
 
+from ..utils import Tracer
 from ..common import msg_traced, is_broadcast_message
 from ..common import CommonProcessor
 from ..common import Database
@@ -45,6 +46,7 @@ from .dispatcher import Dispatcher
 g_database = Database()
 g_session_server = SessionServer()
 g_dispatcher = Dispatcher()
+g_tracer = Tracer()
 
 
 class ServerProcessor(CommonProcessor):
@@ -63,6 +65,7 @@ class ServerProcessor(CommonProcessor):
             self.error('failed to verify message: %s -> %s' % (sender, receiver))
             # waiting for sender's meta if not exists
             return None
+        g_tracer.mark(msg=msg, stage='verify')
         # 1.1. check traces
         station = g_dispatcher.station
         if msg_traced(msg=msg, node=station, append=True):
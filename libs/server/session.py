@@ -46,9 +46,12 @@ from dimp import ID
 from dimsdk.plugins.aes import random_bytes
 
 from ..utils import Singleton
+from ..utils import Notification, NotificationObserver, NotificationCenter
+from ..network import StarGate
 from ..common import Database, MessageBundle
 from ..common import BaseSession
 from ..common import CommonMessenger
+from ..common import NotificationNames
 
 
 g_database = Database()
@@ -60,13 +63,16 @@ def generate_session_key() -> str:
 
 class Session(BaseSession):
 
-    def __init__(self, messenger: CommonMessenger, sock: socket.socket):
-        super().__init__(messenger=messenger, sock=sock)
+    SCAN_INTERVAL = 300  # seconds for rescanning cached messages, just in case
+
+    def __init__(self, messenger: CommonMessenger, sock: socket.socket, gate: Optional[StarGate] = None):
+        super().__init__(messenger=messenger, sock=sock, gate=gate)
         self.__client_address = sock.getpeername()
         self.__key = generate_session_key()
         self.__identifier = None
         self.__bundle = None
         self.__scan_time = 0
+        self.__dirty = False  # new messages cached for this user
 
     def __str__(self):
         clazz = self.__class__.__name__
@@ -95,32 +101,63 @@ class Session(BaseSession):
                 self.__bundle = None
             else:
                 self.__bundle = g_database.message_bundle(identifier=value)
+                self.__dirty = True
+
+    @property
+    def active(self) -> bool:
+        return super().active
+
+    @active.setter
+    def active(self, value: bool):
+        if value and not BaseSession.active.fget(self):
+            # push cached messages when (re)activated
+            self.__dirty = True
+        BaseSession.active.fset(self, value)
+        self._wakeup()
+
+    def touch(self):
+        """ Mark new messages cached for this session """
+        self.__dirty = True
+        self._wakeup()
 
     # Override
-    def _idle(self):
+    def process(self) -> bool:
+        if super().process():
+            return True
+        return self.scan()
+
+    def scan(self) -> bool:
+        """ Scan cached messages for this session, return False when nothing changed """
         bundle = self.__bundle
+        if bundle is None or not self.active:
+            return False
         now = int(time.time())
-        if bundle is None or now < self.__scan_time or not self.active:
-            super()._idle()
+        if self.__dirty:
+            self.__dirty = False
+            force = False
+        elif now < self.__scan_time:
+            return False
         else:
-            # TODO: set a 'dirty' flag to reduce local storage scanning
-            self.__scan_time = now + 16  # scan after 16 seconds
-            self.__scan(bundle=bundle)
-
-    def __scan(self, bundle: MessageBundle):
-        self.debug('scanning messages for: %s' % self.identifier)
-        messages = bundle.all()
+            # safety net, rescan the whole store
+            force = True
+        self.__scan_time = now + self.SCAN_INTERVAL
+        self.__scan(bundle=bundle, force=force)
+        return True
+
+    def __scan(self, bundle: MessageBundle, force: bool = False):
+        self.debug('scanning messages for: %s', self.identifier)
+        messages = bundle.all(force=force)
         total = len(messages)
-        self.info('%d message(s) loaded for: %s' % (total, self.identifier))
+        self.info('%d message(s) loaded for: %s', total, self.identifier)
         success = 0
         for msg in messages:
             if self.push_message(msg=msg):
                 success += 1
-        self.info('%d/%d message(s) pushed to %s' % (success, total, self.identifier))
+        self.info('%d/%d message(s) pushed to %s', success, total, self.identifier)
 
 
 @Singleton
-class SessionServer:
+class SessionServer(NotificationObserver):
 
     def __init__(self):
         super().__init__()
@@ -128,16 +165,37 @@ class SessionServer:
         self.__client_addresses: Dict[ID, Set[tuple]] = {}  # {identifier, [client_address]}
         self.__sessions = weakref.WeakValueDictionary()     # {client_address, session}
         self.__lock = threading.Lock()
+        # Notifications
+        nc = NotificationCenter()
+        nc.add(observer=self, name=NotificationNames.MESSAGE_CACHED)
+
+    def __del__(self):
+        nc = NotificationCenter()
+        nc.remove(observer=self, name=NotificationNames.MESSAGE_CACHED)
+
+    #
+    #    Notification Observer
+    #
+    def received_notification(self, notification: Notification):
+        name = notification.name
+        info = notification.info
+        if name == NotificationNames.MESSAGE_CACHED:
+            identifier = info.get('ID')
+            if identifier is not None:
+                # wake up the sessions of this receiver only
+                for session in self.active_sessions(identifier=identifier):
+                    session.touch()
 
     def get_session(self, client_address: tuple,
                     messenger: Optional[CommonMessenger] = None,
-                    sock: Optional[socket.socket] = None) -> Optional[Session]:
+                    sock: Optional[socket.socket] = None,
+                    gate: Optional[StarGate] = None) -> Optional[Session]:
         """ Session factory """
         with self.__lock:
             session = self.__sessions.get(client_address)
             if session is None and messenger is not None and sock is not None:
                 # create a new session and cache it
-                session = Session(messenger=messenger, sock=sock)
+                session = Session(messenger=messenger, sock=sock, gate=gate)
                 self.__sessions[client_address] = session
             return session
 
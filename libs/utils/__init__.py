@@ -33,20 +33,31 @@
                                              -- Albert Moky @ Jan. 23, 2019
 """
 
-from .log import Log, Logging
+from .log import Log, Logging, LogWriter
 from .singleton import Singleton
 
-from .notification import Notification, NotificationObserver, NotificationCenter
+from .notification import Notification, NotificationObserver, NotificationQueue, NotificationCenter
+from .notification import user_key
 
-from .dos import File, TextFile, JSONFile
+from .cache import CacheHolder, CachePool, CacheManager
+
+from .dos import File, TextFile, JSONFile, FileWriter
+
+from .metrics import Counter, Gauge, Histogram, MetricsRegistry, MetricsServer
+from .tracer import Tracer
 
 
 __all__ = [
 
-    'Log', 'Logging',
+    'Log', 'Logging', 'LogWriter',
     'Singleton',
 
-    'Notification', 'NotificationObserver', 'NotificationCenter',
+    'Notification', 'NotificationObserver', 'NotificationQueue', 'NotificationCenter', 'user_key',
+
+    'CacheHolder', 'CachePool', 'CacheManager',
+
+    'File', 'TextFile', 'JSONFile', 'FileWriter',
 
-    'File', 'TextFile', 'JSONFile',
+    'Counter', 'Gauge', 'Histogram', 'MetricsRegistry', 'MetricsServer',
+    'Tracer',
 ]
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+#
+#   Memory Cache
+#
+#                                Written in 2021 by Moky <albert.moky@gmail.com>
+#
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2021 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Memory Cache
+    ~~~~~~~~~~~~
+
+    Bounded LRU cache with life spans, for database tables
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Tuple
+
+from .singleton import Singleton
+
+
+class CacheHolder:
+    """ Cached value with expired time """
+
+    def __init__(self, value: Optional[Any], expired: float):
+        super().__init__()
+        self.__value = value
+        self.__expired = expired
+
+    @property
+    def value(self) -> Optional[Any]:
+        return self.__value
+
+    @property
+    def expired(self) -> float:
+        return self.__expired
+
+    def is_alive(self, now: float) -> bool:
+        return now < self.__expired
+
+
+class CachePool:
+    """
+        Thread-safe cache pool
+
+        1. the least recently used entry will be evicted when the pool is full;
+        2. entries expire after 'life_span' seconds;
+        3. empty values (None) are cached for 'empty_life_span' seconds,
+           to avoid loading non-exists files too frequently.
+    """
+
+    MAX_SIZE = 65536         # max entries in one pool
+    LIFE_SPAN = 3600         # seconds for caching a value
+    EMPTY_LIFE_SPAN = 300    # seconds for caching a non-exists value
+
+    def __init__(self, name: str, max_size: int = 0, life_span: float = 0, empty_life_span: float = 0):
+        super().__init__()
+        self.__name = name
+        self.__max_size = self.MAX_SIZE if max_size <= 0 else max_size
+        self.__life_span = self.LIFE_SPAN if life_span <= 0 else life_span
+        self.__empty_life_span = self.EMPTY_LIFE_SPAN if empty_life_span <= 0 else empty_life_span
+        self.__holders: Dict[Any, CacheHolder] = OrderedDict()  # key -> holder, in LRU order
+        self.__lock = threading.RLock()
+        # statistics
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    @property
+    def size(self) -> int:
+        return len(self.__holders)
+
+    def fetch(self, key: Any, now: float = 0) -> Tuple[Optional[Any], Optional[CacheHolder]]:
+        """
+        Get cached value with key
+
+        :param key: cache key
+        :param now: current time
+        :return: (value, holder); holder is None when not cached or expired
+        """
+        if now <= 0:
+            now = time.time()
+        with self.__lock:
+            holder = self.__holders.get(key)
+            if holder is None:
+                self.__misses += 1
+                return None, None
+            if not holder.is_alive(now=now):
+                # expired, remove it for reloading
+                self.__holders.pop(key, None)
+                self.__expirations += 1
+                self.__misses += 1
+                return None, None
+            self.__holders.move_to_end(key)
+            self.__hits += 1
+            return holder.value, holder
+
+    def update(self, key: Any, value: Optional[Any] = None, life_span: float = 0, now: float = 0) -> CacheHolder:
+        """
+        Cache a value with key (None for a non-exists value)
+
+        :param key:       cache key
+        :param value:     cache value
+        :param life_span: seconds before expired
+        :param now:       current time
+        :return: cache holder
+        """
+        if now <= 0:
+            now = time.time()
+        if life_span <= 0:
+            life_span = self.__life_span if value is not None else self.__empty_life_span
+        holder = CacheHolder(value=value, expired=(now + life_span))
+        with self.__lock:
+            self.__holders[key] = holder
+            self.__holders.move_to_end(key)
+            # evict the least recently used entries
+            while len(self.__holders) > self.__max_size:
+                self.__holders.popitem(last=False)
+                self.__evictions += 1
+        return holder
+
+    def erase(self, key: Any) -> Optional[CacheHolder]:
+        """ Invalidate the cached value with key """
+        with self.__lock:
+            return self.__holders.pop(key, None)
+
+    def clear(self):
+        """ Invalidate all cached values """
+        with self.__lock:
+            self.__holders.clear()
+
+    def purge(self, now: float = 0) -> int:
+        """ Remove expired entries, return the count removed """
+        if now <= 0:
+            now = time.time()
+        with self.__lock:
+            expired = [key for key, holder in self.__holders.items() if not holder.is_alive(now=now)]
+            for key in expired:
+                self.__holders.pop(key, None)
+            self.__expirations += len(expired)
+        return len(expired)
+
+    def statistics(self, reset: bool = False) -> dict:
+        """ Get hit/miss/eviction counters of this pool """
+        with self.__lock:
+            info = {
+                'size': len(self.__holders),
+                'max_size': self.__max_size,
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'evictions': self.__evictions,
+                'expirations': self.__expirations,
+            }
+            if reset:
+                self.__hits = 0
+                self.__misses = 0
+                self.__evictions = 0
+                self.__expirations = 0
+        return info
+
+
+@Singleton
+class CacheManager:
+    """ All cache pools """
+
+    def __init__(self):
+        super().__init__()
+        self.__pools: Dict[str, CachePool] = {}
+        self.__lock = threading.Lock()
+
+    def pool(self, name: str, max_size: int = 0, life_span: float = 0, empty_life_span: float = 0) -> CachePool:
+        """ Get cache pool with name, create it if not exists """
+        with self.__lock:
+            pool = self.__pools.get(name)
+            if pool is None:
+                pool = CachePool(name=name, max_size=max_size, life_span=life_span, empty_life_span=empty_life_span)
+                self.__pools[name] = pool
+            return pool
+
+    def clear(self, name: Optional[str] = None):
+        """ Invalidate cache pool with name (if empty, clear all pools) """
+        with self.__lock:
+            pools = list(self.__pools.values())
+        for pool in pools:
+            if name is None or pool.name == name:
+                pool.clear()
+
+    def purge(self, now: float = 0) -> int:
+        """ Remove expired entries in all pools """
+        with self.__lock:
+            pools = list(self.__pools.values())
+        count = 0
+        for pool in pools:
+            count += pool.purge(now=now)
+        return count
+
+    def statistics(self, reset: bool = False) -> Dict[str, dict]:
+        with self.__lock:
+            pools = list(self.__pools.values())
+        return {pool.name: pool.statistics(reset=reset) for pool in pools}
@@ -30,13 +30,25 @@
     File access
 """
 
+import atexit
 import json
 import os
-from typing import Union, Optional, AnyStr
+import threading
+import time
+from typing import Union, Optional, AnyStr, Dict, Tuple
+
+from .log import Log
 
 
 class File:
 
+    FSYNC_NONE = 'none'            # leave it to the OS
+    FSYNC_FILE = 'file'            # flush file data to disk before renaming
+    FSYNC_DIRECTORY = 'directory'  # flush the renaming in parent directory too
+
+    atomic = True  # write to a temporary file, then rename it to the target
+    fsync_policy = FSYNC_NONE
+
     def __init__(self, path: str):
         super().__init__()
         self.__path: str = path
@@ -85,11 +97,39 @@ class File:
         directory = os.path.dirname(self.__path)
         if not self.make_dirs(directory):
             return False
-        with open(self.__path, mode=mode, encoding=encoding) as file:
-            if len(data) == file.write(data):
-                # OK, update cache
-                self.__data = data
-                return True
+        if self.atomic:
+            ok = self.__write_atomic(data=data, mode=mode, encoding=encoding, directory=directory)
+        else:
+            with open(self.__path, mode=mode, encoding=encoding) as file:
+                ok = len(data) == file.write(data)
+        if ok:
+            # OK, update cache
+            self.__data = data
+            return True
+
+    def __write_atomic(self, data: AnyStr, mode: str, encoding, directory: str) -> bool:
+        """ Write into a temporary file and rename it, so the target would never be half written """
+        policy = self.fsync_policy
+        temp = '%s.%d.%d.tmp' % (self.__path, os.getpid(), threading.get_ident())
+        try:
+            with open(temp, mode=mode, encoding=encoding) as file:
+                if len(data) != file.write(data):
+                    raise IOError('failed to write file: %s' % temp)
+                if policy != self.FSYNC_NONE:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(temp, self.__path)
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        if policy == self.FSYNC_DIRECTORY and hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        return True
 
     def append(self, data: AnyStr, mode: str = 'ab', encoding=None) -> bool:
         if not os.path.exists(self.__path):
@@ -144,3 +184,165 @@ class JSONFile(TextFile):
 
     def append(self, **kwargs) -> bool:
         raise AssertionError('JSON file cannot be appended')
+
+
+class FileWriter(threading.Thread):
+    """
+        Write-behind queue
+
+        Writes to the same path within the window are coalesced,
+        only the last data will be written by the background thread,
+        and all pending writes are flushed when stopped (or at exit).
+    """
+
+    WINDOW = 1.0  # seconds to wait for more writes to the same path
+
+    def __init__(self, window: float = 0):
+        super().__init__()
+        self.daemon = True
+        self.__window = self.WINDOW if window <= 0 else window
+        self.__pending: Dict[str, Tuple[AnyStr, float, int]] = {}  # path -> (data, flush time, version), in order
+        self.__writing: Dict[str, Tuple[AnyStr, int, int]] = {}   # path -> (newest data, version, count) in flight
+        self.__written: Dict[str, int] = {}                       # path -> version on disk, while writing
+        self.__version = 0
+        self.__condition = threading.Condition()
+        self.__write_lock = threading.Lock()  # one file write at a time, checking versions
+        self.__running = False
+        # statistics
+        self.__requests = 0
+        self.__coalesced = 0
+        self.__written_count = 0
+        self.__failed = 0
+
+    def write(self, data: AnyStr, path: str) -> bool:
+        """ Put data into the queue for writing later """
+        with self.__condition:
+            self.__requests += 1
+            self.__version += 1
+            item = self.__pending.get(path)
+            if item is None:
+                self.__pending[path] = (data, time.time() + self.__window, self.__version)
+                self.__condition.notify()
+            else:
+                # replace the pending data, keep the flush time
+                self.__pending[path] = (data, item[1], self.__version)
+                self.__coalesced += 1
+        return True
+
+    def read(self, path: str) -> Optional[AnyStr]:
+        """ Get pending data for path (or data being written) """
+        with self.__condition:
+            item = self.__pending.get(path)
+            if item is None:
+                item = self.__writing.get(path)
+        if item is not None:
+            return item[0]
+
+    def cancel(self, path: str) -> bool:
+        """ Drop pending data for path """
+        with self.__condition:
+            return self.__pending.pop(path, None) is not None
+
+    def flush(self, path: Optional[str] = None):
+        """ Write pending data now (if path is empty, flush all) """
+        with self.__condition:
+            if path is None:
+                paths = list(self.__pending.keys())
+            elif path in self.__pending:
+                paths = [path]
+            else:
+                paths = []
+            items = [self.__take(path=target) for target in paths]
+        for target, data, version in items:
+            self.__write(data=data, path=target, version=version)
+
+    def __take(self, path: str) -> Tuple[str, AnyStr, int]:
+        """ Move pending data to writing (call it with the condition locked) """
+        data, _, version = self.__pending.pop(path)
+        item = self.__writing.get(path)
+        if item is None:
+            self.__writing[path] = (data, version, 1)
+        elif item[1] < version:
+            self.__writing[path] = (data, version, item[2] + 1)
+        else:
+            self.__writing[path] = (item[0], item[1], item[2] + 1)
+        return path, data, version
+
+    def __write(self, data: AnyStr, path: str, version: int):
+        with self.__write_lock:
+            with self.__condition:
+                # skip it when newer data already written by another thread
+                stale = version <= self.__written.get(path, 0)
+            ok = False
+            if not stale:
+                try:
+                    if isinstance(data, str):
+                        ok = TextFile(path=path).write(text=data)
+                    else:
+                        ok = File(path=path).write(data=data)
+                except Exception as error:
+                    Log.error('failed to write file %s: %s' % (path, error))
+            with self.__condition:
+                if stale:
+                    self.__coalesced += 1
+                elif ok:
+                    self.__written_count += 1
+                    self.__written[path] = version
+                else:
+                    self.__failed += 1
+                # finish writing
+                item = self.__writing.get(path)
+                if item is not None:
+                    if item[2] > 1:
+                        self.__writing[path] = (item[0], item[1], item[2] - 1)
+                    else:
+                        # nothing in flight, later writes will be newer
+                        self.__writing.pop(path)
+                        self.__written.pop(path, None)
+
+    def __next(self) -> Optional[Tuple[str, AnyStr, int]]:
+        """ Wait for the earliest pending data to be due """
+        with self.__condition:
+            while self.__running:
+                if len(self.__pending) == 0:
+                    self.__condition.wait()
+                    continue
+                path, (_, flush_time, _) = next(iter(self.__pending.items()))
+                delay = flush_time - time.time()
+                if delay > 0:
+                    self.__condition.wait(timeout=delay)
+                    continue
+                return self.__take(path=path)
+
+    def start(self):
+        self.__running = True
+        atexit.register(self.stop)
+        super().start()
+
+    def stop(self):
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+        self.flush()
+
+    def run(self):
+        while self.__running:
+            item = self.__next()
+            if item is not None:
+                self.__write(data=item[1], path=item[0], version=item[2])
+
+    def statistics(self, reset: bool = False) -> dict:
+        with self.__condition:
+            info = {
+                'pending': len(self.__pending),
+                'requests': self.__requests,
+                'coalesced': self.__coalesced,
+                'written': self.__written_count,
+                'failed': self.__failed,
+            }
+            if reset:
+                self.__requests = 0
+                self.__coalesced = 0
+                self.__written_count = 0
+                self.__failed = 0
+        return info
@@ -27,13 +27,42 @@
 """
     Log Util
     ~~~~~~~~
+
+    Leveled logging with lazy formatting:
+
+        self.debug('msg saved: %s -> %s', sender, receiver)
+
+    the arguments are only formatted when the level is enabled.
+
+    Levels can be set for each module or class:
+
+        Log.set_level(level=Log.DEBUG, tag='libs.server')
+        Log.set_level(level=Log.RELEASE, tag='MessageTable')
+
+    and messages on the hot path can be sampled (1 of every N):
+
+        self.info('message received: %s', signature, every=100)
 """
+
+import os
+import threading
 import time
+from collections import deque
+from typing import Optional, Dict, Tuple, List
+
+
+_timestamp = (0, '')  # (seconds, formatted string)
 
 
 def current_time() -> str:
-    time_array = time.localtime()
-    return time.strftime('%Y-%m-%d %H:%M:%S', time_array)
+    global _timestamp
+    now = int(time.time())
+    cached = _timestamp
+    if cached[0] == now:
+        return cached[1]
+    string = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+    _timestamp = (now, string)
+    return string
 
 
 DEBUG_FLAG = 0x01
@@ -42,6 +71,106 @@ WARNING_FLAG = 0x04
 ERROR_FLAG = 0x08
 
 
+class LogWriter:
+    """
+        Writing log lines into rotating files in a background thread,
+        the callers never wait for the disk (lines are dropped when the queue is full)
+    """
+
+    MAX_QUEUE = 65536
+    MAX_BYTES = 64 * 1024 * 1024
+    BACKUP_COUNT = 5
+    FLUSH_INTERVAL = 1.0  # seconds
+
+    def __init__(self, path: str, max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT):
+        super().__init__()
+        self.__path = path
+        self.__max_bytes = max_bytes
+        self.__backup_count = backup_count
+        self.__lines = deque()
+        self.__condition = threading.Condition()
+        self.__dropped = 0
+        self.__running = True
+        self.__file = None
+        self.__size = 0
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    @property
+    def dropped(self) -> int:
+        return self.__dropped
+
+    def write(self, line: str):
+        lines = self.__lines
+        if len(lines) >= self.MAX_QUEUE:
+            self.__dropped += 1
+            return
+        lines.append(line)
+        if len(lines) == 1:
+            with self.__condition:
+                self.__condition.notify()
+
+    def stop(self):
+        self.__running = False
+        with self.__condition:
+            self.__condition.notify()
+        self.__thread.join()
+
+    def __open(self):
+        directory = os.path.dirname(self.__path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.__file = open(self.__path, 'a', encoding='utf-8')
+        self.__size = self.__file.tell()
+
+    def __rotate(self):
+        self.__file.close()
+        self.__file = None
+        path = self.__path
+        for index in range(self.__backup_count - 1, 0, -1):
+            src = '%s.%d' % (path, index)
+            if os.path.exists(src):
+                os.replace(src, '%s.%d' % (path, index + 1))
+        if self.__backup_count > 0:
+            os.replace(path, '%s.1' % path)
+        else:
+            os.remove(path)
+        self.__open()
+
+    def __flush(self) -> bool:
+        lines = self.__lines
+        batch: List[str] = []
+        while len(lines) > 0:
+            batch.append(lines.popleft())
+        if len(batch) == 0:
+            return False
+        if self.__file is None:
+            self.__open()
+        batch.append('')
+        text = '\n'.join(batch)
+        self.__file.write(text)
+        self.__file.flush()
+        self.__size += len(text)
+        if self.__size > self.__max_bytes:
+            self.__rotate()
+        return True
+
+    def __run(self):
+        while self.__running:
+            try:
+                if not self.__flush():
+                    with self.__condition:
+                        if len(self.__lines) == 0 and self.__running:
+                            self.__condition.wait(timeout=self.FLUSH_INTERVAL)
+            except Exception as error:
+                print('[%s] ERROR - failed to write log: %s, %s' % (current_time(), self.__path, error))
+                time.sleep(self.FLUSH_INTERVAL)
+        self.__flush()
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
 class Log:
 
     DEBUG = 0xFF
@@ -50,41 +179,126 @@ class Log:
 
     LEVEL = RELEASE
 
+    # levels for modules or classes: 'libs.server' -> DEBUG, 'MessageTable' -> RELEASE
+    LEVELS: Dict[str, int] = {}
+
+    # writing into rotating files instead of stdout
+    writer: Optional[LogWriter] = None
+
+    __tags: Dict[type, Tuple[str, ...]] = {}  # class -> tags for level
+    __levels: Dict[object, Optional[int]] = {}  # tag/class -> level (None for the default LEVEL)
+    __counts: Dict[str, int] = {}  # msg -> count for sampling
+
+    @classmethod
+    def set_level(cls, level: int, tag: str = None):
+        """
+        Set log level
+
+        :param level: DEBUG, DEVELOP or RELEASE
+        :param tag:   module name or class name (None for all)
+        """
+        if tag is None:
+            cls.LEVEL = level
+        else:
+            cls.LEVELS[tag] = level
+            cls.__levels = {}
+
+    @classmethod
+    def __class_tags(cls, clazz: type) -> Tuple[str, ...]:
+        # class name, then module names from inner to outer
+        tags = [clazz.__name__]
+        module = clazz.__module__
+        while module:
+            tags.append(module)
+            pos = module.rfind('.')
+            module = module[:pos] if pos > 0 else None
+        return tuple(tags)
+
+    @classmethod
+    def level(cls, tag=None) -> int:
+        """ Get log level for the tag (module name, class name or class) """
+        if tag is None or len(cls.LEVELS) == 0:
+            return cls.LEVEL
+        levels = cls.__levels
+        try:
+            level = levels[tag]
+        except KeyError:
+            level = None
+            tags = cls.__class_tags(clazz=tag) if isinstance(tag, type) else (tag,)
+            for item in tags:
+                level = cls.LEVELS.get(item)
+                if level is not None:
+                    break
+            levels[tag] = level
+        return cls.LEVEL if level is None else level
+
+    @classmethod
+    def enabled(cls, flag: int, tag=None) -> bool:
+        return cls.level(tag=tag) & flag != 0
+
+    @classmethod
+    def __sampled(cls, msg: str, every: int) -> bool:
+        counts = cls.__counts
+        count = counts.get(msg, 0)
+        counts[msg] = count + 1
+        return count % every == 0
+
+    @classmethod
+    def log(cls, flag: int, prefix: str, msg: str, args: tuple, tag=None, every: int = 1):
+        if cls.level(tag=tag) & flag != 0:
+            cls.output(prefix=prefix, msg=msg, args=args, every=every)
+
+    @classmethod
+    def output(cls, prefix: str, msg: str, args: tuple, every: int = 1):
+        """ Format and write the message (level already checked) """
+        if every > 1:
+            if not cls.__sampled(msg=msg, every=every):
+                return None
+            prefix = '%s(1/%d) ' % (prefix, every)
+        if len(args) > 0:
+            msg = msg % args
+        line = '[%s] %s%s' % (current_time(), prefix, msg)
+        writer = cls.writer
+        if writer is None:
+            print(line)
+        else:
+            writer.write(line)
+
     @classmethod
-    def debug(cls, msg: str):
-        if cls.LEVEL & DEBUG_FLAG == 0:
-            return None
-        print('[%s] DEBUG - %s' % (current_time(), msg))
+    def debug(cls, msg: str, *args, tag: str = None, every: int = 1):
+        cls.log(DEBUG_FLAG, 'DEBUG - ', msg, args, tag=tag, every=every)
 
     @classmethod
-    def info(cls, msg: str):
-        if cls.LEVEL & INFO_FLAG == 0:
-            return None
-        print('[%s] %s' % (current_time(), msg))
+    def info(cls, msg: str, *args, tag: str = None, every: int = 1):
+        cls.log(INFO_FLAG, '', msg, args, tag=tag, every=every)
 
     @classmethod
-    def warning(cls, msg: str):
-        if cls.LEVEL & WARNING_FLAG == 0:
-            return None
-        print('[%s] %s' % (current_time(), msg))
+    def warning(cls, msg: str, *args, tag: str = None, every: int = 1):
+        cls.log(WARNING_FLAG, '', msg, args, tag=tag, every=every)
 
     @classmethod
-    def error(cls, msg: str):
-        if cls.LEVEL & ERROR_FLAG == 0:
-            return None
-        print('[%s] ERROR - %s' % (current_time(), msg))
+    def error(cls, msg: str, *args, tag: str = None, every: int = 1):
+        cls.log(ERROR_FLAG, 'ERROR - ', msg, args, tag=tag, every=every)
 
 
 class Logging:
 
-    def debug(self, msg: str):
-        Log.debug('%s >\t%s' % (self.__class__.__name__, msg))
+    def debug(self, msg: str, *args, every: int = 1):
+        clazz = self.__class__
+        if Log.level(tag=clazz) & DEBUG_FLAG != 0:
+            Log.output('DEBUG - %s >\t' % clazz.__name__, msg, args, every=every)
 
-    def info(self, msg: str):
-        Log.info('%s >\t%s' % (self.__class__.__name__, msg))
+    def info(self, msg: str, *args, every: int = 1):
+        clazz = self.__class__
+        if Log.level(tag=clazz) & INFO_FLAG != 0:
+            Log.output('%s >\t' % clazz.__name__, msg, args, every=every)
 
-    def warning(self, msg: str):
-        Log.warning('%s >\t%s' % (self.__class__.__name__, msg))
+    def warning(self, msg: str, *args, every: int = 1):
+        clazz = self.__class__
+        if Log.level(tag=clazz) & WARNING_FLAG != 0:
+            Log.output('%s >\t' % clazz.__name__, msg, args, every=every)
 
-    def error(self, msg: str):
-        Log.error('%s >\t%s' % (self.__class__.__name__, msg))
+    def error(self, msg: str, *args, every: int = 1):
+        clazz = self.__class__
+        if Log.level(tag=clazz) & ERROR_FLAG != 0:
+            Log.output('ERROR - %s >\t' % clazz.__name__, msg, args, every=every)
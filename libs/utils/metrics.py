@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Metrics
+    ~~~~~~~
+
+    Counters, gauges and latency histograms for the station,
+    exposed in Prometheus text format:
+
+        metrics = MetricsRegistry()
+        delivered = metrics.counter(name='dim_messages_delivered_total', labels={'kind': 'single'})
+        delivered.inc()
+
+        latency = metrics.histogram(name='dim_deliver_seconds')
+        latency.observe(elapsed)
+
+    Statistics of other components are collected only when scraped:
+
+        metrics.collector(name='dim_cache', func=CacheManager().statistics, label='pool')
+"""
+
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from typing import Optional, Dict, Tuple, List, Callable
+
+from .singleton import Singleton
+from .log import Log
+
+
+def label_string(labels: Optional[dict]) -> str:
+    if labels is None or len(labels) == 0:
+        return ''
+    items = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        items.append('%s="%s"' % (key, value))
+    return '{%s}' % ','.join(items)
+
+
+class Metric:
+
+    def __init__(self, name: str, labels: Optional[dict] = None):
+        super().__init__()
+        self.__name = name
+        self.__labels = labels
+        self.__key = name + label_string(labels=labels)
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def labels(self) -> Optional[dict]:
+        return self.__labels
+
+    @property
+    def key(self) -> str:
+        """ name with labels: 'dim_sessions{protocol="ws"}' """
+        return self.__key
+
+    def samples(self) -> List[Tuple[str, float]]:
+        """ Get (key, value) for exposition """
+        raise NotImplemented
+
+
+class Counter(Metric):
+    """ Monotonically increasing value """
+
+    def __init__(self, name: str, labels: Optional[dict] = None):
+        super().__init__(name=name, labels=labels)
+        self.__value = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def value(self) -> float:
+        return self.__value
+
+    def inc(self, amount: float = 1):
+        with self.__lock:
+            self.__value += amount
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(self.key, self.__value)]
+
+
+class Gauge(Metric):
+    """ Value goes up and down, or taken from a function when scraped """
+
+    def __init__(self, name: str, labels: Optional[dict] = None, func: Optional[Callable[[], float]] = None):
+        super().__init__(name=name, labels=labels)
+        self.__value = 0
+        self.__func = func
+        self.__lock = threading.Lock()
+
+    @property
+    def value(self) -> float:
+        func = self.__func
+        if func is None:
+            return self.__value
+        return func()
+
+    def set(self, value: float):
+        self.__value = value
+
+    def inc(self, amount: float = 1):
+        with self.__lock:
+            self.__value += amount
+
+    def dec(self, amount: float = 1):
+        with self.__lock:
+            self.__value -= amount
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(self.key, self.value)]
+
+
+class Histogram(Metric):
+    """
+        Latency histogram with log-linear buckets (like HdrHistogram):
+        values are counted in microseconds, each power of 2 is split into 16 sub-buckets,
+        so the relative error of percentiles is less than 1/16.
+    """
+
+    SUB_BITS = 5
+    SUB_COUNT = 1 << (SUB_BITS - 1)  # 16 sub-buckets for each power of 2
+
+    QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+    def __init__(self, name: str, labels: Optional[dict] = None):
+        super().__init__(name=name, labels=labels)
+        self.__buckets: Dict[int, int] = {}  # index -> count
+        self.__count = 0
+        self.__sum = 0.0
+        self.__max = 0.0
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def index(cls, micros: int) -> int:
+        """ Get bucket index for the value (in microseconds) """
+        if micros < (cls.SUB_COUNT << 1):
+            return micros
+        shift = micros.bit_length() - cls.SUB_BITS
+        return shift * cls.SUB_COUNT + (micros >> shift)
+
+    @classmethod
+    def bounds(cls, index: int) -> Tuple[int, int]:
+        """ Get range [low, high) of the bucket (in microseconds) """
+        if index < (cls.SUB_COUNT << 1):
+            return index, index + 1
+        shift = index // cls.SUB_COUNT - 1
+        mantissa = index - shift * cls.SUB_COUNT
+        return mantissa << shift, (mantissa + 1) << shift
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    def observe(self, seconds: float):
+        micros = int(seconds * 1000000)
+        if micros < 0:
+            micros = 0
+        index = self.index(micros=micros)
+        with self.__lock:
+            self.__buckets[index] = self.__buckets.get(index, 0) + 1
+            self.__count += 1
+            self.__sum += seconds
+            if seconds > self.__max:
+                self.__max = seconds
+
+    def time(self):
+        """ Observe the time spent in a 'with' block """
+        return _Timer(histogram=self)
+
+    def percentiles(self, quantiles=QUANTILES) -> Dict[float, float]:
+        """ Get values (in seconds) at the quantiles """
+        with self.__lock:
+            buckets = sorted(self.__buckets.items())
+            count = self.__count
+            max_value = self.__max
+        results = {}
+        if count == 0:
+            for q in quantiles:
+                results[q] = 0.0
+            return results
+        targets = sorted(quantiles)
+        pos = 0
+        seen = 0
+        for index, num in buckets:
+            seen += num
+            while pos < len(targets) and seen >= targets[pos] * count:
+                low, high = self.bounds(index=index)
+                value = (low + high) / 2000000.0
+                results[targets[pos]] = min(value, max_value)
+                pos += 1
+            if pos == len(targets):
+                break
+        while pos < len(targets):
+            results[targets[pos]] = max_value
+            pos += 1
+        return results
+
+    def statistics(self, reset: bool = False) -> dict:
+        info = {
+            'count': self.__count,
+            'sum': self.__sum,
+            'max': self.__max,
+        }
+        for q, value in self.percentiles().items():
+            info['p%s' % ('%g' % (q * 100))] = value
+        if reset:
+            self.reset()
+        return info
+
+    def reset(self):
+        with self.__lock:
+            self.__buckets = {}
+            self.__count = 0
+            self.__sum = 0.0
+            self.__max = 0.0
+
+    def samples(self) -> List[Tuple[str, float]]:
+        name = self.name
+        labels = self.labels
+        array = []
+        for q, value in self.percentiles().items():
+            tags = {} if labels is None else labels.copy()
+            tags['quantile'] = '%g' % q
+            array.append((name + label_string(labels=tags), value))
+        suffix = label_string(labels=labels)
+        array.append(('%s_sum%s' % (name, suffix), self.__sum))
+        array.append(('%s_count%s' % (name, suffix), self.__count))
+        return array
+
+
+class _Timer:
+
+    def __init__(self, histogram: Histogram):
+        super().__init__()
+        self.__histogram = histogram
+        self.__start = 0
+
+    def __enter__(self):
+        self.__start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__histogram.observe(time.time() - self.__start)
+
+
+def flatten(prefix: str, info: dict, labels: dict, results: List[Tuple[str, float]]):
+    """ Convert statistics into samples: {'depth': 1, 'single': {...}} """
+    for key, value in info.items():
+        if isinstance(value, bool):
+            value = 1 if value else 0
+        if isinstance(value, (int, float)):
+            results.append(('%s_%s%s' % (prefix, key, label_string(labels=labels)), value))
+        elif isinstance(value, dict):
+            flatten(prefix='%s_%s' % (prefix, key), info=value, labels=labels, results=results)
+
+
+@Singleton
+class MetricsRegistry:
+    """ All metrics in this process """
+
+    def __init__(self):
+        super().__init__()
+        self.__metrics: Dict[str, Metric] = {}  # key -> metric
+        self.__helps: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self.__collectors: Dict[str, Tuple[Callable[[], dict], Optional[str]]] = {}
+        self.__lock = threading.Lock()
+
+    def __get(self, clazz, kind: str, name: str, labels: Optional[dict], desc: Optional[str], **kwargs):
+        key = name + label_string(labels=labels)
+        metric = self.__metrics.get(key)
+        if metric is None:
+            with self.__lock:
+                metric = self.__metrics.get(key)
+                if metric is None:
+                    metric = clazz(name=name, labels=labels, **kwargs)
+                    self.__metrics[key] = metric
+                    if name not in self.__helps:
+                        self.__helps[name] = (kind, desc)
+        assert isinstance(metric, clazz), 'metric type error: %s, %s' % (key, metric)
+        return metric
+
+    def counter(self, name: str, labels: Optional[dict] = None, desc: str = None) -> Counter:
+        """ Get counter with name and labels, create it if not exists """
+        return self.__get(Counter, 'counter', name=name, labels=labels, desc=desc)
+
+    def gauge(self, name: str, labels: Optional[dict] = None, desc: str = None,
+              func: Optional[Callable[[], float]] = None) -> Gauge:
+        """ Get gauge with name and labels, create it if not exists """
+        return self.__get(Gauge, 'gauge', name=name, labels=labels, desc=desc, func=func)
+
+    def histogram(self, name: str, labels: Optional[dict] = None, desc: str = None) -> Histogram:
+        """ Get latency histogram with name and labels, create it if not exists """
+        return self.__get(Histogram, 'summary', name=name, labels=labels, desc=desc)
+
+    def collector(self, name: str, func: Callable[[], dict], label: Optional[str] = None):
+        """
+        Add statistics function, which will be called only when scraped
+
+        :param name:  metric name prefix
+        :param func:  statistics function returns {'key': number}
+                      or {'label value': {'key': number}} when label given
+        :param label: label name for the first level keys
+        """
+        with self.__lock:
+            self.__collectors[name] = (func, label)
+
+    def samples(self) -> List[Tuple[str, float]]:
+        with self.__lock:
+            metrics = sorted(self.__metrics.values(), key=lambda m: (m.name, m.key))
+            collectors = list(self.__collectors.items())
+        results = []
+        for item in metrics:
+            results.extend(item.samples())
+        for name, (func, label) in collectors:
+            try:
+                info = func()
+            except Exception as error:
+                Log.error('failed to collect metrics: %s, %s', name, error)
+                continue
+            if label is None:
+                flatten(prefix=name, info=info, labels={}, results=results)
+                continue
+            for value, stats in info.items():
+                if isinstance(stats, dict):
+                    flatten(prefix=name, info=stats, labels={label: value}, results=results)
+        return results
+
+    def exposition(self) -> str:
+        """ Get all metrics in Prometheus text format """
+        lines = []
+        with self.__lock:
+            helps = self.__helps.copy()
+        described = set()
+        for key, value in self.samples():
+            pos = key.find('{')
+            name = key if pos < 0 else key[:pos]
+            if name not in described:
+                described.add(name)
+                info = helps.get(name)
+                if info is not None:
+                    if info[1] is not None:
+                        lines.append('# HELP %s %s' % (name, info[1]))
+                    lines.append('# TYPE %s %s' % (name, info[0]))
+            if isinstance(value, float):
+                lines.append('%s %s' % (key, repr(value)))
+            else:
+                lines.append('%s %d' % (key, value))
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        body = MetricsRegistry().exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # noinspection PyShadowingBuiltins
+    def log_message(self, format, *args):
+        # scraped periodically, don't flood the log
+        pass
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """ Local HTTP endpoint for scraping: 'GET /metrics' """
+
+    daemon_threads = True
+
+    def __init__(self, server_address: tuple = ('127.0.0.1', 9395)):
+        super().__init__(server_address, MetricsHandler)
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread = thread
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
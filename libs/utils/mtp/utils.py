@@ -1,21 +1,26 @@
 # -*- coding: utf-8 -*-
 
 import json
-from typing import Optional
+from typing import Optional, Union, Dict
 
 from dmtp.mtp.tlv.utils import base64_encode, base64_decode
-from dmtp.mtp.tlv import Data, MutableData, VarIntData
+from dmtp.mtp.tlv.utils import int_to_bytes, bytes_to_varint, varint_to_bytes
+from dmtp.mtp.tlv import Data
 from dmtp.mtp import Header, Package
 from dmtp.mtp import DataType, TransactionID
 
-from dmtp import Message
-from dmtp import StringValue, BinaryValue
-
 from dimp import ReliableMessage
 
 
 class MTPUtils:
 
+    # fields of reliable message which can be carried by D-MTP
+    MESSAGE_FIELDS = {
+        'sender', 'receiver', 'time', 'type', 'group',
+        'data', 'signature', 'key', 'keys',
+        'meta', 'visa', 'profile',
+    }
+
     @classmethod
     def parse_head(cls, data: bytes) -> Header:
         return Header.parse(data=Data(data=data))
@@ -30,9 +35,30 @@ class MTPUtils:
             body = Data(data=body)
         return Package.new(data_type=data_type, sn=sn, body_length=body.length, body=body)
 
+    @classmethod
+    def is_compatible(cls, msg: ReliableMessage) -> bool:
+        """ Check whether all fields in this message can be serialized to D-MTP """
+        for name in msg.dictionary:
+            if name not in cls.MESSAGE_FIELDS:
+                return False
+        return True
+
     @classmethod
     def serialize_message(cls, msg: ReliableMessage) -> bytes:
         info = msg.dictionary
+        buffer = bytearray()
+        #
+        #  envelope
+        #
+        append_field(buffer, b'S\0', utf8_encode(info.get('sender')))
+        append_field(buffer, b'R\0', utf8_encode(info.get('receiver')))
+        when = info.get('time')
+        if when is not None:
+            append_field(buffer, b'W\0', int_to_bytes(value=int(when) & 0xFFFFFFFF, length=4))
+        msg_type = info.get('type')
+        if msg_type is not None:
+            append_field(buffer, b'T\0', int_to_bytes(value=int(msg_type) & 0xFF, length=1))
+        append_field(buffer, b'G\0', utf8_encode(info.get('group')))
         #
         #  body
         #
@@ -41,14 +67,14 @@ class MTPUtils:
             assert isinstance(content, str), 'reliable message content error: %s' % content
             if content.startswith('{'):
                 # JsON
-                info['data'] = content.encode('utf-8')
+                append_field(buffer, b'D\0', content.encode('utf-8'))
             else:
                 # Base64
-                info['data'] = base64_decode(string=content)
+                append_field(buffer, b'D\0', base64_decode(string=content))
         signature = info.get('signature')
         if signature is not None:
             assert isinstance(signature, str), 'reliable message signature error: %s' % signature
-            info['signature'] = base64_decode(string=signature)
+            append_field(buffer, b'V\0', base64_decode(string=signature))
         # symmetric key/keys
         key = info.get('key')
         if key is None:
@@ -56,10 +82,10 @@ class MTPUtils:
             if keys is not None:
                 assert isinstance(keys, dict), 'reliable message keys error: %s' % keys
                 # DMTP store both 'keys' and 'key' in 'key'
-                info['key'] = b'KEYS:' + cls.__build_keys(keys=keys)
+                append_field(buffer, b'K\0', b'KEYS:' + cls.__build_keys(keys=keys))
         else:
             assert isinstance(key, str), 'reliable message key error: %s' % key
-            info['key'] = base64_decode(string=key)
+            append_field(buffer, b'K\0', base64_decode(string=key))
         #
         #  attachments
         #
@@ -67,106 +93,161 @@ class MTPUtils:
         if meta is not None:
             # dict to JSON
             assert isinstance(meta, dict), 'meta error: %s' % meta
-            info['meta'] = json.dumps(meta).encode('utf-8')
-        profile = info.get('profile')
+            append_field(buffer, b'M\0', json.dumps(meta).encode('utf-8'))
+        # D-MTP carries visa in field 'profile'
+        profile = info.get('visa')
+        if profile is None:
+            profile = info.get('profile')
         if profile is not None:
             # dict to JSON
             assert isinstance(profile, dict), 'profile error: %s' % profile
-            info['profile'] = json.dumps(profile).encode('utf-8')
-
-        # create as message
-        msg = Message.new(info=info)
-        return msg.get_bytes()
+            append_field(buffer, b'P\0', json.dumps(profile).encode('utf-8'))
+        return bytes(buffer)
 
     @classmethod
     def deserialize_message(cls, data: bytes) -> Optional[ReliableMessage]:
-        msg = Message.parse(data=Data(data=data))
-        if msg is None or msg.sender is None or msg.receiver is None:
+        fields = parse_fields(data=data)
+        sender = fields.get(b'S')
+        receiver = fields.get(b'R')
+        if sender is None or receiver is None:
             raise ValueError('failed to deserialize data: %s' % data)
         #
         #  envelope
         #
+        when = fields.get(b'W')
         info = {
-            'sender': msg.sender,
-            'receiver': msg.receiver,
-            'time': msg.time,
+            'sender': str(sender, 'utf-8'),
+            'receiver': str(receiver, 'utf-8'),
+            'time': 0 if when is None else int.from_bytes(when[:4], byteorder='big'),
         }
-        msg_type = msg.type
-        if msg_type > 0:
-            info['type'] = msg_type
-        group = msg.group
+        msg_type = fields.get(b'T')
+        if msg_type is not None and msg_type[0] > 0:
+            info['type'] = msg_type[0]
+        group = fields.get(b'G')
         if group is not None:
-            info['group'] = group
+            info['group'] = str(group, 'utf-8')
         #
         #  body
         #
-        content = msg.content
+        content = fields.get(b'D')
         if content is not None:
-            content = content.get_bytes()
-            if content.startswith(b'{'):
+            text = cls.__json_text(data=content)
+            if text is not None:
                 # JsON
-                info['data'] = content.decode('utf-8')
+                info['data'] = text
             else:
                 # Base64
                 info['data'] = base64_encode(data=content)
-        signature = msg.signature
+        signature = fields.get(b'V')
         if signature is not None:
-            info['signature'] = base64_encode(data=signature.get_bytes())
+            info['signature'] = base64_encode(data=signature)
         # symmetric key/keys
-        key = msg.key
-        if key is not None and key.length > 5:
-            starts = key.slice(end=5).get_bytes()
-            if starts == b'KEYS:':
-                info['keys'] = cls.__parse_keys(data=key.slice(start=5))
+        key = fields.get(b'K')
+        if key is not None and len(key) > 5:
+            if key[:5] == b'KEYS:':
+                info['keys'] = cls.__parse_keys(data=key[5:])
             else:
-                info['key'] = base64_encode(data=key.get_bytes())
+                info['key'] = base64_encode(data=key)
         #
         #  attachments
         #
-        meta = msg.meta
-        if meta is not None and meta.length > 0:
+        meta = fields.get(b'M')
+        if meta is not None:
             # JSON to dict
-            meta = meta.get_bytes().decode('utf-8')
-            info['meta'] = json.loads(meta)
-        profile = msg.profile
-        if profile is not None and profile.length > 0:
+            info['meta'] = json.loads(str(meta, 'utf-8'))
+        profile = fields.get(b'P')
+        if profile is not None:
             # JSON to dict
-            profile = profile.get_bytes().decode('utf-8')
-            info['profile'] = json.loads(profile)
+            info['profile'] = json.loads(str(profile, 'utf-8'))
 
         # create reliable message
         return ReliableMessage.parse(msg=info)
 
     @classmethod
-    def __parse_keys(cls, data: Data) -> dict:
+    def __json_text(cls, data: memoryview) -> Optional[str]:
+        # encrypted content may start with '{' too
+        if data[0] == 0x7B and data[-1] == 0x7D:  # '{' ... '}'
+            try:
+                return str(data, 'utf-8')
+            except UnicodeDecodeError:
+                pass
+
+    @classmethod
+    def __parse_keys(cls, data: memoryview) -> dict:
         keys = {}
-        while data.length > 0:
-            # get key length
-            size = VarIntData(data=data)
-            data = data.slice(start=size.length)
+        pos = 0
+        end = len(data)
+        while pos < end:
             # get key name
-            name = StringValue(data=data.slice(end=size.value))
-            data = data.slice(start=size.value)
-            # get value length
-            size = VarIntData(data=data)
-            data = data.slice(start=size.length)
+            size, length = bytes_to_varint(data=data, start=pos, end=end)
+            pos += length
+            name = data[pos:pos+size]
+            pos += size
             # get value
-            value = BinaryValue(data=data.slice(end=size.value))
-            data = data.slice(start=size.value)
-            assert name.length > 0, 'key name empty'
-            if value.length > 0:
-                keys[name.string] = base64_encode(data=value.get_bytes())
+            size, length = bytes_to_varint(data=data, start=pos, end=end)
+            pos += length
+            value = data[pos:pos+size]
+            pos += size
+            if pos > end:
+                raise ValueError('keys length error: %d, %d' % (pos, end))
+            if len(name) == 0:
+                raise ValueError('key name empty')
+            if size > 0:
+                keys[str(name, 'utf-8')] = base64_encode(data=value)
         return keys
 
     @classmethod
     def __build_keys(cls, keys: dict) -> bytes:
-        data = MutableData(capacity=512)
+        buffer = bytearray()
         for (identifier, base64) in keys.items():
-            id_value = StringValue(string=identifier)
-            if id_value.length > 0 and base64 is not None and len(base64) > 0:
-                key_value = BinaryValue(data=base64_decode(string=base64))
-                data.append(VarIntData(value=id_value.length))
-                data.append(id_value)
-                data.append(VarIntData(value=key_value.length))
-                data.append(key_value)
-        return data.get_bytes()
+            if identifier is not None and len(identifier) > 0 and base64 is not None and len(base64) > 0:
+                name = identifier.encode('utf-8')
+                value = base64_decode(string=base64)
+                buffer += varint_to_bytes(value=len(name))
+                buffer += name
+                buffer += varint_to_bytes(value=len(value))
+                buffer += value
+        return bytes(buffer)
+
+
+def utf8_encode(string: Optional[str]) -> Optional[bytes]:
+    if string is not None:
+        return string.encode('utf-8')
+
+
+def append_field(buffer: bytearray, tag: bytes, value: Optional[bytes]):
+    """ Append field: tag ('name' + '\\0'), length (varint), value """
+    if value is not None:
+        buffer += tag
+        buffer += varint_to_bytes(value=len(value))
+        buffer += value
+
+
+def parse_fields(data: Union[bytes, bytearray, memoryview]) -> Dict[bytes, memoryview]:
+    """ Parse message fields with one cursor over the data, values are views of it """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    view = memoryview(data)
+    fields = {}
+    pos = 0
+    end = len(data)
+    while pos < end:
+        # get tag
+        zero = data.find(b'\0', pos)
+        if zero < 0:
+            raise ValueError('field tag error at %d: %s' % (pos, data))
+        tag = data[pos:zero]
+        pos = zero + 1
+        # get length
+        size, length = bytes_to_varint(data=data, start=pos, end=end)
+        pos += length
+        # get value
+        if pos + size > end:
+            raise ValueError('field length error: %d, %d' % (pos + size, end))
+        if size > 0:
+            fields[tag] = view[pos:pos+size]
+        else:
+            # empty value
+            fields.pop(tag, None)
+        pos += size
+    return fields
@@ -28,10 +28,15 @@
 # SOFTWARE.
 # ==============================================================================
 
+import asyncio
+import threading
+import time
 import traceback
-from weakref import WeakSet
+import weakref
+from collections import OrderedDict
+from weakref import WeakSet, WeakKeyDictionary
 from abc import ABC, abstractmethod
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, Tuple, Callable
 
 from .singleton import Singleton
 from .log import Log
@@ -77,6 +82,208 @@ class NotificationObserver(ABC):
         raise NotImplemented
 
 
+def notify(observer: NotificationObserver, notification: Notification):
+    try:
+        assert isinstance(observer, NotificationObserver), 'notification observer error: %s' % observer
+        observer.received_notification(notification=notification)
+    except Exception as error:
+        Log.error('failed to call notification observer %s: %s' % (observer, error))
+        traceback.print_exc()
+
+
+def sender_key(notification: Notification) -> Any:
+    """ Default key for coalescing: name + sender """
+    return notification.name, id(notification.sender)
+
+
+def user_key(notification: Notification) -> Any:
+    """ Key for coalescing: name + user ID in info """
+    info = notification.info
+    return notification.name, None if info is None else info.get('ID')
+
+
+class NotificationQueue:
+    """
+        Bounded queue for delivering notifications to one observer asynchronously,
+        drained by a worker thread, or by an event loop if given.
+
+        Back-pressure policies when the queue is full:
+            DROP_OLDEST - drop the oldest notification waiting
+            BLOCK       - block the poster until there is room (or timeout)
+            COALESCE    - replace the waiting one with the same key,
+                          then drop the oldest if still full
+    """
+
+    DROP_OLDEST = 'drop-oldest'
+    BLOCK = 'block'
+    COALESCE = 'coalesce'
+
+    MAX_SIZE = 1024
+    BLOCK_TIMEOUT = 2.0  # seconds
+
+    def __init__(self, observer: NotificationObserver, max_size: int = 0, policy: str = DROP_OLDEST,
+                 key: Callable[[Notification], Any] = sender_key, loop=None):
+        """
+        Create queue for observer
+
+        :param observer: notification observer
+        :param max_size: max notifications waiting
+        :param policy:   back-pressure policy
+        :param key:      key for coalescing notifications
+        :param loop:     asyncio event loop to drain the queue (instead of a worker thread)
+        """
+        super().__init__()
+        assert policy in [self.DROP_OLDEST, self.BLOCK, self.COALESCE], 'policy error: %s' % policy
+        self.__observer = weakref.ref(observer)
+        self.__max_size = max_size if max_size > 0 else self.MAX_SIZE
+        self.__policy = policy
+        self.__key = key
+        self.__loop = loop
+        self.__events: Dict[Any, Notification] = OrderedDict()  # key -> notification
+        self.__sn = 0  # key for notifications not coalesced
+        self.__condition = threading.Condition()
+        self.__running = True
+        self.__scheduled = False
+        self.__thread: Optional[threading.Thread] = None
+        # statistics
+        self.__max_depth = 0
+        self.__posted = 0
+        self.__delivered = 0
+        self.__dropped = 0
+        self.__coalesced = 0
+
+    @property
+    def observer(self) -> Optional[NotificationObserver]:
+        return self.__observer()
+
+    @property
+    def depth(self) -> int:
+        return len(self.__events)
+
+    def put(self, notification: Notification) -> bool:
+        """
+        Append notification for delivering
+
+        :param notification: notification
+        :return: False on dropped
+        """
+        with self.__condition:
+            if not self.__running:
+                return False
+            self.__posted += 1
+            events = self.__events
+            if self.__policy == self.COALESCE:
+                key = self.__key(notification)
+                if key in events:
+                    # replace the waiting one
+                    events[key] = notification
+                    self.__coalesced += 1
+                    return True
+            else:
+                self.__sn += 1
+                key = self.__sn
+            if len(events) >= self.__max_size and self.__policy == self.BLOCK:
+                expired = time.time() + self.BLOCK_TIMEOUT
+                while len(events) >= self.__max_size and self.__running:
+                    timeout = expired - time.time()
+                    if timeout <= 0 or self.__draining():
+                        # waiting timeout, or blocked by the deliverer itself
+                        self.__dropped += 1
+                        return False
+                    self.__condition.wait(timeout=timeout)
+            while len(events) >= self.__max_size:
+                # drop the oldest
+                events.popitem(last=False)
+                self.__dropped += 1
+            events[key] = notification
+            if len(events) > self.__max_depth:
+                self.__max_depth = len(events)
+            self.__condition.notify_all()
+        self.__wakeup()
+        return True
+
+    def __draining(self) -> bool:
+        thread = self.__thread
+        if thread is not None:
+            return thread is threading.current_thread()
+        try:
+            return asyncio.get_running_loop() is self.__loop
+        except RuntimeError:
+            return False
+
+    def __pop(self) -> Optional[Notification]:
+        with self.__condition:
+            if len(self.__events) == 0:
+                return None
+            _, notification = self.__events.popitem(last=False)
+            self.__delivered += 1
+            self.__condition.notify_all()
+            return notification
+
+    def __wakeup(self):
+        loop = self.__loop
+        if loop is None:
+            if self.__thread is None:
+                with self.__condition:
+                    if self.__thread is None:
+                        thread = threading.Thread(target=self.__run, daemon=True)
+                        self.__thread = thread
+                        thread.start()
+        elif not self.__scheduled:
+            self.__scheduled = True
+            loop.call_soon_threadsafe(self.drain)
+
+    def drain(self) -> int:
+        """ Deliver all notifications waiting """
+        self.__scheduled = False
+        count = 0
+        while True:
+            notification = self.__pop()
+            if notification is None:
+                break
+            observer = self.__observer()
+            if observer is None:
+                # observer released
+                self.stop()
+                break
+            notify(observer=observer, notification=notification)
+            count += 1
+        return count
+
+    def __run(self):
+        while self.__running:
+            with self.__condition:
+                while len(self.__events) == 0 and self.__running:
+                    self.__condition.wait()
+            self.drain()
+
+    def stop(self):
+        with self.__condition:
+            self.__running = False
+            self.__events.clear()
+            self.__condition.notify_all()
+
+    def statistics(self, reset: bool = False) -> dict:
+        with self.__condition:
+            info = {
+                'policy': self.__policy,
+                'depth': len(self.__events),
+                'max_size': self.__max_size,
+                'max_depth': self.__max_depth,
+                'posted': self.__posted,
+                'delivered': self.__delivered,
+                'dropped': self.__dropped,
+                'coalesced': self.__coalesced,
+            }
+            if reset:
+                self.__max_depth = len(self.__events)
+                self.__posted = 0
+                self.__delivered = 0
+                self.__dropped = 0
+                self.__coalesced = 0
+            return info
+
+
 @Singleton
 class NotificationCenter:
     """ Notification dispatcher """
@@ -84,6 +291,27 @@ class NotificationCenter:
     def __init__(self):
         super().__init__()
         self.__observers: Dict[str, WeakSet] = {}
+        self.__snapshots: Dict[str, Tuple[weakref.ref, ...]] = {}  # name -> observer refs
+        self.__queues: Dict[NotificationObserver, NotificationQueue] = WeakKeyDictionary()
+        self.__lock = threading.Lock()
+
+    def set_queue(self, observer: NotificationObserver, queue: Optional[NotificationQueue]):
+        """
+        Deliver all notifications to this observer asynchronously via the queue
+
+        :param observer: notification observer
+        :param queue:    notification queue for this observer (if empty, call the observer directly)
+        :return:
+        """
+        assert queue is None or queue.observer is observer, 'queue not for this observer: %s' % observer
+        with self.__lock:
+            if queue is None:
+                old = self.__queues.pop(observer, None)
+            else:
+                old = self.__queues.get(observer)
+                self.__queues[observer] = queue
+        if old is not None and old is not queue:
+            old.stop()
 
     def add(self, observer: NotificationObserver, name: str):
         """
@@ -93,19 +321,22 @@ class NotificationCenter:
         :param name:     notification name
         :return:
         """
-        array = self.__observers.get(name)
-        if array is None:
-            array = WeakSet()
-            self.__observers[name] = array
-        elif observer in array:
-            # already exists
-            return
-        array.add(observer)
+        with self.__lock:
+            array = self.__observers.get(name)
+            if array is None:
+                array = WeakSet()
+                self.__observers[name] = array
+            elif observer in array:
+                # already exists
+                return
+            array.add(observer)
+            self.__snapshots.pop(name, None)
 
     def __remove(self, observer: NotificationObserver, name: str):
         array = self.__observers.get(name)
         if array is not None:
             array.discard(observer)
+            self.__snapshots.pop(name, None)
 
     def remove(self, observer: NotificationObserver, name: str = None):
         """
@@ -115,12 +346,33 @@ class NotificationCenter:
         :param name:     notification name (if empty, remove from all names)
         :return:
         """
-        if name is None:
-            keys = self.__observers.keys()
-            for item in keys:
-                self.__remove(observer=observer, name=item)
-        else:
-            self.__remove(observer=observer, name=name)
+        with self.__lock:
+            if name is None:
+                keys = self.__observers.keys()
+                for item in keys:
+                    self.__remove(observer=observer, name=item)
+            else:
+                self.__remove(observer=observer, name=name)
+            # stop the queue when the observer not observing any more
+            for array in self.__observers.values():
+                if observer in array:
+                    return
+            queue = self.__queues.pop(observer, None)
+        if queue is not None:
+            queue.stop()
+
+    def __observer_refs(self, name: str) -> Tuple[weakref.ref, ...]:
+        # snapshot of the current observers, rebuilt only when observers changed
+        refs = self.__snapshots.get(name)
+        if refs is None:
+            with self.__lock:
+                array = self.__observers.get(name)
+                if array is None:
+                    refs = ()
+                else:
+                    refs = tuple([weakref.ref(item) for item in array])
+                self.__snapshots[name] = refs
+        return refs
 
     def post(self, notification: Notification = None,
              name: str = None, sender: Any = None, info: dict = None):
@@ -137,15 +389,27 @@ class NotificationCenter:
             assert name is not None, 'Notification name empty'
             assert sender is not None, 'Notification sender empty'
             notification = Notification(name=name, sender=sender, info=info)
-        # temporary array buffer, used as a snapshot of the state of current observers
-        array = self.__observers.get(notification.name)
-        if array is not None:
-            array = array.copy()
-            # call observers one by one
-            for observer in array:
-                try:
-                    assert isinstance(observer, NotificationObserver), 'notification observer error: %s' % observer
-                    observer.received_notification(notification=notification)
-                except Exception as error:
-                    Log.error('failed to call notification observer %s: %s' % (observer, error))
-                    traceback.print_exc()
+        queues = self.__queues
+        for ref in self.__observer_refs(name=notification.name):
+            observer = ref()
+            if observer is None:
+                # released
+                continue
+            queue = queues.get(observer)
+            if queue is None:
+                # call observer directly
+                notify(observer=observer, notification=notification)
+            else:
+                queue.put(notification=notification)
+
+    def statistics(self, reset: bool = False) -> Dict[str, dict]:
+        """ Get statistics of all queues (observer class name -> counters) """
+        with self.__lock:
+            queues = list(self.__queues.items())
+        info = {}
+        for observer, queue in queues:
+            name = observer.__class__.__name__
+            if name in info:
+                name = '%s#%x' % (name, id(observer))
+            info[name] = queue.statistics(reset=reset)
+        return info
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Message Tracer
+    ~~~~~~~~~~~~~~
+
+    Recording time of each stage for sampled messages (keyed by signature),
+    the latencies between stages are aggregated into histograms:
+
+        dim_trace_stage_seconds{stage="verify",quantile="0.99"}
+
+    Stages on the station:
+
+        received -> deserialize -> verify -> filter -> dispatch -> worker -> push -> sent
+                                                                         \\-> cached
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from .singleton import Singleton
+from .metrics import MetricsRegistry, Histogram
+
+
+@Singleton
+class Tracer:
+
+    RATE = 0.0        # default sampling rate (0.0 - 1.0), 0 to disable tracing
+    MAX_TRACES = 4096  # max messages tracing at the same time
+    EXPIRES = 600      # seconds
+
+    def __init__(self):
+        super().__init__()
+        # signature -> (start time, last time)
+        self.__traces: Dict[str, Tuple[float, float]] = OrderedDict()
+        self.__rate = self.RATE
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__stages: Dict[str, Histogram] = {}
+        self.__totals: Dict[str, Histogram] = {}
+
+    def __stage(self, name: str) -> Histogram:
+        histogram = self.__stages.get(name)
+        if histogram is None:
+            histogram = MetricsRegistry().histogram(name='dim_trace_stage_seconds', labels={'stage': name},
+                                                    desc='Time spent on each stage of sampled messages')
+            self.__stages[name] = histogram
+        return histogram
+
+    def __total(self, name: str) -> Histogram:
+        histogram = self.__totals.get(name)
+        if histogram is None:
+            histogram = MetricsRegistry().histogram(name='dim_trace_total_seconds', labels={'result': name},
+                                                    desc='Time from received to sent/cached of sampled messages')
+            self.__totals[name] = histogram
+        return histogram
+
+    @property
+    def rate(self) -> float:
+        return self.__rate
+
+    @rate.setter
+    def rate(self, value: float):
+        """ Set sampling rate (0.0 - 1.0) """
+        self.__rate = value
+
+    def arrive(self):
+        """ Package received by this thread, call it before parsing """
+        if self.__rate > 0:
+            self.__local.arrival = time.time()
+
+    def begin(self, msg: dict, stage: str = 'deserialize'):
+        """ Message parsed, start tracing if sampled """
+        rate = self.__rate
+        if rate <= 0:
+            return
+        if rate < 1 and random.random() >= rate:
+            return
+        signature = msg.get('signature')
+        if signature is None:
+            return
+        now = time.time()
+        arrival = getattr(self.__local, 'arrival', None)
+        self.__local.arrival = None
+        if arrival is None:
+            arrival = now
+        else:
+            self.__stage(name=stage).observe(now - arrival)
+        with self.__lock:
+            traces = self.__traces
+            traces[signature] = (arrival, now)
+            # remove the oldest traces
+            while len(traces) > self.MAX_TRACES:
+                traces.popitem(last=False)
+            expired = now - self.EXPIRES
+            while len(traces) > 0:
+                first = next(iter(traces.values()))
+                if first[0] > expired:
+                    break
+                traces.popitem(last=False)
+
+    def mark(self, msg: dict, stage: str):
+        """ Message passed the stage """
+        if len(self.__traces) == 0:
+            return
+        signature = msg.get('signature')
+        now = time.time()
+        with self.__lock:
+            trace = self.__traces.get(signature)
+            if trace is None:
+                return
+            self.__traces[signature] = (trace[0], now)
+        self.__stage(name=stage).observe(now - trace[1])
+
+    def end(self, msg: dict, stage: str):
+        """ Message sent or cached, stop tracing """
+        if len(self.__traces) == 0:
+            return
+        signature = msg.get('signature')
+        now = time.time()
+        with self.__lock:
+            trace = self.__traces.pop(signature, None)
+        if trace is None:
+            return
+        self.__stage(name=stage).observe(now - trace[1])
+        self.__total(name=stage).observe(now - trace[0])
+
+    @property
+    def tracing(self) -> int:
+        return len(self.__traces)
+
+    def statistics(self, reset: bool = False) -> Dict[str, dict]:
+        """ Get latency percentiles of each stage """
+        info = {}
+        for name, histogram in list(self.__stages.items()):
+            info[name] = histogram.statistics(reset=reset)
+        for name, histogram in list(self.__totals.items()):
+            info['total:%s' % name] = histogram.statistics(reset=reset)
+        return info
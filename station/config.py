@@ -44,6 +44,7 @@ from libs.server import Dispatcher
 #
 from etc.config import apns_credentials, apns_use_sandbox, apns_topic
 from etc.config import bind_host, bind_port
+from etc.config import dispatcher_shards
 
 from etc.cfg_init import g_database, g_facebook, g_keystore
 from etc.cfg_init import station_id, create_station, neighbor_stations
@@ -66,6 +67,7 @@ g_facebook.messenger = g_messenger
     A dispatcher to decide which way to deliver message.
 """
 g_dispatcher = Dispatcher()
+g_dispatcher.shards = dispatcher_shards
 
 
 """
@@ -40,6 +40,7 @@ from dimsdk import MessengerDelegate
 
 from libs.utils import Logging
 from libs.utils import NotificationCenter
+from libs.network import AsyncTrek, AsyncRequestHandler
 from libs.common import NotificationNames
 from libs.server import ServerMessenger, SessionServer
 
@@ -129,3 +130,102 @@ class RequestHandler(StreamRequestHandler, MessengerDelegate, Logging):
     def download_data(self, url: str, msg: InstantMessage) -> Optional[bytes]:
         # download encrypted file data
         pass
+
+
+class AsyncHandler(AsyncRequestHandler, MessengerDelegate, Logging):
+    """ Request Handler for the event loop server """
+
+    def __init__(self, request, client_address, server):
+        super().__init__(request=request, client_address=client_address, server=server)
+        # messenger
+        mess = ServerMessenger()
+        mess.delegate = self
+        # session with gate driven by the event loop
+        gate = AsyncTrek.create(sock=request)
+        sess = SessionServer().get_session(client_address=client_address, messenger=mess, sock=request, gate=gate)
+        sess.waker = self.wakeup
+        mess.current_session = sess
+        self.__messenger = mess
+
+    @property
+    def messenger(self) -> ServerMessenger:
+        return self.__messenger
+
+    @property
+    def running(self) -> bool:
+        session = self.messenger.current_session
+        return session is not None and session.running
+
+    def setup(self):
+        session = self.messenger.current_session
+        self.info('client connected: %s' % session)
+        session.setup()
+        NotificationCenter().post(name=NotificationNames.CONNECTED, sender=self, info={
+            'session': session,
+        })
+
+    def finish(self):
+        session = self.messenger.current_session
+        self.info('client disconnected: %s' % session)
+        SessionServer().remove_session(session=session)
+        NotificationCenter().post(name=NotificationNames.DISCONNECTED, sender=self, info={
+            'session': session,
+        })
+        session.waker = None
+        session.finish()
+        self.messenger.current_session = None
+
+    def read(self) -> bool:
+        gate = self.messenger.current_session.gate
+        assert isinstance(gate, AsyncTrek), 'gate error: %s' % gate
+        return gate.read()
+
+    @property
+    def readable(self) -> bool:
+        gate = self.messenger.current_session.gate
+        assert isinstance(gate, AsyncTrek), 'gate error: %s' % gate
+        return gate.readable
+
+    @property
+    def writable(self) -> bool:
+        gate = self.messenger.current_session.gate
+        assert isinstance(gate, AsyncTrek), 'gate error: %s' % gate
+        return gate.writable
+
+    def write(self) -> bool:
+        gate = self.messenger.current_session.gate
+        assert isinstance(gate, AsyncTrek), 'gate error: %s' % gate
+        return gate.write()
+
+    def process(self) -> bool:
+        return self.messenger.current_session.process()
+
+    def tick(self) -> bool:
+        session = self.messenger.current_session
+        if session.running:
+            # check cached messages
+            session.scan()
+            return True
+
+    #
+    #   MessengerDelegate
+    #
+    def send_package(self, data: bytes, handler: CompletionHandler, priority: int = 0) -> bool:
+        session = self.messenger.current_session
+        if session is not None and session.send_payload(payload=data, priority=priority):
+            if handler is not None:
+                handler.success()
+            return True
+        else:
+            if handler is not None:
+                error = IOError('MessengerDelegate error: failed to send data package')
+                handler.failed(error=error)
+            return False
+
+    def upload_data(self, data: bytes, msg: InstantMessage) -> str:
+        # upload encrypted file data
+        pass
+
+    def download_data(self, url: str, msg: InstantMessage) -> Optional[bytes]:
+        # download encrypted file data
+        pass
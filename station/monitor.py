@@ -34,17 +34,41 @@ import os
 import threading
 import time
 import traceback
-from typing import List, Optional
+from collections import deque
+from typing import Optional
 
 from dimp import ID, NetworkType
 
 from libs.utils.log import current_time
 from libs.utils import Singleton, Log, Logging
 from libs.utils import Notification, NotificationObserver, NotificationCenter
+from libs.utils import CacheManager, MetricsRegistry, Tracer
 from libs.common import NotificationNames
 from libs.common import Storage
 from libs.server import Session
 
+from etc.cfg_init import g_file_writer
+from station.config import g_dispatcher
+
+
+g_metrics = MetricsRegistry()
+g_connections = g_metrics.counter(name='dim_connections_total', desc='Client connections accepted')
+g_logins = g_metrics.counter(name='dim_user_logins_total', desc='Users login to this station')
+g_messages = g_metrics.counter(name='dim_messages_total', labels={'receiver': 'user'},
+                               desc='Messages delivering from users')
+g_group_messages = g_metrics.counter(name='dim_messages_total', labels={'receiver': 'group'})
+
+
+def register_collectors():
+    """ Statistics of other components, collected only when scraped """
+    g_metrics.collector(name='dim_dispatcher', func=g_dispatcher.statistics, label='worker')
+    g_metrics.collector(name='dim_cache', func=CacheManager().statistics, label='pool')
+    g_metrics.collector(name='dim_notification_queue', func=NotificationCenter().statistics, label='observer')
+    if g_file_writer is not None:
+        g_metrics.collector(name='dim_file_writer', func=g_file_writer.statistics)
+    tracer = Tracer()
+    g_metrics.gauge(name='dim_trace_messages', desc='Sampled messages being traced', func=lambda: tracer.tracing)
+
 
 @Singleton
 class Monitor(NotificationObserver):
@@ -52,6 +76,7 @@ class Monitor(NotificationObserver):
     def __init__(self):
         super().__init__()
         self.__recorder = Recorder()
+        register_collectors()
         # observing notifications
         nc = NotificationCenter()
         nc.add(observer=self, name=NotificationNames.CONNECTED)
@@ -105,6 +130,21 @@ def save_freshman(identifier: ID) -> bool:
     return Storage.append_text(text=new_line, path=path)
 
 
+def save_metrics() -> bool:
+    """ Dump all metrics in a text file for scraping
+
+        file path: '.dim/metrics.txt'
+    """
+    path = os.path.join(Storage.root, 'metrics.txt')
+    text = g_metrics.exposition()
+    # write to a temporary file and rename it, so readers never get a partial dump
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(tmp, path)
+    return True
+
+
 def save_statistics(login_cnt: int, msg_cnt: int, g_msg_cnt: int) -> bool:
     """ Save statistics in a text file for administrators
 
@@ -119,17 +159,19 @@ def save_statistics(login_cnt: int, msg_cnt: int, g_msg_cnt: int) -> bool:
 class Recorder(threading.Thread, Logging):
 
     FLUSH_INTERVAL = 3600
+    METRICS_INTERVAL = 60
 
     def __init__(self):
         super().__init__()
         self.__running = True
-        self.__events: List[Notification] = []
+        self.__events = deque()
         self.__lock = threading.Lock()
         # statistics
         self.__login_count = 0
         self.__message_count = 0
         self.__group_message_count = 0
         self.__flush_time = time.time() + self.FLUSH_INTERVAL  # next time to save statistics
+        self.__metrics_time = time.time() + self.METRICS_INTERVAL  # next time to dump metrics
 
     def append(self, event: Notification):
         with self.__lock:
@@ -138,10 +180,13 @@ class Recorder(threading.Thread, Logging):
     def pop(self) -> Optional[Notification]:
         with self.__lock:
             if len(self.__events) > 0:
-                return self.__events.pop(0)
+                return self.__events.popleft()
 
     def __save(self):
         now = time.time()
+        if now > self.__metrics_time:
+            self.__metrics_time = now + self.METRICS_INTERVAL
+            save_metrics()
         if now > self.__flush_time:
             # get
             login_cnt = self.__login_count
@@ -163,6 +208,7 @@ class Recorder(threading.Thread, Logging):
             assert isinstance(session, Session), 'session error: %s' % session
             client_address = session.client_address
             self.debug('client connected: %s' % str(client_address))
+            g_connections.inc()
         elif name == NotificationNames.DISCONNECTED:
             session = info.get('session')
             assert isinstance(session, Session), 'session error: %s' % session
@@ -175,6 +221,7 @@ class Recorder(threading.Thread, Logging):
             self.debug('user login: %s, %s' % (client_address, identifier))
             # counter
             self.__login_count += 1
+            g_logins.inc()
             # check for new user to this station
             save_freshman(identifier=identifier)
         elif name == NotificationNames.USER_ONLINE:
@@ -195,8 +242,10 @@ class Recorder(threading.Thread, Logging):
             if sender.type in [NetworkType.MAIN, NetworkType.BTC_MAIN]:
                 if receiver.type in [NetworkType.MAIN, NetworkType.BTC_MAIN]:
                     self.__message_count += 1
+                    g_messages.inc()
                 elif receiver.type == NetworkType.GROUP:
                     self.__group_message_count += 1
+                    g_group_messages.inc()
             self.debug('delivering message: %s -> %s' % (sender, receiver))
 
     #
@@ -40,7 +40,8 @@ from dimp import ID, NetworkType
 from dimsdk import Station
 
 from libs.utils import Singleton, Logging
-from libs.utils import Notification, NotificationObserver, NotificationCenter
+from libs.utils import Notification, NotificationObserver, NotificationQueue, NotificationCenter
+from libs.utils import user_key
 from libs.common import NotificationNames
 
 from station.config import g_database, g_dispatcher
@@ -56,7 +57,10 @@ class Receptionist(threading.Thread, NotificationObserver, Logging):
         # current station and guests
         self.__station: Optional[ID] = None
         self.__roamers = set()
+        # observing notifications, only the last one for the same user is needed
+        queue = NotificationQueue(observer=self, policy=NotificationQueue.COALESCE, key=user_key)
         nc = NotificationCenter()
+        nc.set_queue(observer=self, queue=queue)
         nc.add(observer=self, name=NotificationNames.USER_ONLINE)
         nc.add(observer=self, name=NotificationNames.USER_ROAMING)
 
@@ -40,10 +40,21 @@ curPath = os.path.abspath(os.path.dirname(__file__))
 rootPath = os.path.split(curPath)[0]
 sys.path.append(rootPath)
 
-from libs.utils import Log
+from libs.utils import Log, MetricsServer
 from libs.utils.mtp import Server as UDPServer
+from libs.network import AsyncTCPServer
+from libs.common import CryptoExecutor
 
-from station.handler import RequestHandler
+from etc.config import bind_async
+from etc.config import crypto_workers, crypto_processes
+from etc.config import local_host, metrics_port
+
+if __name__ == '__main__' and crypto_workers > 0:
+    # start crypto workers before 'station.config' runs 'etc/cfg_init.py',
+    # which may start other threads (file writer, database timers)
+    CryptoExecutor().start(workers=crypto_workers, processes=crypto_processes)
+
+from station.handler import RequestHandler, AsyncHandler
 from station.config import g_station, g_dispatcher
 from station.monitor import Monitor
 from station.receptionist import Receptionist
@@ -75,6 +86,12 @@ if __name__ == '__main__':
     g_receptionist.start()
     g_dispatcher.start()
 
+    # start metrics endpoint
+    if metrics_port > 0:
+        Log.info('>>> metrics endpoint (%s:%d) starting ...' % (local_host, metrics_port))
+        g_metrics_server = MetricsServer(server_address=(local_host, metrics_port))
+        g_metrics_server.start()
+
     # start UDP Server
     Log.info('>>> UDP server (%s:%d) starting ...' % (g_station.host, g_station.port))
     g_udp_server = UDPServer(host=g_station.host, port=g_station.port)
@@ -82,9 +99,13 @@ if __name__ == '__main__':
 
     # start TCP Server
     try:
-        TCPServer.allow_reuse_address = True
-        server = ThreadingTCPServer(server_address=(g_station.host, g_station.port),
-                                    RequestHandlerClass=RequestHandler)
+        if bind_async:
+            server = AsyncTCPServer(server_address=(g_station.host, g_station.port),
+                                    RequestHandlerClass=AsyncHandler)
+        else:
+            TCPServer.allow_reuse_address = True
+            server = ThreadingTCPServer(server_address=(g_station.host, g_station.port),
+                                        RequestHandlerClass=RequestHandler)
         Log.info('server (%s:%s) is listening...' % (g_station.host, g_station.port))
         server.serve_forever()
     except KeyboardInterrupt as ex:
@@ -93,4 +114,5 @@ if __name__ == '__main__':
         g_dispatcher.stop()
         g_receptionist.stop()
         g_monitor.stop()
+        CryptoExecutor().stop()
         Log.info('======== station shutdown!')
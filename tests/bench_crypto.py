@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Crypto Executor Benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Verifying message signatures on the caller's thread
+    vs in native threads / worker processes with more and more workers
+"""
+
+import sys
+import os
+import argparse
+import random
+import time
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import PrivateKey
+
+from libs.common import CryptoExecutor
+
+
+def prepare_jobs(senders: int, count: int, size: int) -> list:
+    keys = [PrivateKey.generate(algorithm='RSA') for _ in range(senders)]
+    jobs = []
+    for index in range(count):
+        private_key = keys[index % senders]
+        public_key = private_key.public_key
+        data = os.urandom(size)
+        signature = private_key.sign(data=data)
+        # the sender may sign with visa key or meta key, so give two keys as the station does
+        jobs.append(([keys[(index + 1) % senders].public_key, public_key], data, signature))
+    random.shuffle(jobs)
+    return jobs
+
+
+def run(jobs: list, batch: int) -> float:
+    executor = CryptoExecutor()
+    start = time.time()
+    for pos in range(0, len(jobs), batch):
+        results = executor.verify_batch(jobs=jobs[pos:pos + batch])
+        assert all(key is not None for key in results), 'failed to verify'
+    return time.time() - start
+
+
+def main(args):
+    print('preparing %d signatures from %d senders ...' % (args.count, args.senders))
+    jobs = prepare_jobs(senders=args.senders, count=args.count, size=args.size)
+    executor = CryptoExecutor()
+    # warm up
+    run(jobs=jobs[:args.batch], batch=args.batch)
+    inline = run(jobs=jobs, batch=args.batch)
+    print('\n%-10s %8s %12s %8s' % ('mode', 'workers', 'verify/s', 'speedup'))
+    print('%-10s %8d %12.0f %8.2f' % ('inline', 0, len(jobs) / inline, 1.0))
+    cores = os.cpu_count() or 1
+    counts = sorted(set([1, 2, 4, 8, 16, cores]))
+    counts = [n for n in counts if n <= max(cores, args.max_workers)]
+    for processes in [False, True]:
+        for workers in counts:
+            executor.start(workers=workers, processes=processes)
+            try:
+                # first round loads the keys in each worker
+                run(jobs=jobs[:args.batch * workers], batch=args.batch)
+                elapsed = run(jobs=jobs, batch=args.batch)
+            finally:
+                executor.stop()
+            print('%-10s %8d %12.0f %8.2f' % ('processes' if processes else 'threads', workers,
+                                              len(jobs) / elapsed, inline / elapsed))
+    print('\n(%d cores)' % cores)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Signature verification throughput with the crypto executor')
+    parser.add_argument('--count', type=int, default=4000, help='signatures to verify')
+    parser.add_argument('--senders', type=int, default=100, help='distinct sender keys')
+    parser.add_argument('--size', type=int, default=256, help='bytes of each message data')
+    parser.add_argument('--batch', type=int, default=64, help='signatures submitted in one batch')
+    parser.add_argument('--max-workers', type=int, default=0, help='max workers to try (default: core count)')
+    main(args=parser.parse_args())
@@ -0,0 +1,89 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Dispatcher Benchmark
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Throughput of personal message delivering with different shard counts,
+    each delivering costs a few milliseconds (simulating a slow push service)
+"""
+
+import sys
+import os
+import time
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.server.dispatcher import WorkerPool, SingleDispatcher
+
+
+DELIVER_COST = 0.002  # seconds
+RECEIVERS = 100
+MESSAGES = 2000
+
+
+class FakeMessage(dict):
+
+    @property
+    def receiver(self) -> str:
+        return self['receiver']
+
+
+class SlowDispatcher(SingleDispatcher):
+
+    results = {}  # receiver -> [sn]
+
+    def deliver(self, msg: FakeMessage):
+        time.sleep(DELIVER_COST)
+        self.results.setdefault(msg.receiver, []).append(msg['sn'])
+
+
+def benchmark(shards: int) -> float:
+    SlowDispatcher.results = {}
+    pool = WorkerPool(factory=SlowDispatcher, count=shards)
+    pool.start()
+    start = time.time()
+    for sn in range(MESSAGES):
+        pool.add_msg(msg=FakeMessage(receiver='user%d' % (sn % RECEIVERS), sn=sn))
+    while sum([len(array) for array in SlowDispatcher.results.values()]) < MESSAGES:
+        time.sleep(0.01)
+    elapsed = time.time() - start
+    pool.stop()
+    pool.join()
+    # check message order for each receiver
+    for receiver, array in SlowDispatcher.results.items():
+        assert array == sorted(array), 'message order error: %s' % receiver
+    return elapsed
+
+
+if __name__ == '__main__':
+    print('delivering %d messages for %d receivers, %.1f ms each' % (MESSAGES, RECEIVERS, DELIVER_COST * 1000))
+    for count in [1, 2, 4, 8, 16]:
+        seconds = benchmark(shards=count)
+        print('shards: %2d, time: %6.3fs, throughput: %8.1f msg/s' % (count, seconds, MESSAGES / seconds))
@@ -0,0 +1,161 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Group Fan-out Benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Serializing a group message split for every member (with the reused key),
+    computing key digest for each member vs memoized on the key object
+"""
+
+import sys
+import os
+import argparse
+import time
+from typing import Optional, List
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import base64_encode, sha256
+from dimp import ID, SymmetricKey, ReliableMessage
+from dimp import PrivateKey, Meta, MetaType, NetworkType
+
+from libs.common import CommonFacebook, CommonMessenger, CommonPacker
+from libs.common.packer import key_digest
+
+
+class BenchMessenger(CommonMessenger):
+    """ only for the packer to get the reused key """
+
+    def __init__(self, key: SymmetricKey):
+        super().__init__()
+        self.__key = key
+
+    def _create_facebook(self) -> CommonFacebook:
+        return CommonFacebook()
+
+    def cipher_key(self, sender: ID, receiver: ID, generate: bool = False) -> Optional[SymmetricKey]:
+        return self.__key
+
+    def _send_command(self, cmd, receiver=None) -> bool:
+        return False
+
+
+class LegacyPacker(CommonPacker):
+    """ computing key digest for every message (before memoized) """
+
+    def __attach_key_digest(self, msg: ReliableMessage):
+        if msg.delegate is None:
+            msg.delegate = self.transceiver
+        if msg.encrypted_key is not None:
+            return
+        keys = msg.encrypted_keys
+        if keys is None:
+            keys = {}
+        elif 'digest' in keys:
+            return
+        group = msg.group
+        if group is None:
+            key = self.messenger.cipher_key(sender=msg.sender, receiver=msg.receiver)
+        else:
+            key = self.messenger.cipher_key(sender=msg.sender, receiver=group)
+        data = key.data
+        if data is None or len(data) < 6:
+            return
+        pos = len(data) - 6
+        digest = sha256(data[pos:])
+        base64 = base64_encode(digest)
+        pos = len(base64) - 8
+        keys['digest'] = base64[pos:]
+        msg['keys'] = keys
+
+    def serialize_message(self, msg: ReliableMessage) -> bytes:
+        self.__attach_key_digest(msg=msg)
+        return super(CommonPacker, self).serialize_message(msg=msg)
+
+
+g_private_key = PrivateKey.generate(algorithm=PrivateKey.RSA)
+
+
+def create_id(seed: str, network: int) -> ID:
+    meta = Meta.generate(version=MetaType.DEFAULT, key=g_private_key, seed=seed)
+    return meta.generate_identifier(network=network)
+
+
+def group_messages(members: List[ID], size: int) -> List[ReliableMessage]:
+    sender = members[0]
+    group = create_id(seed='group', network=NetworkType.GROUP)
+    msg = ReliableMessage.parse(msg={
+        'sender': str(sender),
+        'receiver': str(group),
+        'time': time.time(),
+        'data': base64_encode(os.urandom(size)),
+        'signature': base64_encode(os.urandom(128)),
+    })
+    # the assistant splits group message for each member
+    return msg.split(members=members)
+
+
+def run(packer: CommonPacker, members: List[ID], size: int, rounds: int) -> float:
+    elapsed = 0.0
+    for _ in range(rounds):
+        # new messages for each round, the digest will be attached to them
+        messages = group_messages(members=members, size=size)
+        start = time.time()
+        for msg in messages:
+            packer.serialize_message(msg=msg)
+        elapsed += time.time() - start
+    return elapsed
+
+
+def main(args):
+    key = SymmetricKey.generate(algorithm=SymmetricKey.AES)
+    members = [create_id(seed='user%d' % index, network=NetworkType.MAIN) for index in range(args.members)]
+    # the packer only keeps a weak reference to the messenger
+    messenger = BenchMessenger(key=key)
+    legacy = LegacyPacker(messenger=messenger)
+    packer = CommonPacker(messenger=messenger)
+    # check digest
+    msg = group_messages(members=members[:1], size=16)[0]
+    legacy.serialize_message(msg=msg)
+    assert msg['keys']['digest'] == key_digest(key=key), 'digest not match'
+    print('%d members, %d bytes content, %d rounds' % (args.members, args.size, args.rounds))
+    count = args.members * args.rounds
+    for name, item in [('legacy', legacy), ('memoized', packer)]:
+        run(packer=item, members=members, size=args.size, rounds=1)
+        elapsed = run(packer=item, members=members, size=args.size, rounds=args.rounds)
+        print('%-10s %8.2f us/msg, %10.0f msg/s' % (name, elapsed * 1000000 / count, count / elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Group fan-out serialization benchmark')
+    parser.add_argument('--members', type=int, default=500, help='members of the group')
+    parser.add_argument('--size', type=int, default=64, help='bytes of encrypted content')
+    parser.add_argument('--rounds', type=int, default=20, help='group messages to split and serialize')
+    main(args=parser.parse_args())
@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Receive Buffer Benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Parsing multi-MB packages arriving in many segments, bytes concatenation vs receive buffer
+"""
+
+import sys
+import os
+import time
+from typing import Optional
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dmtp.mtp.tlv import Data
+from dmtp.mtp import Package
+from dmtp.mtp import Message as MTPMessage
+
+from libs.network.gate import TCPGate
+from libs.network.mtp import MTPDocker
+from libs.network.mars import MarsDocker
+from libs.network.ws import WSDocker
+from libs.network.protocol import NetMsg, NetMsgHead, WebSocket
+
+
+class FakeConnection:
+    """ Connection with segments received """
+
+    def __init__(self):
+        super().__init__()
+        self.segments = []
+
+    @property
+    def available(self) -> int:
+        return sum([len(item) for item in self.segments])
+
+    def receive(self, max_length: int) -> Optional[bytes]:
+        if len(self.segments) > 0:
+            return self.segments.pop(0)
+
+
+class LegacyGate(TCPGate):
+    """ receiving with bytes concatenation """
+
+    def __init__(self, connection):
+        super().__init__(connection=connection)
+        self.__chunks: Optional[bytes] = None
+
+    def receive(self, length: int, remove: bool) -> Optional[bytes]:
+        fragment = self.__receive(length=length)
+        if fragment is not None:
+            if len(fragment) > length:
+                if remove:
+                    self.__chunks = fragment[length:]
+                return fragment[:length]
+            elif remove:
+                self.__chunks = None
+            return fragment
+
+    def peek(self, length: int) -> Optional[memoryview]:
+        fragment = self.receive(length=length, remove=False)
+        if fragment is not None:
+            return memoryview(fragment)
+
+    def skip(self, length: int) -> int:
+        fragment = self.receive(length=length, remove=True)
+        return 0 if fragment is None else len(fragment)
+
+    def __receive(self, length: int) -> Optional[bytes]:
+        conn = self.connection
+        cached = 0
+        if self.__chunks is not None:
+            cached = len(self.__chunks)
+        while cached < length:
+            available = conn.available
+            if available <= 0:
+                break
+            data = conn.receive(max_length=available)
+            if data is None:
+                break
+            if self.__chunks is None:
+                self.__chunks = data
+            else:
+                self.__chunks += data
+            cached += len(data)
+        return self.__chunks
+
+
+def mtp_package(payload: bytes) -> bytes:
+    body = Data(data=payload)
+    return Package.new(data_type=MTPMessage, body_length=body.length, body=body).get_bytes()
+
+
+def mars_package(payload: bytes) -> bytes:
+    head = NetMsgHead.new(cmd=NetMsgHead.SEND_MSG, body_len=len(payload))
+    return NetMsg.new(head=head, body=payload).data
+
+
+def run(gate_class, docker_class, stream: bytes, segment: int) -> (float, int):
+    conn = FakeConnection()
+    gate = gate_class(connection=conn)
+    docker = docker_class(gate=gate)
+    count = 0
+    start = time.time()
+    for pos in range(0, len(stream), segment):
+        conn.segments.append(stream[pos:pos+segment])
+        while docker.get_income_ship() is not None:
+            count += 1
+    return time.time() - start, count
+
+
+def bench(name: str, docker_class, stream: bytes, segment: int = 16384):
+    mb = len(stream) / 1024 / 1024
+    t1, c1 = run(gate_class=LegacyGate, docker_class=docker_class, stream=stream, segment=segment)
+    t2, c2 = run(gate_class=TCPGate, docker_class=docker_class, stream=stream, segment=segment)
+    assert c1 == c2, 'package count not match: %d, %d' % (c1, c2)
+    print('%-4s %6.1f MB, %4d package(s): bytes %7.3fs (%7.1f MB/s), buffer %7.3fs (%7.1f MB/s)'
+          % (name, mb, c2, t1, mb / t1, t2, mb / t2))
+
+
+if __name__ == '__main__':
+    for size in [1, 4, 8]:
+        data = os.urandom(size * 1024 * 1024)
+        bench(name='MTP', docker_class=MTPDocker, stream=mtp_package(payload=data))
+        bench(name='Mars', docker_class=MarsDocker, stream=mars_package(payload=data))
+        # WebSocket frames are limited in 64 KB
+        frames = [WebSocket.pack(payload=data[pos:pos+32768]) for pos in range(0, len(data), 32768)]
+        bench(name='WS', docker_class=WSDocker, stream=b''.join(frames))
@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Logging Benchmark
+    ~~~~~~~~~~~~~~~~~
+
+    Per-message logging cost on the hot path (Dispatcher, MessageTable, ...):
+    formatting before the level check (before rewritten) vs lazy formatting,
+    and printing to stdout vs writing via the queue-backed LogWriter
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import ID
+
+import libs.common  # load plugins for ID
+from libs.utils import Log, Logging, LogWriter
+
+
+class LegacyLogging:
+    """ formatting the message and timestamp eagerly (before rewritten) """
+
+    LEVEL = Log.RELEASE
+
+    def debug(self, msg: str):
+        msg = 'DEBUG - %s >\t%s' % (self.__class__.__name__, msg)
+        if self.LEVEL & 0x01 == 0:
+            return None
+        print('[%s] %s' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()), msg))
+
+    def info(self, msg: str):
+        msg = '%s >\t%s' % (self.__class__.__name__, msg)
+        if self.LEVEL & 0x02 == 0:
+            return None
+        print('[%s] %s' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()), msg))
+
+
+class LegacyTable(LegacyLogging):
+
+    def save_message(self, sender: ID, receiver: ID, traces: list):
+        self.info('ignore traced msg: %s in %s' % (receiver, traces))
+        self.debug('msg saved: %s -> %s' % (sender, receiver))
+
+
+class MessageTable(Logging):
+
+    def save_message(self, sender: ID, receiver: ID, traces: list):
+        self.info('ignore traced msg: %s in %s', receiver, traces)
+        self.debug('msg saved: %s -> %s', sender, receiver)
+
+
+class SampledTable(Logging):
+
+    def save_message(self, sender: ID, receiver: ID, traces: list):
+        self.info('ignore traced msg: %s in %s', receiver, traces, every=100)
+        self.debug('msg saved: %s -> %s', sender, receiver, every=100)
+
+
+sender = ID.parse(identifier='moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ')
+receiver = ID.parse(identifier='hulk@4YeVEN3aUnvC1DNUufCq1bs9zoBSJTzVEj')
+traces = [{'ID': 'gsp-s001@x5Zh9ixt8ECr59XLye1y5WWfaX4fcoaaSC', 'time': 1634000000},
+          {'ID': 'gsp-s002@wpjUWg1oYDnkHh74tHQFPxii6q9j3ymnyW', 'time': 1634000001}]
+
+
+def run(table, count: int) -> float:
+    start = time.time()
+    for _ in range(count):
+        table.save_message(sender=sender, receiver=receiver, traces=traces)
+    return time.time() - start
+
+
+def bench_release(count: int):
+    Log.LEVEL = Log.RELEASE
+    LegacyLogging.LEVEL = Log.RELEASE
+    t1 = run(LegacyTable(), count=count)
+    t2 = run(MessageTable(), count=count)
+    print('RELEASE, %d messages: eager %6.2f us/msg, lazy %6.2f us/msg (%.1fx)'
+          % (count, t1 * 1000000 / count, t2 * 1000000 / count, t1 / t2))
+
+
+def bench_develop(count: int):
+    Log.LEVEL = Log.DEVELOP
+    LegacyLogging.LEVEL = Log.DEVELOP
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as null:
+        sys.stdout = null
+        try:
+            t1 = run(LegacyTable(), count=count)
+            t2 = run(MessageTable(), count=count)
+            t3 = run(SampledTable(), count=count)
+        finally:
+            sys.stdout = stdout
+    with tempfile.TemporaryDirectory() as directory:
+        writer = LogWriter(path=os.path.join(directory, 'station.log'), max_bytes=1024 * 1024, backup_count=2)
+        Log.writer = writer
+        try:
+            t4 = run(MessageTable(), count=count)
+        finally:
+            Log.writer = None
+            writer.stop()
+        files = sorted(os.listdir(directory))
+    Log.LEVEL = Log.RELEASE
+    print('DEVELOP, %d messages: eager print %6.2f us/msg, lazy print %6.2f us/msg,'
+          ' sampled 1/100 %6.2f us/msg, LogWriter %6.2f us/msg (dropped %d, files %s)'
+          % (count, t1 * 1000000 / count, t2 * 1000000 / count, t3 * 1000000 / count,
+             t4 * 1000000 / count, writer.dropped, files))
+
+
+def check():
+    Log.LEVEL = Log.RELEASE
+    Log.set_level(level=Log.DEBUG, tag='MessageTable')
+    assert Log.level(tag=MessageTable) == Log.DEBUG
+    assert Log.level(tag=SampledTable) == Log.RELEASE
+    Log.set_level(level=Log.DEVELOP, tag='__main__')
+    assert Log.level(tag=SampledTable) == Log.DEVELOP
+    Log.LEVELS.clear()
+    Log.set_level(level=Log.RELEASE, tag='__nothing__')
+    assert Log.level(tag=MessageTable) == Log.RELEASE
+
+
+if __name__ == '__main__':
+    check()
+    bench_release(count=200000)
+    bench_develop(count=50000)
@@ -0,0 +1,127 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Mars Benchmark
+    ~~~~~~~~~~~~~~
+
+    Packing/parsing NetMsg with int.to_bytes per field vs struct
+"""
+
+import sys
+import os
+import time
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.network.protocol import NetMsg, NetMsgHead, NetMsgSeq
+from libs.network.mars import MarsDocker, MarsShip
+
+
+def append_int(data, i: int):
+    return data + i.to_bytes(length=4, byteorder='big')
+
+
+def read_int(data, pos):
+    return int.from_bytes(bytes=data[pos:pos + 4], byteorder='big')
+
+
+def legacy_pack(seq: int, payload: bytes) -> NetMsg:
+    """ pack push message (before rewritten) """
+    sn = seq.to_bytes(length=4, byteorder='big')
+    body = b'Mars SN:' + sn + b'\n' + payload
+    data = b''
+    data = append_int(data, NetMsgHead.MIN_HEAD_LEN)
+    data = append_int(data, 200)
+    data = append_int(data, NetMsgHead.PUSH_MESSAGE)
+    data = append_int(data, 0)
+    data = append_int(data, len(body))
+    head = NetMsgHead(data=data, cmd=NetMsgHead.PUSH_MESSAGE, body_len=len(body))
+    return NetMsg(data=data + body, head=head, body=body)
+
+
+def legacy_parse(data) -> NetMsgHead:
+    """ parse head (before rewritten) """
+    head_len = read_int(data, 0)
+    version = read_int(data, 4)
+    cmd = read_int(data, 8)
+    seq = read_int(data, 12)
+    body_len = read_int(data, 16)
+    return NetMsgHead(data=bytes(data[:head_len]), version=version, cmd=cmd, seq=seq, body_len=body_len)
+
+
+class FakeGate:
+    delegate = None
+
+
+def check():
+    docker = MarsDocker(gate=FakeGate())
+    payload = os.urandom(1024)
+    ship = docker.pack(payload=payload)
+    assert isinstance(ship, MarsShip)
+    mars = NetMsg.parse(data=ship.package)
+    assert mars.head.cmd == NetMsgHead.PUSH_MESSAGE and mars.head.body_length == len(payload) + 13
+    assert ship.mars.body == mars.body, 'body error'
+    assert MarsShip(mars=mars).sn == ship.sn, 'sn error'
+    assert MarsShip(mars=mars).payload == payload == ship.payload, 'payload error'
+    assert ship.package == legacy_pack(seq=int.from_bytes(ship.sn, byteorder='big'), payload=payload).data
+    h1 = mars.head
+    h2 = legacy_parse(data=ship.package)
+    assert (h1.data, h1.version, h1.cmd, h1.seq, h1.body_length) == (h2.data, h2.version, h2.cmd, h2.seq, h2.body_length)
+
+
+def bench(size: int, count: int):
+    payload = os.urandom(size)
+    start = time.time()
+    for seq in range(count):
+        legacy_pack(seq=seq, payload=payload)
+    t1 = time.time() - start
+    start = time.time()
+    for seq in range(count):
+        sn = seq.to_bytes(length=4, byteorder='big')
+        NetMsg.join(cmd=NetMsgHead.PUSH_MESSAGE, parts=[b'Mars SN:', sn, b'\n', payload])
+    t2 = time.time() - start
+    view = memoryview(legacy_pack(seq=1, payload=payload).data)
+    start = time.time()
+    for _ in range(count):
+        legacy_parse(data=view)
+    t3 = time.time() - start
+    start = time.time()
+    for _ in range(count):
+        NetMsgHead.parse(data=view)
+    t4 = time.time() - start
+    print('%8d bytes x %6d: pack %6.2f us -> %6.2f us, parse head %6.2f us -> %6.2f us'
+          % (size, count, t1 * 1000000 / count, t2 * 1000000 / count, t3 * 1000000 / count, t4 * 1000000 / count))
+
+
+if __name__ == '__main__':
+    check()
+    print('seq starts from: %d' % NetMsgSeq.generate())
+    bench(size=64, count=100000)
+    bench(size=4096, count=100000)
+    bench(size=65536, count=10000)
@@ -0,0 +1,83 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Metrics Benchmark
+    ~~~~~~~~~~~~~~~~~
+
+    Cost of counting and timing on the message path,
+    accuracy of the histogram percentiles, and the cost of one scrape
+"""
+
+import sys
+import os
+import random
+import time
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.utils import MetricsRegistry, Histogram
+
+
+def check(count: int):
+    histogram = Histogram(name='check_seconds')
+    values = [random.lognormvariate(-7, 1.5) for _ in range(count)]
+    for value in values:
+        histogram.observe(value)
+    values.sort()
+    for q, value in histogram.percentiles().items():
+        exact = values[min(int(q * count), count - 1)]
+        error = abs(value - exact) / exact
+        print('    p%-5g histogram %9.6f s, exact %9.6f s, error %4.1f%%' % (q * 100, value, exact, error * 100))
+        assert error < 0.07, 'percentile error: %s, %s' % (value, exact)
+
+
+def bench(count: int):
+    metrics = MetricsRegistry()
+    counter = metrics.counter(name='bench_messages_total', labels={'kind': 'single'})
+    histogram = metrics.histogram(name='bench_deliver_seconds', labels={'worker': 'bench'})
+    start = time.time()
+    for _ in range(count):
+        counter.inc()
+    t1 = time.time() - start
+    start = time.time()
+    for i in range(count):
+        histogram.observe((i % 5000) / 1000000.0)
+    t2 = time.time() - start
+    for i in range(100):
+        metrics.counter(name='bench_sessions_total', labels={'protocol': 'p%d' % i}).inc()
+    start = time.time()
+    text = metrics.exposition()
+    t3 = time.time() - start
+    print('%d ops: counter %5.2f us/op, histogram %5.2f us/op, scrape %d lines in %.2f ms'
+          % (count, t1 * 1000000 / count, t2 * 1000000 / count, text.count('\n'), t3 * 1000))
+
+
+if __name__ == '__main__':
+    check(count=100000)
+    bench(count=1000000)
@@ -0,0 +1,429 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Message Format Benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Bytes on the wire and serialize/deserialize time, JsON vs D-MTP;
+    D-MTP codec with Data objects vs one cursor over the buffer (fuzzing)
+"""
+
+import sys
+import os
+import base64
+import json
+import random
+import time
+from typing import Optional, List
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dmtp.mtp.tlv.utils import base64_encode, base64_decode
+from dmtp.mtp.tlv import Data, MutableData, VarIntData
+from dmtp import Message
+from dmtp import StringValue, BinaryValue
+from dimp import ReliableMessage
+
+from libs.utils.mtp import MTPUtils
+from libs.common import CommonFacebook  # load plugins
+
+users = [
+    'moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ',
+    'hulk@4YeVEN3aUnvC1DNUufCq1bs9zoBSJTzVEj',
+    'moki@4WDfe3zZ4T7opFSi3iDAKiuTnUHjxmXekk',
+    'pony@4TnzoxrZSPVwFg7hmK7W12Wh1iu3hGz5G5',
+    'dim@4MVvC3bTTYqozq4XvXVMt5VSWLyLK1XSVg',
+    'admin@2Pc5gJrEQYoz9D9TJrL35sA3wvprNdenPi7',
+    'lingling@2PemMVAvxpuVZw2SYwwo11iBBEBb7gCvDHa',
+    'xiaoxiao@2PhVByg7PhEtYPNzW5ALk9ygf6wop1gTccp',
+]
+
+
+class LegacyUtils:
+    """ D-MTP codec with dmtp Message/Data objects (before rewritten) """
+
+    @classmethod
+    def serialize_message(cls, msg: ReliableMessage) -> bytes:
+        # copy the fields, the message may be sent again
+        info = msg.copy_dictionary()
+        #
+        #  body
+        #
+        content = info.get('data')
+        if content is not None:
+            assert isinstance(content, str), 'reliable message content error: %s' % content
+            if content.startswith('{'):
+                # JsON
+                info['data'] = content.encode('utf-8')
+            else:
+                # Base64
+                info['data'] = base64_decode(string=content)
+        signature = info.get('signature')
+        if signature is not None:
+            assert isinstance(signature, str), 'reliable message signature error: %s' % signature
+            info['signature'] = base64_decode(string=signature)
+        # symmetric key/keys
+        key = info.get('key')
+        if key is None:
+            keys = info.get('keys')
+            if keys is not None:
+                assert isinstance(keys, dict), 'reliable message keys error: %s' % keys
+                # DMTP store both 'keys' and 'key' in 'key'
+                info['key'] = b'KEYS:' + cls.build_keys(keys=keys)
+        else:
+            assert isinstance(key, str), 'reliable message key error: %s' % key
+            info['key'] = base64_decode(string=key)
+        #
+        #  attachments
+        #
+        meta = info.get('meta')
+        if meta is not None:
+            # dict to JSON
+            assert isinstance(meta, dict), 'meta error: %s' % meta
+            info['meta'] = json.dumps(meta).encode('utf-8')
+        # D-MTP carries visa in field 'profile'
+        profile = info.pop('visa', None)
+        if profile is None:
+            profile = info.get('profile')
+        if profile is not None:
+            # dict to JSON
+            assert isinstance(profile, dict), 'profile error: %s' % profile
+            info['profile'] = json.dumps(profile).encode('utf-8')
+
+        # create as message
+        msg = Message.new(info=info)
+        return msg.get_bytes()
+
+    @classmethod
+    def deserialize_message(cls, data: bytes) -> Optional[ReliableMessage]:
+        msg = Message.parse(data=Data(data=data))
+        if msg is None or msg.sender is None or msg.receiver is None:
+            raise ValueError('failed to deserialize data: %s' % data)
+        #
+        #  envelope
+        #
+        info = {
+            'sender': msg.sender,
+            'receiver': msg.receiver,
+            'time': msg.time,
+        }
+        msg_type = msg.type
+        if msg_type > 0:
+            info['type'] = msg_type
+        group = msg.group
+        if group is not None:
+            info['group'] = group
+        #
+        #  body
+        #
+        content = msg.content
+        if content is not None:
+            content = content.get_bytes()
+            text = cls.json_text(data=content)
+            if text is not None:
+                # JsON
+                info['data'] = text
+            else:
+                # Base64
+                info['data'] = base64_encode(data=content)
+        signature = msg.signature
+        if signature is not None:
+            info['signature'] = base64_encode(data=signature.get_bytes())
+        # symmetric key/keys
+        key = msg.key
+        if key is not None and key.length > 5:
+            starts = key.slice(end=5).get_bytes()
+            if starts == b'KEYS:':
+                info['keys'] = cls.parse_keys(data=key.slice(start=5))
+            else:
+                info['key'] = base64_encode(data=key.get_bytes())
+        #
+        #  attachments
+        #
+        meta = msg.meta
+        if meta is not None and meta.length > 0:
+            # JSON to dict
+            meta = meta.get_bytes().decode('utf-8')
+            info['meta'] = json.loads(meta)
+        profile = msg.profile
+        if profile is not None and profile.length > 0:
+            # JSON to dict
+            profile = profile.get_bytes().decode('utf-8')
+            info['profile'] = json.loads(profile)
+
+        # create reliable message
+        return ReliableMessage.parse(msg=info)
+
+    @classmethod
+    def json_text(cls, data: bytes) -> Optional[str]:
+        # encrypted content may start with '{' too
+        if data.startswith(b'{') and data.endswith(b'}'):
+            try:
+                return data.decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+
+    @classmethod
+    def parse_keys(cls, data: Data) -> dict:
+        keys = {}
+        while data.length > 0:
+            # get key length
+            size = VarIntData(data=data)
+            data = data.slice(start=size.length)
+            # get key name
+            name = StringValue(data=data.slice(end=size.value))
+            data = data.slice(start=size.value)
+            # get value length
+            size = VarIntData(data=data)
+            data = data.slice(start=size.length)
+            # get value
+            value = BinaryValue(data=data.slice(end=size.value))
+            data = data.slice(start=size.value)
+            assert name.length > 0, 'key name empty'
+            if value.length > 0:
+                keys[name.string] = base64_encode(data=value.get_bytes())
+        return keys
+
+    @classmethod
+    def build_keys(cls, keys: dict) -> bytes:
+        data = MutableData(capacity=512)
+        for (identifier, base64) in keys.items():
+            id_value = StringValue(string=identifier)
+            if id_value.length > 0 and base64 is not None and len(base64) > 0:
+                key_value = BinaryValue(data=base64_decode(string=base64))
+                data.append(VarIntData(value=id_value.length))
+                data.append(id_value)
+                data.append(VarIntData(value=key_value.length))
+                data.append(key_value)
+        return data.get_bytes()
+
+
+def b64(size: int) -> str:
+    return base64.b64encode(os.urandom(size)).decode('utf-8')
+
+
+def address() -> str:
+    return random.choice(users)
+
+
+def personal_message(size: int) -> dict:
+    """ encrypted text/file message between two users """
+    sender = address()
+    receiver = address()
+    return {
+        'sender': sender,
+        'receiver': receiver,
+        'time': int(time.time()),
+        'type': 1,
+        'data': b64(size),
+        'key': b64(128),        # RSA-1024 encrypted symmetric key
+        'signature': b64(128),  # RSA-1024 signature
+    }
+
+
+def group_message(size: int, members: int) -> dict:
+    """ group message split for one member, with keys for all members """
+    msg = personal_message(size=size)
+    msg.pop('key')
+    msg['group'] = 'Group-%d@%s' % (random.randint(0, 999), 'x8Eudmgq4rHvTm2ongrwk6BVdS1wuE7ctE')
+    keys = {'member%d@%s' % (i, address().split('@')[1]): b64(128) for i in range(members)}
+    keys['digest'] = b64(6)
+    msg['keys'] = keys
+    return msg
+
+
+def handshake_message() -> dict:
+    """ first message with meta & visa attached """
+    msg = personal_message(size=256)
+    msg['meta'] = {
+        'type': 1,
+        'key': {'algorithm': 'RSA', 'data': '-----BEGIN PUBLIC KEY-----\n%s\n-----END PUBLIC KEY-----' % b64(162)},
+        'seed': 'moky',
+        'fingerprint': b64(128),
+    }
+    msg['visa'] = {
+        'ID': msg['sender'],
+        'data': json.dumps({'name': 'Moky', 'key': {'algorithm': 'RSA', 'data': b64(162)}}),
+        'signature': b64(128),
+    }
+    return msg
+
+
+def message_mix(count: int) -> List[dict]:
+    """ mostly short texts, some files, group messages and handshakes """
+    messages = []
+    for i in range(count):
+        x = i % 20
+        if x < 12:
+            messages.append(personal_message(size=random.randint(32, 512)))
+        elif x < 15:
+            messages.append(personal_message(size=random.randint(4096, 32768)))
+        elif x < 19:
+            messages.append(group_message(size=random.randint(32, 512), members=random.randint(3, 50)))
+        else:
+            messages.append(handshake_message())
+    return messages
+
+
+def json_serialize(msg: ReliableMessage) -> bytes:
+    return json.dumps(msg.dictionary).encode('utf-8')
+
+
+def json_deserialize(data: bytes) -> ReliableMessage:
+    return ReliableMessage.parse(msg=json.loads(data.decode('utf-8')))
+
+
+def random_message() -> dict:
+    """ message with random fields """
+    msg = {
+        'sender': address(),
+        'receiver': address(),
+    }
+    if random.random() < 0.9:
+        msg['time'] = random.randint(0, 0xFFFFFFFF)
+    if random.random() < 0.5:
+        msg['type'] = random.randint(0, 255)
+    if random.random() < 0.3:
+        msg['group'] = 'Group-%d@%s' % (random.randint(0, 999), 'x8Eudmgq4rHvTm2ongrwk6BVdS1wuE7ctE')
+    if random.random() < 0.2:
+        msg['data'] = json.dumps({'text': b64(random.randint(0, 64))})
+    else:
+        msg['data'] = b64(random.randint(1, 2048))
+    msg['signature'] = b64(random.choice([64, 128, 256]))
+    x = random.random()
+    if x < 0.4:
+        msg['key'] = b64(random.randint(6, 256))
+    elif x < 0.8:
+        keys = {'member%d@%s' % (i, address().split('@')[1]): b64(random.randint(1, 256))
+                for i in range(random.randint(0, 64))}
+        if random.random() < 0.5:
+            keys['digest'] = b64(6)
+        msg['keys'] = keys
+    if random.random() < 0.2:
+        msg['meta'] = {'type': 1, 'seed': 'moky', 'key': {'algorithm': 'RSA', 'data': b64(162)}}
+    if random.random() < 0.2:
+        msg['visa'] = {'ID': msg['sender'], 'data': '{"name":"moky"}', 'signature': b64(128)}
+    return msg
+
+
+def check(messages: List[dict]):
+    for info in messages:
+        msg = ReliableMessage.parse(msg=info)
+        before = msg.copy_dictionary()
+        data = MTPUtils.serialize_message(msg=msg)
+        assert msg.dictionary == before, 'message changed after serializing'
+        assert data == LegacyUtils.serialize_message(msg=msg), 'serialized data not match'
+        res = MTPUtils.deserialize_message(data=data)
+        assert res.dictionary == LegacyUtils.deserialize_message(data=data).dictionary, 'deserialized not match'
+        assert res.sender == msg.sender and res.receiver == msg.receiver, 'envelope error'
+        assert res.get('data') == msg.get('data'), 'content error'
+        assert res.get('signature') == msg.get('signature'), 'signature error'
+        assert res.get('key') == msg.get('key'), 'key error'
+        assert res.get('keys', {}) == msg.get('keys', {}), 'keys error'  # empty 'keys' dropped
+        assert res.get('meta') == msg.get('meta'), 'meta error'
+        assert res.visa == msg.visa, 'visa error'
+
+
+def fuzz(count: int):
+    """ round trip with random messages, then parse corrupted data """
+    messages = [random_message() for _ in range(count)]
+    check(messages=messages)
+    packages = [MTPUtils.serialize_message(msg=ReliableMessage.parse(msg=info)) for info in messages]
+    errors = 0
+    for data in packages:
+        data = bytearray(data)
+        x = random.random()
+        if x < 0.4:
+            # truncated
+            data = data[:random.randint(0, len(data) - 1)]
+        elif x < 0.8:
+            # flipped
+            for _ in range(random.randint(1, 8)):
+                data[random.randint(0, len(data) - 1)] = random.randint(0, 255)
+        else:
+            # inserted
+            pos = random.randint(0, len(data))
+            data[pos:pos] = os.urandom(random.randint(1, 8))
+        try:
+            MTPUtils.deserialize_message(data=bytes(data))
+        except ValueError:
+            # including UnicodeDecodeError & JSONDecodeError
+            errors += 1
+    print('fuzz: %d messages, %d corrupted packages rejected' % (count, errors))
+
+
+def bench_keys(members: int, count: int):
+    """ group message with a big 'keys' map """
+    messages = [ReliableMessage.parse(msg=group_message(size=256, members=members)) for _ in range(count)]
+    packages = [LegacyUtils.serialize_message(msg=msg) for msg in messages]
+    start = time.time()
+    for msg in messages:
+        LegacyUtils.serialize_message(msg=msg)
+    t1 = time.time() - start
+    start = time.time()
+    for msg in messages:
+        MTPUtils.serialize_message(msg=msg)
+    t2 = time.time() - start
+    start = time.time()
+    for data in packages:
+        LegacyUtils.deserialize_message(data=data)
+    t3 = time.time() - start
+    start = time.time()
+    for data in packages:
+        MTPUtils.deserialize_message(data=data)
+    t4 = time.time() - start
+    print('%d members x %d: serialize %.2f ms -> %.2f ms (%.0fx), deserialize %.2f ms -> %.2f ms (%.0fx)'
+          % (members, count, t1 * 1000 / count, t2 * 1000 / count, t1 / t2,
+             t3 * 1000 / count, t4 * 1000 / count, t3 / t4))
+
+
+def bench(name: str, messages: List[ReliableMessage], serialize, deserialize):
+    start = time.time()
+    packages = [serialize(msg) for msg in messages]
+    t1 = time.time() - start
+    start = time.time()
+    for data in packages:
+        deserialize(data)
+    t2 = time.time() - start
+    size = sum([len(data) for data in packages])
+    count = len(messages)
+    print('%6s: %10d bytes (%6d avg), serialize %7.2f us/msg, deserialize %7.2f us/msg'
+          % (name, size, size // count, t1 * 1000000 / count, t2 * 1000000 / count))
+    return size
+
+
+if __name__ == '__main__':
+    fuzz(count=2000)
+    bench_keys(members=500, count=20)
+    mix = message_mix(count=2000)
+    check(messages=mix)
+    mix = [ReliableMessage.parse(msg=info) for info in mix]
+    j = bench('JsON', mix, json_serialize, json_deserialize)
+    d = bench('D-MTP', mix, MTPUtils.serialize_message, MTPUtils.deserialize_message)
+    print('D-MTP saves %.1f%% bytes on the wire' % ((j - d) * 100.0 / j))
@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Notification Center Benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Posting notifications on the message path to slow observers,
+    calling them synchronously vs delivering via observer queues
+"""
+
+import sys
+import os
+import time
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.utils import Notification, NotificationObserver, NotificationQueue, NotificationCenter
+
+
+class SlowObserver(NotificationObserver):
+
+    def __init__(self, cost: float):
+        super().__init__()
+        self.cost = cost
+        self.count = 0
+
+    def received_notification(self, notification: Notification):
+        self.count += 1
+        expired = time.perf_counter() + self.cost
+        while time.perf_counter() < expired:
+            pass
+
+
+def user_key(notification: Notification) -> tuple:
+    return notification.name, notification.info.get('ID')
+
+
+def run(name: str, count: int, observers: list, queues: list) -> float:
+    nc = NotificationCenter()
+    for index in range(len(observers)):
+        nc.set_queue(observer=observers[index], queue=queues[index])
+        nc.add(observer=observers[index], name=name)
+    start = time.time()
+    for i in range(count):
+        nc.post(name=name, sender=observers, info={'ID': 'moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ', 'sn': i})
+    elapsed = time.time() - start
+    for observer in observers:
+        nc.remove(observer=observer, name=name)
+    return elapsed
+
+
+def bench(count: int, cost: float):
+    # synchronous observers
+    observers = [SlowObserver(cost=cost) for _ in range(3)]
+    t1 = run(name='sync', count=count, observers=observers, queues=[None, None, None])
+    # asynchronous observers, like Monitor, Receptionist and NotificationPusher
+    observers = [SlowObserver(cost=cost) for _ in range(3)]
+    queues = [
+        NotificationQueue(observer=observers[0], policy=NotificationQueue.DROP_OLDEST),
+        NotificationQueue(observer=observers[1], policy=NotificationQueue.COALESCE, key=user_key),
+        NotificationQueue(observer=observers[2], policy=NotificationQueue.COALESCE, key=user_key),
+    ]
+    t2 = run(name='async', count=count, observers=observers, queues=queues)
+    stats = [queue.statistics() for queue in queues]
+    print('%6d posts, 3 observers x %3.0f us: sync %7.0f posts/s, queued %7.0f posts/s (%.1fx)'
+          % (count, cost * 1000000, count / t1, count / t2, t1 / t2))
+    for info in stats:
+        print('        %-12s max depth %5d, dropped %6d, coalesced %6d'
+              % (info['policy'], info['max_depth'], info['dropped'], info['coalesced']))
+
+
+if __name__ == '__main__':
+    bench(count=20000, cost=0.00001)
+    bench(count=20000, cost=0.00005)
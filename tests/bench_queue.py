@@ -0,0 +1,157 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Message Queue Benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Signature-indexed MessageQueue/MessageBundle vs the list-based versions
+"""
+
+import sys
+import os
+import time
+from typing import Optional, List
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.session import MessageQueue, MessageWrapper
+from libs.common.database.message_table import MessageTable, MessageBundle
+
+
+class FakeMessage(dict):
+    pass
+
+
+class ListQueue:
+    """ list-based MessageQueue (before indexed) """
+
+    def __init__(self):
+        super().__init__()
+        self.__wrappers: List[MessageWrapper] = []
+
+    def append(self, msg) -> bool:
+        signature = msg.get('signature')
+        for wrapper in self.__wrappers:
+            item = wrapper.msg
+            if item is not None and item.get('signature') == signature:
+                return True
+        self.__wrappers.append(MessageWrapper(msg=msg))
+        return True
+
+    def next(self) -> Optional[MessageWrapper]:
+        for wrapper in self.__wrappers:
+            if wrapper.virgin:
+                wrapper.mark()
+                return wrapper
+
+    def eject(self) -> Optional[MessageWrapper]:
+        for wrapper in self.__wrappers:
+            if wrapper.msg is None or wrapper.failed:
+                self.__wrappers.remove(wrapper)
+                return wrapper
+
+
+class ListBundle:
+    """ list-based MessageBundle (before indexed) """
+
+    def __init__(self, messages: list):
+        super().__init__()
+        self.__stored = messages
+        self.__messages = []
+
+    def erase(self, msg) -> bool:
+        signature = msg.get('signature')
+        for item in self.__messages:
+            if item.get('signature') == signature:
+                self.__messages.remove(item)
+                return True
+
+    def all(self) -> list:
+        for msg in self.__stored:
+            exists = False
+            signature = msg.get('signature')
+            for item in self.__messages:
+                if item.get('signature') == signature:
+                    exists = True
+                    break
+            if not exists:
+                self.__messages.append(msg)
+        return self.__messages.copy()
+
+
+class FakeTable(MessageTable):
+    """ message table with messages in memory """
+
+    def __init__(self, messages: list):
+        super().__init__()
+        self.__stored = messages
+
+    def fetch_messages(self, receiver, start: int = 0) -> (int, list):
+        return len(self.__stored), self.__stored[start:]
+
+    def remove_message(self, msg) -> bool:
+        return True
+
+
+def run_queue(queue, messages: list) -> float:
+    start = time.time()
+    for msg in messages:
+        queue.append(msg=msg)
+    # duplicated
+    for msg in messages:
+        queue.append(msg=msg)
+    while True:
+        wrapper = queue.next()
+        if wrapper is None:
+            break
+        wrapper.ship_sent(ship=None)
+    while queue.eject() is not None:
+        pass
+    return time.time() - start
+
+
+def run_bundle(bundle, messages: list) -> float:
+    start = time.time()
+    bundle.all()
+    bundle.all()
+    for msg in messages:
+        bundle.erase(msg=msg)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    for count in [100, 1000, 5000]:
+        array = [FakeMessage(signature='signature-%d' % i) for i in range(count)]
+        t1 = run_queue(queue=ListQueue(), messages=array)
+        t2 = run_queue(queue=MessageQueue(), messages=array)
+        print('MessageQueue  %5d msgs: list %8.3fs, indexed %8.3fs' % (count, t1, t2))
+        t1 = run_bundle(bundle=ListBundle(messages=array), messages=array)
+        table = FakeTable(messages=array)
+        t2 = run_bundle(bundle=MessageBundle(db=table, identifier=None), messages=array)
+        print('MessageBundle %5d msgs: list %8.3fs, indexed %8.3fs' % (count, t1, t2))
@@ -0,0 +1,128 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Protocol Sniffer Benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Creating dockers for a storm of new connections with mixed protocols,
+    checking every docker in turn vs classifying by magic code
+"""
+
+import sys
+import os
+import random
+import time
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.network.gate import TCPGate
+from libs.network.mtp import MTPDocker
+from libs.network.mars import MarsDocker
+from libs.network.ws import WSDocker
+
+from bench_gate import FakeConnection, mtp_package, mars_package
+
+
+class LegacyGate(TCPGate):
+    """ checking all dockers in turn (before rewritten) """
+
+    def _create_docker(self):
+        if MTPDocker.check(gate=self):
+            return MTPDocker(gate=self)
+        if MarsDocker.check(gate=self):
+            return MarsDocker(gate=self)
+        buffer = self.receive(length=WSDocker.MAX_PACK_LENGTH, remove=False)
+        if buffer is not None and buffer.find(b'Sec-WebSocket-Key') > 0:
+            return WSDocker(gate=self)
+
+
+ws_handshake = (b'GET /ws HTTP/1.1\r\n'
+                b'Host: station.dim.chat:9394\r\n'
+                b'User-Agent: Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/605.1.15\r\n'
+                b'Upgrade: websocket\r\n'
+                b'Connection: Upgrade\r\n'
+                b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                b'Sec-WebSocket-Version: 13\r\n'
+                b'Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n\r\n')
+
+
+def storm(count: int) -> list:
+    """ first packages of new connections: Mars mostly """
+    packages = []
+    payload = os.urandom(512)
+    for i in range(count):
+        x = random.random()
+        if x < 0.6:
+            packages.append((MarsDocker, mars_package(payload=payload)))
+        elif x < 0.8:
+            packages.append((MTPDocker, mtp_package(payload=payload)))
+        else:
+            packages.append((WSDocker, ws_handshake))
+    return packages
+
+
+def run(gate_class, packages: list, segment: int) -> float:
+    start = time.time()
+    for docker_class, data in packages:
+        conn = FakeConnection()
+        gate = gate_class(connection=conn)
+        docker = None
+        for pos in range(0, len(data), segment):
+            conn.segments.append(data[pos:pos+segment])
+            docker = gate.docker
+            if docker is not None:
+                break
+        assert isinstance(docker, docker_class), 'docker error: %s, %s' % (docker, docker_class)
+    return time.time() - start
+
+
+def check():
+    conn = FakeConnection()
+    gate = TCPGate(connection=conn)
+    conn.segments.append(b'\x16\x03\x01\x02\x00\x01\x00\x01')  # TLS client hello
+    assert gate.docker is None
+    sniffer = TCPGate.sniffer
+    assert sniffer.classify(data=b'DI') is None
+    assert sniffer.classify(data=b'GET /') is WSDocker
+    assert sniffer.classify(data=memoryview(mars_package(payload=b'PING'))) is MarsDocker
+
+
+def bench(count: int, segment: int):
+    packages = storm(count=count)
+    t1 = run(LegacyGate, packages=packages, segment=segment)
+    t2 = run(TCPGate, packages=packages, segment=segment)
+    print('%6d connections, %4d bytes/segment: legacy %7.0f conn/s, sniffer %7.0f conn/s (%.1fx)'
+          % (count, segment, count / t1, count / t2, t1 / t2))
+
+
+if __name__ == '__main__':
+    check()
+    bench(count=10000, segment=1024)
+    bench(count=10000, segment=64)
+    bench(count=10000, segment=8)
@@ -0,0 +1,808 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Station Load Test
+    ~~~~~~~~~~~~~~~~~
+
+    Simulated users talking to a local station through MTP, Mars & WebSocket
+
+        1. accounts are generated into a temporary storage directory,
+           which is shared by the station and the clients (no network needed);
+        2. the station runs in a child process, and the users are spread over
+           several client processes (one session thread for each user);
+        3. client processes send personal/group/broadcast messages in a mix
+           at a fixed rate, and record the latencies of receipts (from the
+           station) and deliveries (to the receivers);
+        4. CPU & RSS of the station process are read from '/proc'.
+
+    Usage:
+        tests/bench_station.py --users 30 --rate 100 --duration 10 --mix 8:1:1
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import weakref
+from typing import Optional, List, Dict
+
+from dimp import PrivateKey, ID, Meta, MetaType, NetworkType, EVERYONE
+from dimp import Envelope, InstantMessage, ReliableMessage, Content, TextContent
+from dimsdk import HandshakeCommand, ReceiptCommand
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.utils import Log
+from startrek import StarDocker
+
+from libs.network import Gate, GateStatus, Ship, ShipDelegate, StarShip
+from libs.network import MarsShip, MarsDocker, WSShip
+from libs.network.protocol import NetMsg, NetMsgHead, NetMsgSeq, WebSocket, WebSocketParser
+from libs.network.protocol.ws import unmask
+from libs.network.mars import seq_to_sn
+from libs.common import Storage, CommonFacebook
+from libs.client import Terminal, Server, ClientMessenger, ClientProcessor
+
+
+KINDS = ['personal', 'group', 'broadcast']
+
+BENCH_TIME = 'bench_time'  # sending time, attached to messages for measuring the delivery latency
+
+
+#
+#   Client Dockers
+#
+
+class MarsClientDocker(MarsDocker):
+    """ Mars docker for client: SEND_MSG for requests, responding PUSH_MESSAGE with its SN """
+
+    # Override
+    def pack(self, payload: bytes, priority: int = 0, delegate: Optional[ShipDelegate] = None) -> StarShip:
+        seq = NetMsgSeq.generate()
+        mars = NetMsg.join(cmd=NetMsgHead.SEND_MSG, seq=seq, parts=[payload])
+        return MarsShip(mars=mars, priority=priority, delegate=delegate, sn=seq_to_sn(seq=seq), payload=payload)
+
+    # Override
+    def process_income_ship(self, income: Ship) -> Optional[StarShip]:
+        assert isinstance(income, MarsShip), 'income ship error: %s' % income
+        head = income.mars.head
+        payload = income.payload
+        res = None
+        if payload is not None and len(payload) > 0 and payload not in [b'PONG', b'NOOP']:
+            delegate = self.gate.delegate
+            if delegate is not None:
+                res = delegate.gate_received(gate=self.gate, ship=income)
+        if res is None:
+            res = b''
+        if head.cmd == NetMsgHead.PUSH_MESSAGE:
+            # respond with the same SN, so the station removes the waiting ship
+            mars = NetMsg.join(cmd=NetMsgHead.SEND_MSG, seq=NetMsgSeq.generate(),
+                               parts=[b'Mars SN:', income.sn, b'\n', res])
+            return MarsShip(mars=mars, priority=StarShip.URGENT, payload=res)
+        elif len(res) > 0:
+            return self.pack(payload=res, priority=StarShip.NORMAL)
+
+    # Override
+    def get_heartbeat(self) -> Optional[StarShip]:
+        mars = NetMsg.join(cmd=NetMsgHead.NOOP, seq=NetMsgSeq.generate())
+        return MarsShip(mars=mars, priority=StarShip.SLOWER, payload=b'')
+
+
+def mask_frame(payload: bytes, opcode: int = WebSocket.TEXT) -> bytes:
+    """ Frames from client must be masked """
+    key = os.urandom(4)
+    frame = bytearray(WebSocket.pack(payload=unmask(payload=payload, mask=key), opcode=opcode))
+    pos = len(frame) - len(payload)
+    frame[1] |= 0x80
+    frame[pos:pos] = key
+    return bytes(frame)
+
+
+class WSClientShip(WSShip):
+    """ Masked frame, with the upgrade request before the first one """
+
+    def __init__(self, docker, payload: bytes, priority: int = 0, delegate: Optional[ShipDelegate] = None):
+        super().__init__(package=None, payload=payload, priority=priority, delegate=delegate)
+        self.__docker = weakref.ref(docker)
+        self.__package = None
+
+    @property
+    def package(self) -> bytes:
+        # called just before sending
+        if self.__package is None:
+            self.__package = self.__docker().attach_request(frame=mask_frame(payload=self.payload))
+        return self.__package
+
+
+class WSClientDocker(StarDocker):
+    """ WebSocket docker for client: upgrade request first, then masked frames """
+
+    MAX_PACK_LENGTH = 65536  # 64 KB
+
+    def __init__(self, gate: Gate):
+        super().__init__(gate=gate)
+        self.__parser = WebSocketParser()
+        self.__lock = threading.Lock()
+        self.__requested = False
+        self.__upgraded = False
+
+    def attach_request(self, frame: bytes) -> bytes:
+        """ Send upgrade request with the first frame (no sending here, status changing may callback) """
+        with self.__lock:
+            if self.__requested:
+                return frame
+            self.__requested = True
+        key = base64.b64encode(os.urandom(16))
+        return b'GET / HTTP/1.1\r\n' \
+               b'Host: localhost\r\n' \
+               b'Upgrade: websocket\r\n' \
+               b'Connection: Upgrade\r\n' \
+               b'Sec-WebSocket-Key: ' + key + b'\r\n' \
+               b'Sec-WebSocket-Version: 13\r\n\r\n' + frame
+
+    # Override
+    def process(self) -> bool:
+        # not connected yet? the ship with upgrade request must not be lost
+        if self.gate.status != GateStatus.Connected:
+            return False
+        return super().process()
+
+    # Override
+    def pack(self, payload: bytes, priority: int = 0, delegate: Optional[ShipDelegate] = None) -> StarShip:
+        return WSClientShip(docker=self, payload=payload, priority=priority, delegate=delegate)
+
+    def __upgrade(self) -> bool:
+        """ Skip the handshake response """
+        view = self.gate.peek(length=self.MAX_PACK_LENGTH)
+        if view is None:
+            return False
+        pos = bytes(view).find(b'\r\n\r\n')
+        view.release()
+        if pos < 0:
+            return False
+        self.gate.skip(length=pos + 4)
+        self.__upgraded = True
+        return True
+
+    # Override
+    def get_income_ship(self) -> Optional[Ship]:
+        if not self.__upgraded and not self.__upgrade():
+            return None
+        gate = self.gate
+        parser = self.__parser
+        while True:
+            expected = parser.expected
+            view = gate.peek(length=expected)
+            if view is None:
+                return None
+            count, frame = parser.parse(stream=view)
+            view.release()
+            if count == 0:
+                if parser.expected != expected:
+                    continue
+                return None
+            gate.skip(length=count)
+            if parser.error is not None:
+                gate.stop()
+                return None
+            if frame is None:
+                continue
+            if frame.opcode == WebSocket.PING:
+                gate.send(data=mask_frame(payload=frame.payload, opcode=WebSocket.PONG))
+            elif frame.opcode == WebSocket.CLOSE:
+                gate.stop()
+                return None
+            elif frame.opcode in [WebSocket.TEXT, WebSocket.BINARY]:
+                return WSShip(package=frame.payload, payload=frame.payload)
+
+    # Override
+    def process_income_ship(self, income: Ship) -> Optional[StarShip]:
+        body = income.payload
+        if body in [b'OK', b'PONG', b'NOOP']:
+            return None
+        elif body == b'PING':
+            return self.pack(payload=b'PONG', priority=StarShip.SLOWER)
+        delegate = self.gate.delegate
+        if delegate is not None:
+            res = delegate.gate_received(gate=self.gate, ship=income)
+            if res is not None and len(res) > 0:
+                return self.pack(payload=res, priority=StarShip.NORMAL)
+
+    # Override
+    def remove_linked_ship(self, income: Ship):
+        pass
+
+    # Override
+    def get_heartbeat(self) -> Optional[StarShip]:
+        return self.pack(payload=b'NOOP', priority=StarShip.SLOWER)
+
+
+DOCKERS = {
+    'mtp': None,  # default docker of client session
+    'mars': MarsClientDocker,
+    'ws': WSClientDocker,
+}
+
+
+#
+#   Simulated Users
+#
+
+class Recorder:
+    """ Latencies measured in one client process """
+
+    def __init__(self):
+        super().__init__()
+        self.__lock = threading.Lock()
+        self.__pending: Dict[str, tuple] = {}  # signature -> (kind, time)
+        self.sent = {kind: 0 for kind in KINDS}
+        self.acked = {kind: [] for kind in KINDS}
+        self.delivered = {kind: [] for kind in KINDS}
+        self.handshakes = []
+
+    def send(self, kind: str, msg: ReliableMessage, now: float):
+        with self.__lock:
+            self.__pending[msg.get('signature')] = (kind, now)
+            self.sent[kind] += 1
+
+    def ack(self, signature: str, now: float):
+        with self.__lock:
+            info = self.__pending.pop(signature, None)
+            if info is not None:
+                self.acked[info[0]].append(now - info[1])
+
+    def deliver(self, msg: ReliableMessage, now: float):
+        if msg.receiver.is_group:
+            kind = 'group'
+        elif msg.receiver.is_broadcast:
+            kind = 'broadcast'
+        else:
+            kind = 'personal'
+        with self.__lock:
+            self.delivered[kind].append(now - msg.get(BENCH_TIME))
+
+    def handshake(self, seconds: float):
+        with self.__lock:
+            self.handshakes.append(seconds)
+
+    @property
+    def summary(self) -> dict:
+        with self.__lock:
+            return {
+                'sent': self.sent,
+                'acked': self.acked,
+                'delivered': self.delivered,
+                'handshakes': self.handshakes,
+            }
+
+
+g_recorder = Recorder()
+
+
+class BenchProcessor(ClientProcessor):
+
+    # Override
+    def process_reliable_message(self, msg: ReliableMessage) -> Optional[ReliableMessage]:
+        if msg.get(BENCH_TIME) is not None:
+            # no need to decrypt the messages sent by other users
+            g_recorder.deliver(msg=msg, now=time.time())
+            return None
+        return super().process_reliable_message(msg=msg)
+
+    # Override
+    def process_content(self, content: Content, r_msg: ReliableMessage) -> Optional[Content]:
+        if isinstance(content, HandshakeCommand):
+            return super().process_content(content=content, r_msg=r_msg)
+        if isinstance(content, ReceiptCommand):
+            signature = content.get('signature')
+            if signature is not None:
+                g_recorder.ack(signature=signature, now=time.time())
+        # keep silent
+        return None
+
+
+class BenchMessenger(ClientMessenger):
+    """ Messenger with its own facebook, so users can share one process """
+
+    def __init__(self, user: ID):
+        super().__init__()
+        self.__user = user
+        self.__start = time.time()
+        self.__ready = threading.Event()
+
+    @property
+    def ready(self) -> threading.Event:
+        return self.__ready
+
+    # Override
+    def _create_facebook(self) -> CommonFacebook:
+        facebook = CommonFacebook()
+        facebook.messenger = self
+        facebook.current_user = facebook.user(identifier=self.__user)
+        return facebook
+
+    # Override
+    def _create_processor(self) -> ClientProcessor:
+        return BenchProcessor(messenger=self)
+
+    # Override
+    def handshake_accepted(self, server: Server):
+        g_recorder.handshake(seconds=time.time() - self.__start)
+        res = super().handshake_accepted(server=server)
+        self.__ready.set()
+        return res
+
+
+def connect_user(user: ID, station: ID, port: int, protocol: str) -> Terminal:
+    messenger = BenchMessenger(user=user)
+    docker_class = DOCKERS[protocol]
+    if docker_class is None:
+        server = Server(identifier=station, host='127.0.0.1', port=port)
+    else:
+        server = Server(identifier=station, host='127.0.0.1', port=port, docker_class=docker_class)
+    terminal = Terminal()
+    messenger.delegate = server
+    messenger.terminal = terminal
+    server.messenger = messenger
+    terminal.messenger = messenger
+    terminal.start(server=server)
+    return terminal
+
+
+def send_message(messenger: BenchMessenger, kind: str, receiver: ID, size: int, burst: int = 1):
+    sender = messenger.facebook.current_user.identifier
+    messages = []
+    for _ in range(burst):
+        content = TextContent(text='x' * size)
+        if kind == 'group':
+            content.group = receiver
+        elif kind == 'broadcast':
+            content.group = EVERYONE
+        env = Envelope.create(sender=sender, receiver=receiver)
+        i_msg = InstantMessage.create(head=env, body=content)
+        s_msg = messenger.encrypt_message(msg=i_msg)
+        messages.append(messenger.sign_message(msg=s_msg))
+    now = time.time()
+    for r_msg in messages:
+        r_msg[BENCH_TIME] = now
+        g_recorder.send(kind=kind, msg=r_msg, now=now)
+    if burst == 1:
+        messenger.send_message(msg=messages[0])
+    else:
+        # JsON in lines, as a client flushing its offline queue
+        lines = [json.dumps(r_msg.dictionary).encode('utf-8') for r_msg in messages]
+        messenger.send_package(data=b'\n'.join(lines), handler=None)
+
+
+def run_clients(conf: dict):
+    """ Client process: connect users, wait for the start signal, send messages, and report """
+    Storage.root = conf['root']
+    Log.LEVEL = Log.RELEASE
+    station = ID.parse(identifier=conf['station'])
+    port = conf['port']
+    everyone = [ID.parse(identifier=item) for item in conf['everyone']]
+    group = ID.parse(identifier=conf['group'])
+    members = [ID.parse(identifier=item) for item in conf['members']]
+    # 1. connect
+    terminals: Dict[ID, Terminal] = {}
+    for identifier, protocol in conf['users']:
+        identifier = ID.parse(identifier=identifier)
+        terminals[identifier] = connect_user(user=identifier, station=station, port=port, protocol=protocol)
+    deadline = time.time() + conf['timeout']
+    for terminal in terminals.values():
+        terminal.messenger.ready.wait(timeout=max(0.0, deadline - time.time()))
+    online = [identifier for identifier, terminal in terminals.items() if terminal.messenger.ready.is_set()]
+    with open(conf['ready'], 'w') as file:
+        file.write('%d' % len(online))
+    # 2. wait for the start time
+    while not os.path.exists(conf['go']):
+        time.sleep(0.05)
+    with open(conf['go'], 'r') as file:
+        start = float(file.read())
+    # 3. send messages at the rate
+    senders = [identifier for identifier in online if identifier in everyone]
+    group_senders = [identifier for identifier in senders if identifier in members]
+    weights = conf['mix']
+    interval = 1.0 / conf['rate'] if conf['rate'] > 0 else 0
+    end = start + conf['duration']
+    count = 0
+    lag = 0.0
+    while len(senders) > 0:
+        target = start + count * interval
+        now = time.time()
+        if target >= end or now >= end:
+            break
+        if target > now:
+            time.sleep(target - now)
+        else:
+            lag = max(lag, now - target)
+        count += 1
+        kind = random.choices(KINDS, weights=weights)[0]
+        if kind == 'group' and len(group_senders) > 0:
+            sender = random.choice(group_senders)
+            receiver = group
+        elif kind == 'broadcast':
+            sender = random.choice(senders)
+            receiver = EVERYONE
+        else:
+            kind = 'personal'
+            sender = random.choice(senders)
+            receiver = random.choice(everyone)
+            while receiver == sender:
+                receiver = random.choice(everyone)
+        try:
+            send_message(messenger=terminals[sender].messenger, kind=kind, receiver=receiver, size=conf['size'],
+                         burst=conf['burst'])
+        except Exception as error:
+            Log.error('failed to send %s message: %s' % (kind, error))
+    # 4. waiting for receipts & deliveries
+    time.sleep(max(0.0, end + conf['drain'] - time.time()))
+    summary = g_recorder.summary
+    summary['online'] = len(online)
+    summary['lag'] = lag
+    with open(conf['result'], 'w') as file:
+        json.dump(summary, file)
+    for terminal in terminals.values():
+        terminal.stop()
+    # session threads are not daemons
+    os._exit(0)
+
+
+#
+#   Station Process
+#
+
+def run_station(conf: dict):
+    import runpy
+    import etc.config as config
+    config.base_dir = conf['root']
+    config.gsp_conf = os.path.join(conf['root'], 'gsp.js')
+    config.bind_host = '127.0.0.1'
+    config.bind_port = conf['port']
+    config.bind_async = conf['async']
+    config.local_port = conf['port']
+    config.metrics_port = conf['metrics_port']
+    config.dispatcher_shards = conf['shards']
+    config.crypto_workers = conf['crypto_workers']
+    config.crypto_processes = conf['crypto_processes']
+    config.apns_credentials = None
+    Log.LEVEL = Log.RELEASE
+    # server processors registered by station modules will replace the client ones
+    runpy.run_path(os.path.join(rootPath, 'station', 'start.py'), run_name='__main__')
+
+
+class ProcessStat:
+    """ CPU & memory of a process from '/proc' (Linux only) """
+
+    TICKS = os.sysconf('SC_CLK_TCK')
+
+    def __init__(self, pid: int):
+        super().__init__()
+        self.pid = pid
+
+    @property
+    def cpu(self) -> float:
+        """ user + system time in seconds """
+        with open('/proc/%d/stat' % self.pid, 'r') as file:
+            stat = file.read()
+        # skip 'pid (comm)', the command name may contain spaces
+        fields = stat[stat.rfind(')') + 2:].split()
+        return (int(fields[11]) + int(fields[12])) / self.TICKS
+
+    @property
+    def rss(self) -> int:
+        """ resident set size in bytes """
+        with open('/proc/%d/status' % self.pid, 'r') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+
+#
+#   Accounts
+#
+
+def generate_account(facebook: CommonFacebook, network: int, seed: str) -> ID:
+    key = PrivateKey.generate(algorithm=PrivateKey.RSA)
+    meta = Meta.generate(version=MetaType.DEFAULT, key=key, seed=seed)
+    identifier = meta.generate_identifier(network=network)
+    facebook.save_private_key(key=key, identifier=identifier)
+    facebook.save_meta(meta=meta, identifier=identifier)
+    return identifier
+
+
+def generate_group(facebook: CommonFacebook, founder: ID, members: List[ID]) -> ID:
+    key = facebook.private_key_for_visa_signature(identifier=founder)
+    meta = Meta.generate(version=MetaType.DEFAULT, key=key, seed='bench-group')
+    identifier = meta.generate_identifier(network=NetworkType.GROUP)
+    facebook.save_meta(meta=meta, identifier=identifier)
+    facebook.save_members(members=members, identifier=identifier)
+    return identifier
+
+
+def prepare_accounts(root: str, users: int, group_size: int, port: int) -> dict:
+    Storage.root = root
+    # new accounts, no need to report records not found
+    Log.set_level(level=0, tag='libs.common.database')
+    facebook = CommonFacebook()
+    station = generate_account(facebook=facebook, network=NetworkType.STATION, seed='station')
+    assistant = generate_account(facebook=facebook, network=NetworkType.ROBOT, seed='assistant')
+    everyone = [generate_account(facebook=facebook, network=NetworkType.MAIN, seed='user%d' % index)
+                for index in range(users)]
+    members = everyone[:max(2, min(group_size, users))]
+    group = generate_group(facebook=facebook, founder=members[0], members=members)
+    Storage.write_json(container={
+        'stations': [{'ID': str(station), 'host': '127.0.0.1', 'port': port}],
+        'assistants': [str(assistant)],
+        'archivists': [str(assistant)],
+    }, path=os.path.join(root, 'gsp.js'))
+    return {
+        'station': str(station),
+        'assistant': str(assistant),
+        'everyone': [str(item) for item in everyone],
+        'group': str(group),
+        'members': [str(item) for item in members],
+    }
+
+
+#
+#   Report
+#
+
+def percentile(values: List[float], q: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def latency_columns(values: List[float]) -> str:
+    values = sorted(values)
+    return '%8d %8.2f %8.2f %8.2f' % (len(values), percentile(values, 0.50) * 1000,
+                                      percentile(values, 0.95) * 1000, percentile(values, 0.99) * 1000)
+
+
+def free_port() -> int:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_port(port: int, timeout: float, proc: subprocess.Popen = None) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            # process exited
+            return False
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def spawn(mode: str, conf: dict, path: str, log: str) -> subprocess.Popen:
+    with open(path, 'w') as file:
+        json.dump(conf, file)
+    with open(log, 'w') as output:
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), mode, path],
+                                stdout=output, stderr=subprocess.STDOUT)
+
+
+def print_tail(path: str, lines: int = 20):
+    try:
+        with open(path, 'r', errors='replace') as file:
+            tail = file.readlines()[-lines:]
+    except OSError as error:
+        print('failed to read %s: %s' % (path, error))
+        return
+    print('---- tail of %s ----' % path)
+    print(''.join(tail).rstrip())
+    print('----')
+
+
+def scrape_metrics(port: int) -> List[str]:
+    try:
+        with urllib.request.urlopen('http://127.0.0.1:%d/metrics' % port, timeout=5) as response:
+            text = response.read().decode('utf-8')
+    except OSError as error:
+        return ['failed to scrape metrics: %s' % error]
+    names = ['dim_package_process_seconds', 'dim_dispatcher_wait_seconds', 'dim_trace_total_seconds',
+             'dim_crypto_seconds']
+    quantiles = ['quantile="0.5"', 'quantile="0.99"', '_count']
+    return [line for line in text.splitlines()
+            if any(line.startswith(name) for name in names) and any(item in line for item in quantiles)]
+
+
+def main(args):
+    protocols = args.protocols.split(',')
+    for item in protocols:
+        assert item in DOCKERS, 'unknown protocol: %s' % item
+    mix = [float(item) for item in args.mix.split(':')]
+    assert len(mix) == 3 and sum(mix) > 0, 'mix error: %s' % args.mix
+    root = tempfile.mkdtemp(prefix='dim-load-')
+    port = free_port()
+    metrics_port = free_port()
+    print('generating %d accounts in %s ...' % (args.users + 2, root))
+    start = time.time()
+    accounts = prepare_accounts(root=root, users=args.users, group_size=args.group_size, port=port)
+    print('    done in %.1f seconds' % (time.time() - start))
+    station = None
+    clients = []
+    finished = False
+    try:
+        # 1. start station
+        station = spawn(mode='station', conf={
+            'root': root, 'port': port, 'metrics_port': metrics_port, 'async': args.use_async, 'shards': args.shards,
+            'crypto_workers': args.crypto_workers, 'crypto_processes': args.crypto_processes,
+        }, path=os.path.join(root, 'station.json'), log=os.path.join(root, 'station.log'))
+        if not wait_port(port=port, timeout=60, proc=station):
+            print_tail(path=os.path.join(root, 'station.log'))
+            raise AssertionError('station not started, see %s' % os.path.join(root, 'station.log'))
+        # 2. start clients, the assistant goes with the first process
+        users = [(identifier, protocols[index % len(protocols)]) for index, identifier in enumerate(accounts['everyone'])]
+        users.append((accounts['assistant'], protocols[0]))
+        procs = max(1, min(args.procs, len(users)))
+        for index in range(procs):
+            conf = dict(accounts)
+            conf.update({
+                'root': root, 'port': port,
+                'users': users[index::procs],
+                'rate': args.rate / procs, 'duration': args.duration, 'drain': args.drain,
+                'mix': mix, 'size': args.size, 'burst': args.burst, 'timeout': args.timeout,
+                'ready': os.path.join(root, 'ready-%d' % index),
+                'go': os.path.join(root, 'go'),
+                'result': os.path.join(root, 'result-%d.json' % index),
+            })
+            clients.append(spawn(mode='client', conf=conf, path=os.path.join(root, 'client-%d.json' % index),
+                                 log=os.path.join(root, 'client-%d.log' % index)))
+        # 3. wait for handshakes
+        deadline = time.time() + args.timeout + 10
+        online = 0
+        for index in range(procs):
+            path = os.path.join(root, 'ready-%d' % index)
+            while not os.path.exists(path) and time.time() < deadline:
+                time.sleep(0.1)
+            if os.path.exists(path):
+                time.sleep(0.1)  # written
+                with open(path, 'r') as file:
+                    online += int(file.read() or 0)
+        print('users online: %d/%d' % (online, len(users)))
+        # 4. go
+        stat = ProcessStat(pid=station.pid)
+        begin = time.time() + 1.0
+        with open(os.path.join(root, 'go.tmp'), 'w') as file:
+            file.write('%f' % begin)
+        os.replace(os.path.join(root, 'go.tmp'), os.path.join(root, 'go'))
+        time.sleep(max(0.0, begin - time.time()))
+        cpu_begin = stat.cpu
+        rss_peak = 0
+        while time.time() < begin + args.duration:
+            rss_peak = max(rss_peak, stat.rss)
+            time.sleep(0.2)
+        cpu_end = stat.cpu
+        rss = stat.rss
+        for proc in clients:
+            proc.wait(timeout=args.drain + 60)
+        metrics = scrape_metrics(port=metrics_port)
+        # 5. report
+        results = []
+        for index in range(procs):
+            path = os.path.join(root, 'result-%d.json' % index)
+            if os.path.exists(path):
+                with open(path, 'r') as file:
+                    results.append(json.load(file))
+        report(args=args, protocols=protocols, users=len(users), procs=procs, results=results)
+        print('station: cpu %.1f%% (%.2f seconds), rss %.1f MB (peak %.1f MB)'
+              % ((cpu_end - cpu_begin) * 100 / args.duration, cpu_end - cpu_begin, rss / 1048576, rss_peak / 1048576))
+        for line in metrics:
+            print('    %s' % line)
+        finished = True
+    finally:
+        for proc in clients:
+            if proc.poll() is None:
+                proc.kill()
+        if station is not None and station.poll() is None:
+            station.send_signal(signal.SIGINT)
+            try:
+                station.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                station.kill()
+        if args.keep or not finished:
+            # keep the logs for checking what's wrong
+            print('logs & data kept in %s' % root)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def report(args, protocols: List[str], users: int, procs: int, results: List[dict]):
+    sent = {kind: sum(item['sent'][kind] for item in results) for kind in KINDS}
+    acked = {kind: [value for item in results for value in item['acked'][kind]] for kind in KINDS}
+    delivered = {kind: [value for item in results for value in item['delivered'][kind]] for kind in KINDS}
+    handshakes = sorted(value for item in results for value in item['handshakes'])
+    lag = max([item['lag'] for item in results] or [0])
+    print('\n%d users (%s), %d client processes, %d msg/s for %d seconds, mix %s, %s station'
+          % (users, ','.join(protocols), procs, args.rate, args.duration, args.mix,
+             'async' if args.use_async else 'threading'))
+    print('handshake: p50 %.1f ms, p99 %.1f ms; max sending lag %.1f ms'
+          % (percentile(handshakes, 0.5) * 1000, percentile(handshakes, 0.99) * 1000, lag * 1000))
+    print('%-10s %8s | %8s %8s %8s %8s | %8s %8s %8s %8s'
+          % ('kind', 'sent', 'acked', 'p50 ms', 'p95 ms', 'p99 ms', 'recv', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for kind in KINDS:
+        print('%-10s %8d | %s | %s' % (kind, sent[kind], latency_columns(acked[kind]), latency_columns(delivered[kind])))
+    total_acked = sum(len(values) for values in acked.values())
+    total_delivered = sum(len(values) for values in delivered.values())
+    print('throughput: sent %.1f msg/s, acked %.1f msg/s, delivered %.1f msg/s'
+          % (sum(sent.values()) / args.duration, total_acked / args.duration, total_delivered / args.duration))
+    if lag > 0.1:
+        print('NOTICE: clients fell behind the rate, the latencies include their own delay, try more "--procs"')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] in ['station', 'client']:
+        with open(sys.argv[2], 'r') as f:
+            options = json.load(f)
+        if sys.argv[1] == 'station':
+            run_station(conf=options)
+        else:
+            run_clients(conf=options)
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description='Load test for the station on local host')
+    parser.add_argument('--users', type=int, default=30, help='simulated users')
+    parser.add_argument('--procs', type=int, default=2, help='client processes')
+    parser.add_argument('--protocols', default='mtp,mars,ws', help='protocols assigned to users in turn')
+    parser.add_argument('--rate', type=float, default=100, help='messages per second (all users)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds for sending')
+    parser.add_argument('--drain', type=float, default=3, help='seconds waiting for receipts after sending')
+    parser.add_argument('--mix', default='8:1:1', help='weights of personal:group:broadcast messages')
+    parser.add_argument('--size', type=int, default=64, help='text length of each message')
+    parser.add_argument('--burst', type=int, default=1,
+                        help='messages packed in one payload, like flushing the offline queue (--rate counts payloads)')
+    parser.add_argument('--group-size', type=int, default=10, help='members of the group')
+    parser.add_argument('--shards', type=int, default=4, help='dispatcher workers for personal messages')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='serve with the event loop')
+    parser.add_argument('--crypto-workers', type=int, default=0, help='crypto executor workers of the station')
+    parser.add_argument('--crypto-processes', action='store_true', help='run crypto workers in processes')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds waiting for handshakes')
+    parser.add_argument('--keep', action='store_true', help='keep the storage directory & logs')
+    main(args=parser.parse_args())
@@ -0,0 +1,206 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    WebSocket Benchmark
+    ~~~~~~~~~~~~~~~~~~~
+
+    Parsing masked frames (from browsers), byte-by-byte unmasking vs word XOR
+"""
+
+import sys
+import os
+import base64
+import json
+import struct
+import time
+import zlib
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.network.protocol import WebSocket, WebSocketParser, PerMessageDeflate
+from libs.network.protocol.ws import unmask, numpy
+
+
+def legacy_parse(stream: bytes) -> (bytes, bytes):
+    """ byte-by-byte parsing (before rewritten) """
+    stream_len = len(stream)
+    if stream_len < 2:
+        return None, stream
+    data = b''
+    pos = 0
+    while True:
+        if stream_len < pos + 2:
+            return None, stream
+        ch0 = stream[pos+0]
+        fin = ch0 >> 7
+        op = ch0 & 0x0F
+        ch1 = stream[pos+1]
+        mask = ch1 >> 7
+        msg_len = ch1 & 0x7F
+        if msg_len == 126:
+            if stream_len < pos + 4:
+                return None, stream
+            msg_len = (stream[pos+2] << 8) | stream[pos+3]
+            pos += 4
+        elif msg_len == 127:
+            if stream_len < pos + 10:
+                return None, stream
+            msg_len = int.from_bytes(stream[pos+2:pos+10], byteorder='big')
+            pos += 10
+        else:
+            pos += 2
+        if mask == 1:
+            if stream_len < pos + 4:
+                return None, stream
+            mask = stream[pos:pos+4]
+            pos += 4
+        else:
+            mask = None
+        if stream_len < pos + msg_len:
+            return None, stream
+        payload = stream[pos:pos+msg_len]
+        pos += msg_len
+        if mask is None:
+            content = payload
+        else:
+            content = bytearray()
+            for i, d in enumerate(payload):
+                content.append(d ^ mask[i % 4])
+        if op in [0, 1, 2]:
+            data += content
+        if fin == 1 or op == 0:
+            stream = stream[pos:]
+            break
+    return data, stream
+
+
+def masked_frame(payload: bytes, opcode: int = WebSocket.TEXT, fin: bool = True) -> bytes:
+    """ pack frame as a browser """
+    mask = os.urandom(4)
+    msg_len = len(payload)
+    ch0 = (0x80 if fin else 0) | opcode
+    if msg_len < 126:
+        head = struct.pack('!BB', ch0, 0x80 | msg_len)
+    elif msg_len <= 0xFFFF:
+        head = struct.pack('!BBH', ch0, 0x80 | 126, msg_len)
+    else:
+        head = struct.pack('!BBQ', ch0, 0x80 | 127, msg_len)
+    return head + mask + unmask(payload=payload, mask=mask)
+
+
+def check():
+    parser = WebSocketParser()
+    # fragmented message with a PING in the middle
+    stream = masked_frame(b'Hello ', fin=False) + masked_frame(b'PING?', opcode=WebSocket.PING) \
+        + masked_frame(b'World', opcode=WebSocket.CONTINUATION)
+    results = []
+    pos = 0
+    # feed byte by byte
+    for end in range(1, len(stream) + 1):
+        while True:
+            count, frame = parser.parse(stream=stream[pos:end])
+            if count == 0:
+                break
+            pos += count
+            if frame is not None:
+                results.append((frame.opcode, frame.payload))
+    assert results == [(WebSocket.PING, b'PING?'), (WebSocket.TEXT, b'Hello World')], results
+    payload, remaining = WebSocket.parse(stream=stream)
+    assert payload == b'Hello World', payload
+
+
+def bench(size: int, count: int):
+    payload = os.urandom(size)
+    frame = masked_frame(payload=payload)
+    total = size * count / 1024 / 1024
+    start = time.time()
+    for _ in range(count):
+        data, _ = legacy_parse(stream=frame)
+    t1 = time.time() - start
+    assert data == payload
+    parser = WebSocketParser()
+    start = time.time()
+    for _ in range(count):
+        _, msg = parser.parse(stream=frame)
+    t2 = time.time() - start
+    assert msg.payload == payload
+    print('%8d bytes x %5d: legacy %8.2f MB/s, parser %8.2f MB/s (%.0fx)'
+          % (size, count, total / t1, total / t2, t1 / t2))
+
+
+def reliable_message(size: int) -> bytes:
+    """ JSON message like a ReliableMessage """
+    msg = {
+        'sender': 'moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ',
+        'receiver': 'hulk@4YeVEN3aUnvC1DNUufCq1bs9zoBSJTzVEj',
+        'time': time.time(),
+        'data': base64.b64encode(os.urandom(size * 3 // 4)).decode('utf-8'),
+        'key': 'X' * 344,
+        'signature': 'Y' * 344,
+        'meta': {'version': 1, 'seed': 'moky', 'key': {'algorithm': 'RSA', 'data': '-----BEGIN PUBLIC KEY-----'}},
+    }
+    return json.dumps(msg).encode('utf-8')
+
+
+def check_deflate():
+    deflate = PerMessageDeflate.negotiate(offers=b'permessage-deflate; client_max_window_bits')
+    assert deflate is not None
+    # RFC 7692 (7.1.2.1): not responding 'server_max_window_bits' which was not offered
+    assert 'server_max_window_bits' not in deflate.response, deflate.response
+    offered = PerMessageDeflate.negotiate(offers=b'permessage-deflate; server_max_window_bits=10')
+    assert 'server_max_window_bits=10' in offered.response, offered.response
+    assert PerMessageDeflate.negotiate(offers=b'permessage-deflate; server_max_window_bits=8') is None
+    payload = reliable_message(size=1024)
+    parser = WebSocketParser()
+    _, frame = parser.parse(stream=WebSocket.pack(payload=deflate.compress(payload=payload), compressed=True))
+    assert frame.compressed
+    assert zlib.decompressobj(-15).decompress(frame.payload + PerMessageDeflate.TAIL) == payload
+    assert deflate.compress(payload=b'OK') is None  # below threshold
+
+
+def bench_deflate(count: int):
+    deflate = PerMessageDeflate.negotiate(offers=b'permessage-deflate')
+    messages = [reliable_message(size=256) for _ in range(count)]
+    raw = sum([len(msg) for msg in messages])
+    start = time.time()
+    packed = sum([len(deflate.compress(payload=msg) or msg) for msg in messages])
+    t = time.time() - start
+    print('deflate %d messages: %d -> %d bytes (%.1f%%), %.2f MB/s'
+          % (count, raw, packed, packed * 100.0 / raw, raw / t / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    check()
+    check_deflate()
+    print('numpy: %s' % ('enabled' if numpy is not None else 'disabled'))
+    bench(size=100, count=10000)
+    bench(size=4096, count=1000)
+    bench(size=65536, count=100)
+    bench(size=1024 * 1024, count=10)
+    bench_deflate(count=10000)
@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Migrate Messages
+    ~~~~~~~~~~~~~~~~
+
+    Import cached messages from '.dim/public/{ADDRESS}/messages/*.msg'
+    into the message store '.dim/messages.db'
+"""
+
+import json
+import os
+import sys
+import time
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.message_table import MessageTable
+from libs.common.database.message_store import MessageStore
+
+from etc.config import base_dir
+
+
+def load_rows(path: str, address: str, expires: float) -> list:
+    rows = []
+    with open(path, mode='r', encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    for line in lines:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        try:
+            msg = json.loads(line)
+        except ValueError as error:
+            print('message package error %s, %s' % (error, line))
+            continue
+        signature = msg.get('signature')
+        msg_time = msg.get('time')
+        if signature is None or msg_time is None:
+            print('message error: %s' % line)
+        elif msg_time < expires:
+            print('drop expired msg: %s -> %s' % (msg.get('sender'), msg.get('receiver')))
+        else:
+            rows.append((address, signature, msg_time, line))
+    return rows
+
+
+def migrate(root: str, remove: bool = False):
+    store = MessageStore(path=os.path.join(root, 'messages.db'))
+    expires = time.time() - MessageTable.MESSAGE_EXPIRES
+    directory = os.path.join(root, 'public')
+    total = 0
+    for address in sorted(os.listdir(directory)):
+        msg_dir = os.path.join(directory, address, 'messages')
+        if not os.path.isdir(msg_dir):
+            continue
+        for filename in sorted(os.listdir(msg_dir)):
+            if not filename.endswith('.msg'):
+                continue
+            path = os.path.join(msg_dir, filename)
+            rows = load_rows(path=path, address=address, expires=expires)
+            count = store.insert_many(rows=rows)
+            total += count
+            print('imported %d/%d message(s) from %s' % (count, len(rows), path))
+            if remove:
+                os.remove(path)
+    store.close()
+    print('total %d message(s) imported into %s' % (total, store.path))
+
+
+def usage():
+    print('')
+    print('Usage:')
+    print('    %s [--remove] [root]' % sys.argv[0])
+    print('')
+    print('    --remove    remove the .msg files after imported')
+    print('    root        data directory (default: "%s")' % base_dir)
+    print('')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if '-h' in args or '--help' in args:
+        usage()
+    else:
+        remove_files = '--remove' in args
+        args = [item for item in args if item != '--remove']
+        migrate(root=args[0] if len(args) > 0 else base_dir, remove=remove_files)
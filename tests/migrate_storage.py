@@ -0,0 +1,111 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Migrate Storage
+    ~~~~~~~~~~~~~~~
+
+    Import records from files '.dim/{SECTION}/{ADDRESS}/{NAME}'
+    into the database '.dim/storage.db', or export them back to files
+"""
+
+import os
+import sys
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.backend import FileBackend, SQLiteBackend
+
+from etc.config import base_dir
+
+
+# files not accessed via Storage
+IGNORED_NAMES = ['keystore.js']
+IGNORED_DIRS = ['messages']
+IGNORED_EXTENSIONS = ['.db', '.db-wal', '.db-shm', '.msg']
+
+
+def all_files(root: str) -> list:
+    paths = []
+    for directory, sub_dirs, files in os.walk(root):
+        sub_dirs[:] = [item for item in sub_dirs if item not in IGNORED_DIRS]
+        for filename in files:
+            if filename in IGNORED_NAMES:
+                continue
+            if os.path.splitext(filename)[1] in IGNORED_EXTENSIONS:
+                continue
+            paths.append(os.path.join(directory, filename))
+    return sorted(paths)
+
+
+def import_records(root: str):
+    files = FileBackend()
+    db = SQLiteBackend(root=root)
+    total = 0
+    for path in all_files(root=root):
+        try:
+            text = files.read_text(path=path)
+        except UnicodeDecodeError as error:
+            print('skip binary file %s: %s' % (path, error))
+            continue
+        if text is not None and db.write_text(text=text, path=path):
+            total += 1
+    db.close()
+    print('total %d record(s) imported into %s' % (total, db.path))
+
+
+def export_records(root: str):
+    files = FileBackend()
+    db = SQLiteBackend(root=root)
+    total = 0
+    for path, text in db.records():
+        if files.write_text(text=text, path=path):
+            total += 1
+    db.close()
+    print('total %d record(s) exported from %s' % (total, db.path))
+
+
+def usage():
+    print('')
+    print('Usage:')
+    print('    %s import|export [root]' % sys.argv[0])
+    print('')
+    print('    import      copy records from files into "{root}/storage.db"')
+    print('    export      copy records from "{root}/storage.db" into files')
+    print('    root        data directory (default: "%s")' % base_dir)
+    print('')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len(args) == 0 or args[0] not in ['import', 'export']:
+        usage()
+    elif args[0] == 'import':
+        import_records(root=args[1] if len(args) > 1 else base_dir)
+    else:
+        export_records(root=args[1] if len(args) > 1 else base_dir)